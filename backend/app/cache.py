@@ -0,0 +1,230 @@
+"""Response caching for the hottest read endpoints.
+
+Entries live in a per-process LRU with a TTL and, when CACHE_URL is set, in a
+shared backend (Redis) that every worker reads through. Invalidation is
+tag-based: each entry is stored under the current version of the tags it
+depends on (e.g. "feed:Books", "product:42"), and writers bump those
+versions, so stale entries are simply never looked up again and age out.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is only needed for a shared cache
+    redis = None
+
+# Cache settings
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+CACHE_URL = os.getenv("CACHE_URL")
+
+class LRUCache:
+    """Thread-safe LRU mapping whose entries expire `ttl` seconds after being set."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class LocalBackend:
+    """In-process stand-in for the shared backend, used in tests and single-worker setups."""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Optional[float], str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def mget(self, keys: List[str]) -> List[Optional[str]]:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            _, value = self._data.get(key, (None, "0"))
+            value = str(int(value) + 1)
+            self._data[key] = (None, value)
+            return int(value)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+class RedisBackend:
+    """Shared backend on Redis, so every worker sees the same entries and tag versions."""
+
+    def __init__(self, url: str, prefix: str = "ecofinds:cache:"):
+        if redis is None:
+            raise RuntimeError("CACHE_URL is set but the redis package is not installed")
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        return self._client.get(self._prefix + key)
+
+    def mget(self, keys: List[str]) -> List[Optional[str]]:
+        return self._client.mget([self._prefix + key for key in keys])
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._client.set(self._prefix + key, value, px=int(ttl * 1000) if ttl else None)
+
+    def incr(self, key: str) -> int:
+        return self._client.incr(self._prefix + key)
+
+    def flush(self) -> None:
+        for key in self._client.scan_iter(self._prefix + "*"):
+            self._client.delete(key)
+
+class ResponseCache:
+    """Two-tier cache of JSON-serialisable response bodies with tag invalidation."""
+
+    def __init__(self, maxsize: int, ttl: float, shared=None):
+        self.ttl = ttl
+        self.local = LRUCache(maxsize, ttl)
+        self.shared = shared
+        self._versions = LocalBackend() if shared is None else shared
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _count(self, namespace: str, outcome: str) -> None:
+        with self._stats_lock:
+            counters = self._stats.setdefault(namespace, {"hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0})
+            counters[outcome] += 1
+
+    def _key(self, namespace: str, parts: Iterable[Any], tags: List[str]) -> str:
+        versions = self._versions.mget([f"tag:{tag}" for tag in tags]) if tags else []
+        stamp = ",".join(version or "0" for version in versions)
+        return f"{namespace}:{json.dumps(list(parts), separators=(',', ':'))}@{stamp}"
+
+    def get(self, namespace: str, parts: Iterable[Any], tags: List[str]) -> Tuple[str, Optional[Any]]:
+        """Look up a cached body; returns the entry key and the body, or None on a miss.
+
+        The key embeds the tag versions seen *before* the caller reads the
+        database, so a body computed concurrently with a write is stored
+        under the superseded version and never served.
+        """
+        if not self.enabled:
+            return "", None
+        key = self._key(namespace, parts, tags)
+        value = self.local.get(key)
+        if value is not None:
+            self._count(namespace, "hits")
+            return key, value
+        if self.shared is not None:
+            raw = self.shared.get(key)
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value)
+                self._count(namespace, "shared_hits")
+                return key, value
+        self._count(namespace, "misses")
+        return key, None
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a body under a key returned by get()."""
+        if not self.enabled:
+            return
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, json.dumps(value), self.ttl)
+
+    def invalidate(self, *tags: str) -> None:
+        """Make every entry that depends on any of `tags` unreachable."""
+        for tag in set(tags):
+            self._versions.incr(f"tag:{tag}")
+            self._count(tag.split(":", 1)[0], "invalidations")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            namespaces = {name: dict(counters) for name, counters in self._stats.items()}
+        return {
+            "enabled": self.enabled,
+            "ttl": self.ttl,
+            "local_entries": len(self.local),
+            "local_maxsize": self.local.maxsize,
+            "shared_backend": type(self.shared).__name__ if self.shared is not None else None,
+            "namespaces": namespaces,
+        }
+
+    def clear(self) -> None:
+        """Drop every entry, tag version and counter (used by tests)."""
+        self.local.clear()
+        self._versions.flush()
+        if self.shared is not None and self.shared is not self._versions:
+            self.shared.flush()
+        with self._stats_lock:
+            self._stats.clear()
+
+def feed_tags(category: Optional[str], q: Optional[str]) -> List[str]:
+    """Tags a feed page depends on, given its normalized filters."""
+    if q:
+        return ["search"]
+    if category:
+        return [f"feed:{category}"]
+    return ["feed:*"]
+
+def product_tags(product_id: int, *categories: Optional[str]) -> List[str]:
+    """Tags to invalidate when a product's content or visibility changes."""
+    tags = [f"product:{product_id}", "feed:*", "search"]
+    tags.extend(f"feed:{category}" for category in categories if category)
+    return tags
+
+response_cache = ResponseCache(
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL,
+    shared=RedisBackend(CACHE_URL) if CACHE_URL else None,
+)
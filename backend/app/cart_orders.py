@@ -1,15 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from typing import List
-from .database import get_db
-from .models import Cart, CartItem, Product, Order, OrderItem, User, ProductImage
-from .auth import get_current_user
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, delete, desc, insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError
+from typing import Dict, List, Optional
+from .database import get_db, get_read_db
+from .models import Cart, CartItem, Product, Order, OrderItem, db_now
+from .auth import get_current_user_id
+from .cache import response_cache, product_tags
+from .pagination import decode_cursor, encode_cursor
+from pydantic import BaseModel, conint, conlist
 from datetime import datetime
+import os
 
 router = APIRouter()
 
+# How checkout treats products another checkout has locked: "skip_locked" skips
+# them and reports a conflict, "nowait" fails the lock at once; neither waits
+CHECKOUT_LOCK_MODE = os.getenv("CHECKOUT_LOCK_MODE", "skip_locked")
+
+# Upper bound on the products one POST /api/cart/batch may add or remove
+MAX_BATCH_ITEMS = 100
+
+# INSERT constructs with ON CONFLICT support, per dialect
+UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+ORDER_STATUSES = ["processing", "shipped", "delivered", "cancelled"]
+
+# Postgres SQLSTATEs that mean a competing transaction won: lock_not_available,
+# serialization_failure, deadlock_detected
+LOCK_CONFLICT_CODES = {"55P03", "40001", "40P01"}
+
 # Pydantic models
 class CartItemResponse(BaseModel):
     id: int
@@ -20,19 +44,24 @@ class CartItemResponse(BaseModel):
     product_price: float
     product_image_url: str
     total_price: float
+    available: bool = True
 
     class Config:
         from_attributes = True
 
 class CartResponse(BaseModel):
-    id: int
+    id: Optional[int] = None  # None until the first item is added
     items: List[CartItemResponse]
     total_items: int
     total_amount: float
 
 class AddToCartRequest(BaseModel):
     product_id: int
-    quantity: int = 1
+    quantity: conint(gt=0) = 1
+
+class CartBatchRequest(BaseModel):
+    add: conlist(AddToCartRequest, max_items=MAX_BATCH_ITEMS) = []
+    remove: conlist(int, max_items=MAX_BATCH_ITEMS) = []
 
 class OrderItemResponse(BaseModel):
     id: int
@@ -42,6 +71,7 @@ class OrderItemResponse(BaseModel):
     total_price: float
     product_name: str
     product_image_url: str
+    product_category: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -69,139 +99,180 @@ class CheckoutRequest(BaseModel):
     shipping_country: str
 
 @router.get("/api/cart", response_model=CartResponse)
-def get_cart(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_cart(
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get the current user's cart."""
-    
-    # Get or create cart
-    cart = db.query(Cart).filter(Cart.user_id == current_user.id).first()
-    
-    if not cart:
-        cart = Cart(user_id=current_user.id)
-        db.add(cart)
-        db.commit()
-        db.refresh(cart)
-    
-    # Get cart items with product details
-    cart_items = db.query(CartItem).filter(CartItem.cart_id == cart.id).all()
+    """Get the current user's cart.
+    
+    Read-only: items whose product is no longer active are returned with
+    available=False and left out of the totals; cart_sweeper removes them.
+    """
+    
+    # One round trip for the cart, its items and their products
+    rows = (await db.execute(
+        select(
+            Cart.id.label("cart_id"),
+            CartItem.id,
+            CartItem.product_id,
+            CartItem.quantity,
+            CartItem.added_at,
+            Product.name,
+            Product.price,
+            Product.status,
+            Product.primary_image_url.label("image_url"),
+        )
+        .select_from(Cart)
+        .outerjoin(CartItem, CartItem.cart_id == Cart.id)
+        .outerjoin(Product, Product.id == CartItem.product_id)
+        .where(Cart.user_id == current_user_id)
+        .order_by(CartItem.added_at, CartItem.id)
+    )).all()
     
     items = []
     total_amount = 0.0
     total_items = 0
     
-    for item in cart_items:
-        # Get product details
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        if not product or product.status != "active":
-            # Remove invalid items
-            db.delete(item)
+    for row in rows:
+        if row.id is None:
+            # The cart exists but has no items
             continue
         
-        # Get primary image
-        primary_image = db.query(ProductImage).filter(
-            and_(
-                ProductImage.product_id == product.id,
-                ProductImage.is_primary == True
-            )
-        ).first()
-        
-        image_url = primary_image.image_url if primary_image else ""
-        item_total = float(product.price) * item.quantity
+        available = row.status == "active"
+        price = float(row.price) if row.price is not None else 0.0
+        item_total = price * row.quantity
         
         items.append(CartItemResponse(
-            id=item.id,
-            product_id=item.product_id,
-            quantity=item.quantity,
-            added_at=item.added_at,
-            product_name=product.name,
-            product_price=float(product.price),
-            product_image_url=image_url,
-            total_price=item_total
+            id=row.id,
+            product_id=row.product_id,
+            quantity=row.quantity,
+            added_at=row.added_at,
+            product_name=row.name if row.name is not None else "Product no longer available",
+            product_price=price,
+            product_image_url=row.image_url or "",
+            total_price=item_total,
+            available=available
         ))
         
-        total_amount += item_total
-        total_items += item.quantity
-    
-    db.commit()
+        if available:
+            total_amount += item_total
+            total_items += row.quantity
     
     return CartResponse(
-        id=cart.id,
+        id=rows[0].cart_id if rows else None,
         items=items,
         total_items=total_items,
         total_amount=total_amount
     )
 
-@router.post("/api/cart")
-def add_to_cart(
-    request: AddToCartRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Add a product to the cart."""
-    
-    # Check if product exists and is active
-    product = db.query(Product).filter(
-        and_(Product.id == request.product_id, Product.status == "active")
-    ).first()
-    
-    if not product:
+def _upsert(db: AsyncSession, model):
+    """INSERT for `model` that supports ON CONFLICT on the session's dialect."""
+    return UPSERT_INSERTS[db.get_bind().dialect.name](model)
+
+async def _ensure_cart(db: AsyncSession, user_id: int) -> int:
+    """Id of the user's cart, creating it if needed, in one race-free statement."""
+    statement = _upsert(db, Cart).values(user_id=user_id)
+    # DO UPDATE rather than DO NOTHING so RETURNING yields the existing row too
+    statement = statement.on_conflict_do_update(
+        index_elements=[Cart.user_id],
+        set_={"updated_at": db_now()}
+    ).returning(Cart.id)
+    return (await db.execute(statement)).scalar_one()
+
+async def _add_items(db: AsyncSession, cart_id: int, quantities: Dict[int, int]) -> None:
+    """Add quantities to the cart, inserting new items and incrementing existing ones."""
+    statement = _upsert(db, CartItem).values([
+        {"cart_id": cart_id, "product_id": product_id, "quantity": quantity}
+        for product_id, quantity in quantities.items()
+    ])
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[CartItem.cart_id, CartItem.product_id],
+        set_={"quantity": CartItem.quantity + statement.excluded.quantity}
+    ))
+
+async def _check_purchasable(db: AsyncSession, product_ids: List[int], user_id: int) -> None:
+    """Raise unless every product exists, is active and isn't the user's own listing."""
+    products = {
+        row.id: row
+        for row in (await db.execute(
+            select(Product.id, Product.seller_id)
+            .where(and_(Product.id.in_(product_ids), Product.status == "active"))
+        )).all()
+    }
+    missing = [product_id for product_id in product_ids if product_id not in products]
+    if missing:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Product not found or not available"
+            detail="Product not found or not available" if len(product_ids) == 1
+            else f"Products not found or not available: {', '.join(map(str, missing))}"
         )
-    
-    # Check if user is trying to buy their own product
-    if product.seller_id == current_user.id:
+    if any(product.seller_id == user_id for product in products.values()):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cannot add your own product to cart"
         )
+
+@router.post("/api/cart")
+async def add_to_cart(
+    request: AddToCartRequest,
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Add a product to the cart.
     
-    # Get or create cart
-    cart = db.query(Cart).filter(Cart.user_id == current_user.id).first()
-    
-    if not cart:
-        cart = Cart(user_id=current_user.id)
-        db.add(cart)
-        db.commit()
-        db.refresh(cart)
-    
-    # Check if item already exists in cart
-    existing_item = db.query(CartItem).filter(
-        and_(
-            CartItem.cart_id == cart.id,
-            CartItem.product_id == request.product_id
-        )
-    ).first()
+    Three statements in one transaction: the product check, a cart upsert
+    and an item upsert, so concurrent adds neither fail nor duplicate rows.
+    """
+    await _check_purchasable(db, [request.product_id], current_user_id)
+    cart_id = await _ensure_cart(db, current_user_id)
+    await _add_items(db, cart_id, {request.product_id: request.quantity})
+    await db.commit()
     
-    if existing_item:
-        # Update quantity
-        existing_item.quantity += request.quantity
-    else:
-        # Create new cart item
-        cart_item = CartItem(
-            cart_id=cart.id,
-            product_id=request.product_id,
-            quantity=request.quantity
+    return {"message": "Product added to cart successfully"}
+
+@router.post("/api/cart/batch")
+async def update_cart_batch(
+    request: CartBatchRequest,
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Add and remove many products in one transaction; nothing changes if any add is invalid."""
+    quantities: Dict[int, int] = {}
+    for item in request.add:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    
+    if quantities:
+        await _check_purchasable(db, list(quantities), current_user_id)
+    cart_id = await _ensure_cart(db, current_user_id)
+    
+    removed = 0
+    if request.remove:
+        result = await db.execute(
+            delete(CartItem).where(and_(CartItem.cart_id == cart_id, CartItem.product_id.in_(request.remove))),
+            execution_options={"synchronize_session": False}
         )
-        db.add(cart_item)
+        removed = result.rowcount
+    if quantities:
+        await _add_items(db, cart_id, quantities)
     
-    db.commit()
+    await db.commit()
     
-    return {"message": "Product added to cart successfully"}
+    return {
+        "message": "Cart updated successfully",
+        "added": len(quantities),
+        "removed": removed
+    }
 
 @router.delete("/api/cart/{product_id}")
-def remove_from_cart(
+async def remove_from_cart(
     product_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
 ):
     """Remove a product from the cart."""
     
     # Get cart
-    cart = db.query(Cart).filter(Cart.user_id == current_user.id).first()
+    cart = (await db.execute(select(Cart).where(Cart.user_id == current_user_id))).scalars().first()
     
     if not cart:
         raise HTTPException(
@@ -210,12 +281,12 @@ def remove_from_cart(
         )
     
     # Find cart item
-    cart_item = db.query(CartItem).filter(
+    cart_item = (await db.execute(select(CartItem).where(
         and_(
             CartItem.cart_id == cart.id,
             CartItem.product_id == product_id
         )
-    ).first()
+    ))).scalars().first()
     
     if not cart_item:
         raise HTTPException(
@@ -223,173 +294,257 @@ def remove_from_cart(
             detail="Product not found in cart"
         )
     
-    db.delete(cart_item)
-    db.commit()
+    await db.delete(cart_item)
+    await db.commit()
     
     return {"message": "Product removed from cart successfully"}
 
+def _lock_conflict(error: DBAPIError) -> bool:
+    """Whether a database error means another transaction holds the rows we need."""
+    code = getattr(error.orig, "pgcode", None)
+    if code is not None:
+        return code in LOCK_CONFLICT_CODES
+    # SQLite reports a competing writer as a busy database
+    return "database is locked" in str(error.orig)
+
+def _checkout_conflict() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Some items in your cart are being purchased by someone else; please try again"
+    )
+
 @router.post("/api/orders", response_model=OrderResponse)
-def create_order(
+async def create_order(
     request: CheckoutRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Create an order from the current cart."""
-    
-    # Get cart
-    cart = db.query(Cart).filter(Cart.user_id == current_user.id).first()
-    
-    if not cart:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Cart not found"
-        )
-    
-    # Get cart items
-    cart_items = db.query(CartItem).filter(CartItem.cart_id == cart.id).all()
-    
-    if not cart_items:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Cart is empty"
-        )
-    
-    # Calculate total amount
-    total_amount = 0.0
-    order_items_data = []
-    
-    for item in cart_items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
+    """Create an order from the current cart.
+    
+    Runs as one transaction with a fixed number of statements: the cart's
+    products are locked, every product is flipped to sold by a single
+    conditional UPDATE, the order items are inserted in bulk and the cart
+    is cleared before the only commit. A product can never be sold twice:
+    the UPDATE only matches active products, and a checkout that doesn't
+    get all of its products is rolled back.
+    """
+    try:
+        # Cart contents with what the order needs from each product
+        cart_rows = (await db.execute(
+            select(
+                CartItem.id,
+                CartItem.product_id,
+                CartItem.quantity,
+                Product.name,
+                Product.primary_image_url.label("image_url"),
+            )
+            .join(Cart, Cart.id == CartItem.cart_id)
+            .join(Product, Product.id == CartItem.product_id)
+            .where(Cart.user_id == current_user_id)
+            .order_by(CartItem.product_id)
+        )).all()
         
-        if not product or product.status != "active":
+        if not cart_rows:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Product {item.product_id} is no longer available"
+                detail="Cart is empty"
             )
         
-        item_total = float(product.price) * item.quantity
-        total_amount += item_total
+        product_ids = [row.product_id for row in cart_rows]
         
-        order_items_data.append({
-            "product_id": product.id,
-            "quantity": item.quantity,
-            "price_per_unit": float(product.price)
-        })
-    
-    # Create order
-    order = Order(
-        user_id=current_user.id,
-        status="processing",
-        total_amount=total_amount,
-        shipping_address=request.shipping_address,
-        shipping_city=request.shipping_city,
-        shipping_state=request.shipping_state,
-        shipping_zip=request.shipping_zip,
-        shipping_country=request.shipping_country
-    )
-    
-    db.add(order)
-    db.commit()
-    db.refresh(order)
-    
-    # Create order items
-    for item_data in order_items_data:
-        order_item = OrderItem(
-            order_id=order.id,
-            product_id=item_data["product_id"],
-            quantity=item_data["quantity"],
-            price_per_unit=item_data["price_per_unit"]
-        )
-        db.add(order_item)
+        # Lock the products in id order so concurrent checkouts can't deadlock;
+        # a product locked by another checkout is skipped (or fails) instead of waited on
+        lock = {"skip_locked": True} if CHECKOUT_LOCK_MODE == "skip_locked" else {"nowait": True}
+        locked = {
+            row.id: row
+            for row in (await db.execute(
+                select(Product.id, Product.price, Product.status, Product.category)
+                .where(Product.id.in_(product_ids))
+                .order_by(Product.id)
+                .with_for_update(**lock)
+            )).all()
+        }
         
-        # Mark product as sold
-        product = db.query(Product).filter(Product.id == item_data["product_id"]).first()
-        product.status = "sold"
-    
-    # Clear cart
-    db.query(CartItem).filter(CartItem.cart_id == cart.id).delete()
-    
-    db.commit()
-    
-    # Get order items with product details for response
-    order_items = db.query(OrderItem).filter(OrderItem.order_id == order.id).all()
-    
-    items = []
-    for item in order_items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
+        for product_id in product_ids:
+            product = locked.get(product_id)
+            if product is None:
+                raise _checkout_conflict()
+            if product.status != "active":
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Product {product_id} is no longer available"
+                )
         
-        # Get primary image
-        primary_image = db.query(ProductImage).filter(
-            and_(
-                ProductImage.product_id == product.id,
-                ProductImage.is_primary == True
+        # Mark every product as sold; only rows still active match
+        sold = await db.execute(
+            update(Product)
+            .where(and_(Product.id.in_(product_ids), Product.status == "active"))
+            .values(status="sold"),
+            execution_options={"synchronize_session": False}
+        )
+        if sold.rowcount != len(product_ids):
+            raise _checkout_conflict()
+        
+        total_amount = sum(float(locked[row.product_id].price) * row.quantity for row in cart_rows)
+        order = (await db.execute(
+            insert(Order)
+            .values(
+                user_id=current_user_id,
+                status="processing",
+                total_amount=total_amount,
+                shipping_address=request.shipping_address,
+                shipping_city=request.shipping_city,
+                shipping_state=request.shipping_state,
+                shipping_zip=request.shipping_zip,
+                shipping_country=request.shipping_country
             )
-        ).first()
+            .returning(Order.id, Order.status, Order.total_amount, Order.created_at)
+        )).one()
+        
+        # Bulk insert the order items; each product appears once, so ids map back by product
+        item_ids = {
+            row.product_id: row.id
+            for row in (await db.execute(
+                insert(OrderItem).returning(OrderItem.id, OrderItem.product_id),
+                [
+                    {
+                        "order_id": order.id,
+                        "product_id": row.product_id,
+                        "quantity": row.quantity,
+                        "price_per_unit": locked[row.product_id].price,
+                        "product_name": row.name,
+                        "product_image_url": row.image_url,
+                        "product_category": locked[row.product_id].category,
+                    }
+                    for row in cart_rows
+                ]
+            )).all()
+        }
         
-        image_url = primary_image.image_url if primary_image else ""
+        # Clear exactly the items that were ordered
+        await db.execute(
+            delete(CartItem).where(CartItem.id.in_([row.id for row in cart_rows])),
+            execution_options={"synchronize_session": False}
+        )
         
+        await db.commit()
+    except HTTPException:
+        await db.rollback()
+        raise
+    except DBAPIError as error:
+        await db.rollback()
+        if _lock_conflict(error):
+            raise _checkout_conflict()
+        raise
+    
+    sold_tags = []
+    for product_id in product_ids:
+        sold_tags.extend(product_tags(product_id, locked[product_id].category))
+    response_cache.invalidate(*sold_tags)
+    
+    items = []
+    for row in cart_rows:
+        price = float(locked[row.product_id].price)
         items.append(OrderItemResponse(
-            id=item.id,
-            product_id=item.product_id,
-            quantity=item.quantity,
-            price_per_unit=float(item.price_per_unit),
-            total_price=float(item.price_per_unit) * item.quantity,
-            product_name=product.name if product else "Product no longer available",
-            product_image_url=image_url
+            id=item_ids[row.product_id],
+            product_id=row.product_id,
+            quantity=row.quantity,
+            price_per_unit=price,
+            total_price=price * row.quantity,
+            product_name=row.name,
+            product_image_url=row.image_url or "",
+            product_category=locked[row.product_id].category
         ))
     
     return OrderResponse(
         id=order.id,
         status=order.status,
         total_amount=float(order.total_amount),
-        shipping_address=order.shipping_address,
-        shipping_city=order.shipping_city,
-        shipping_state=order.shipping_state,
-        shipping_zip=order.shipping_zip,
-        shipping_country=order.shipping_country,
+        shipping_address=request.shipping_address,
+        shipping_city=request.shipping_city,
+        shipping_state=request.shipping_state,
+        shipping_zip=request.shipping_zip,
+        shipping_country=request.shipping_country,
         created_at=order.created_at,
         items=items
     )
 
 @router.get("/api/orders", response_model=List[OrderResponse])
-def get_orders(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_orders(
+    response: Response,
+    status_filter: Optional[str] = Query(None, alias="status", description="Only orders with this status"),
+    cursor: Optional[str] = Query(None, description="Pagination cursor from X-Next-Cursor"),
+    limit: int = Query(20, ge=1, le=100, description="Number of orders to return"),
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get the current user's order history."""
+    """Get a page of the current user's order history, newest first.
+    
+    Returns at most `limit` orders (20 unless asked for more, up to 100);
+    clients that want the whole history must follow the cursor. When more
+    orders exist, the X-Next-Cursor response header holds the cursor for
+    the next page (exposed to browsers through CORS). A page costs two queries however many orders
+    and items it holds: one for the orders, one for all of their items.
+    Items carry the name, image and category snapshotted at checkout, so
+    products and their images are never read.
+    """
+    
+    if status_filter is not None and status_filter not in ORDER_STATUSES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid status. Must be one of: {', '.join(ORDER_STATUSES)}"
+        )
+    
+    # Served by idx_orders_user_created (user_id, created_at DESC, id DESC)
+    query = select(Order).where(Order.user_id == current_user_id)
+    if status_filter is not None:
+        query = query.where(Order.status == status_filter)
     
-    orders = db.query(Order).filter(Order.user_id == current_user.id).order_by(Order.created_at.desc()).all()
+    if cursor:
+        try:
+            position = decode_cursor(cursor)
+            query = query.where(
+                tuple_(Order.created_at, Order.id) < tuple_(datetime.fromisoformat(position["t"]), int(position["id"]))
+            )
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor format"
+            )
     
-    order_responses = []
-    for order in orders:
-        # Get order items with product details
-        order_items = db.query(OrderItem).filter(OrderItem.order_id == order.id).all()
+    orders = (await db.execute(
+        query.order_by(desc(Order.created_at), desc(Order.id)).limit(limit + 1)
+    )).scalars().all()
+    
+    if len(orders) > limit:
+        orders = orders[:limit]
+        last = orders[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor({"t": last.created_at.isoformat(), "id": last.id})
+    
+    # Every item on the page in one query
+    items_by_order: Dict[int, List[OrderItemResponse]] = {order.id: [] for order in orders}
+    if orders:
+        items = (await db.execute(
+            select(OrderItem)
+            .where(OrderItem.order_id.in_(list(items_by_order)))
+            .order_by(OrderItem.order_id, OrderItem.id)
+        )).scalars().all()
         
-        items = []
-        for item in order_items:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
-            
-            # Get primary image
-            primary_image = db.query(ProductImage).filter(
-                and_(
-                    ProductImage.product_id == product.id,
-                    ProductImage.is_primary == True
-                )
-            ).first()
-            
-            image_url = primary_image.image_url if primary_image else ""
-            
-            items.append(OrderItemResponse(
+        for item in items:
+            items_by_order[item.order_id].append(OrderItemResponse(
                 id=item.id,
                 product_id=item.product_id,
                 quantity=item.quantity,
                 price_per_unit=float(item.price_per_unit),
                 total_price=float(item.price_per_unit) * item.quantity,
-                product_name=product.name if product else "Product no longer available",
-                product_image_url=image_url
+                # Unset only on items an older build inserted before migration 0011 filled them in
+                product_name=item.product_name or "",
+                product_image_url=item.product_image_url or "",
+                product_category=item.product_category
             ))
-        
-        order_responses.append(OrderResponse(
+    
+    return [
+        OrderResponse(
             id=order.id,
             status=order.status,
             total_amount=float(order.total_amount),
@@ -399,7 +554,7 @@ def get_orders(
             shipping_zip=order.shipping_zip,
             shipping_country=order.shipping_country,
             created_at=order.created_at,
-            items=items
-        ))
-    
-    return order_responses
+            items=items_by_order[order.id]
+        )
+        for order in orders
+    ]
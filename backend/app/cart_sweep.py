@@ -0,0 +1,84 @@
+"""Background removal of cart items whose product is no longer for sale.
+
+GET /api/cart only flags such items, so reads never write. Each worker
+runs this sweep every CART_SWEEP_INTERVAL seconds, deleting in batches of
+CART_SWEEP_BATCH_SIZE with a commit per batch so no single transaction
+holds locks on many rows.
+"""
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal
+from .models import CartItem, Product
+
+logger = logging.getLogger(__name__)
+
+CART_SWEEP_INTERVAL = float(os.getenv("CART_SWEEP_INTERVAL", "300"))
+CART_SWEEP_BATCH_SIZE = int(os.getenv("CART_SWEEP_BATCH_SIZE", "1000"))
+
+class CartSweeper:
+    """Periodically deletes cart items that point at inactive products."""
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def sweep(self, db: Optional[AsyncSession] = None) -> int:
+        """Delete every unavailable cart item; returns how many were removed."""
+        session = db or AsyncSessionLocal()
+        removed = 0
+        try:
+            while True:
+                batch = (
+                    select(CartItem.id)
+                    .join(Product, Product.id == CartItem.product_id)
+                    .where(Product.status != "active")
+                    .limit(self.batch_size)
+                )
+                result = await session.execute(
+                    delete(CartItem).where(CartItem.id.in_(batch)),
+                    execution_options={"synchronize_session": False}
+                )
+                await session.commit()
+                removed += result.rowcount
+                if result.rowcount < self.batch_size:
+                    return removed
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            if db is None:
+                await session.close()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                removed = await self.sweep()
+                if removed:
+                    logger.info("Removed %d unavailable cart items", removed)
+            except Exception:
+                logger.exception("Failed to sweep unavailable cart items")
+
+    def start(self) -> None:
+        """Start the periodic sweep task on the running event loop."""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the periodic sweep task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+cart_sweeper = CartSweeper(CART_SWEEP_INTERVAL, CART_SWEEP_BATCH_SIZE)
@@ -0,0 +1,357 @@
+"""Idempotency-Key support for retried writes.
+
+Clients may send an `Idempotency-Key` header on POST /api/orders,
+POST /api/cart and POST /api/cart/batch. The first request with a key claims it and runs; its
+response is stored for IDEMPOTENCY_TTL seconds and replayed verbatim (with
+`Idempotent-Replayed: true`) to any repeat from the same user, so a retried
+checkout never creates a second order. A repeat that arrives while the
+first is still running waits up to IDEMPOTENCY_WAIT seconds for its result
+instead of running again. Reusing a key with a different body is a 422.
+
+A claim only holds its key for IDEMPOTENCY_LEASE seconds until the response
+is stored; then it is kept for IDEMPOTENCY_TTL. If the worker dies mid-request
+(killed for memory, or by the server's timeout) nothing releases the key, so
+once the lease runs out the next retry takes it over and runs. The lease must
+outlast the slowest request, or a retry could run alongside it.
+
+Server errors, crashes and transient refusals (409 Conflict, 429 Too Many
+Requests: a checkout that lost a race for a product's lock, a rate limit)
+release the key instead of storing the response, so a retry with the same
+key runs again rather than replaying the refusal for IDEMPOTENCY_TTL. Keys are
+kept in the database by default, which every worker shares; the in-memory
+store only coalesces requests within one process.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+
+from .auth import _decode_user_id
+from .database import AsyncSessionLocal
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+# Idempotency settings
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "10"))
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "database")
+# How long an unfinished request holds its key: a few waits plus the worker timeout
+IDEMPOTENCY_LEASE = float(os.getenv("IDEMPOTENCY_LEASE", str(3 * IDEMPOTENCY_WAIT + 30)))
+
+# Statuses that say "try again" rather than give a final answer
+TRANSIENT_STATUSES = frozenset({409, 429})
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+
+@dataclass
+class StoredResponse:
+    """A claimed key: the request fingerprint and, once finished, its response."""
+    fingerprint: str
+    status_code: Optional[int] = None
+    content_type: Optional[str] = None
+    body: bytes = b""
+
+    @property
+    def completed(self) -> bool:
+        return self.status_code is not None
+
+class MemoryIdempotencyStore:
+    """Per-process key store; concurrent duplicates wait on an asyncio.Event."""
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, lease: float = IDEMPOTENCY_LEASE):
+        self.ttl = ttl
+        self.lease = lease
+        self._entries: Dict[str, Tuple[float, StoredResponse]] = {}
+        self._done: Dict[str, asyncio.Event] = {}
+
+    def _get(self, key: str) -> Optional[StoredResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, record = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        return record
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._entries.items() if expires_at < now]:
+            del self._entries[key]
+
+    async def claim(self, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """Claim `key` for a new request; returns None if claimed, else the existing record."""
+        if len(self._entries) > 1000:
+            self._purge()
+        existing = self._get(key)
+        if existing is not None:
+            return existing
+        self._entries[key] = (time.monotonic() + self.lease, StoredResponse(fingerprint))
+        self._done[key] = asyncio.Event()
+        return None
+
+    async def complete(self, key: str, response: StoredResponse) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, response)
+        done = self._done.pop(key, None)
+        if done is not None:
+            done.set()
+
+    async def release(self, key: str) -> None:
+        self._entries.pop(key, None)
+        done = self._done.pop(key, None)
+        if done is not None:
+            done.set()
+
+    async def wait(self, key: str, timeout: float) -> Optional[StoredResponse]:
+        """Wait for a running request to finish; returns its record, or None if it was released."""
+        done = self._done.get(key)
+        if done is not None:
+            try:
+                await asyncio.wait_for(done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._get(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._done.clear()
+
+class DatabaseIdempotencyStore:
+    """Key store on the idempotency_keys table, shared by every worker.
+
+    Each call uses its own short transaction, so a claim is visible to other
+    workers as soon as it is made. Duplicates poll for the outcome.
+    """
+
+    def __init__(self, session_factory: Callable, ttl: float = IDEMPOTENCY_TTL, lease: float = IDEMPOTENCY_LEASE,
+                 poll_interval: float = 0.05, purge_interval: float = 60):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+
+    @staticmethod
+    def _record(row: IdempotencyKey) -> StoredResponse:
+        return StoredResponse(
+            fingerprint=row.fingerprint,
+            status_code=row.status_code,
+            content_type=row.content_type,
+            body=(row.response_body or "").encode(),
+        )
+
+    async def _get(self, db, key: str) -> Optional[StoredResponse]:
+        row = (await db.execute(
+            select(IdempotencyKey).where(
+                and_(IdempotencyKey.key == key, IdempotencyKey.expires_at >= datetime.now(timezone.utc))
+            )
+        )).scalars().first()
+        return self._record(row) if row is not None else None
+
+    async def claim(self, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """Claim `key` for a new request; returns None if claimed, else the existing record.
+        
+        An expired row, whether a stored response past its TTL or a claim
+        whose lease ran out, is deleted first and so taken over.
+        """
+        now = datetime.now(timezone.utc)
+        async with self.session_factory() as db:
+            if time.monotonic() - self._last_purge > self.purge_interval:
+                self._last_purge = time.monotonic()
+                await db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < now))
+            else:
+                await db.execute(
+                    delete(IdempotencyKey).where(and_(IdempotencyKey.key == key, IdempotencyKey.expires_at < now))
+                )
+            try:
+                await db.execute(insert(IdempotencyKey).values(
+                    key=key,
+                    fingerprint=fingerprint,
+                    expires_at=now + timedelta(seconds=self.lease)
+                ))
+                await db.commit()
+                return None
+            except IntegrityError:
+                await db.rollback()
+            existing = await self._get(db, key)
+        # The holder released the key between our insert and read; let the caller retry
+        return existing or StoredResponse(fingerprint)
+
+    async def complete(self, key: str, response: StoredResponse) -> None:
+        async with self.session_factory() as db:
+            await db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key)
+                .values(
+                    status_code=response.status_code,
+                    content_type=response.content_type,
+                    response_body=response.body.decode(),
+                    expires_at=datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+                )
+            )
+            await db.commit()
+
+    async def release(self, key: str) -> None:
+        async with self.session_factory() as db:
+            await db.execute(
+                delete(IdempotencyKey).where(and_(IdempotencyKey.key == key, IdempotencyKey.status_code.is_(None)))
+            )
+            await db.commit()
+
+    async def wait(self, key: str, timeout: float) -> Optional[StoredResponse]:
+        """Poll until a running request finishes; returns its record, or None if it was released."""
+        deadline = time.monotonic() + timeout
+        while True:
+            async with self.session_factory() as db:
+                record = await self._get(db, key)
+            if record is None or record.completed or time.monotonic() >= deadline:
+                return record
+            await asyncio.sleep(self.poll_interval)
+
+def _fingerprint(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+def _scoped_key(user_id: int, method: str, path: str, key: str) -> str:
+    return hashlib.sha256(f"{user_id}\n{method} {path}\n{key}".encode()).hexdigest()
+
+def _error(status_code: int, detail: str) -> Response:
+    return JSONResponse({"detail": detail}, status_code=status_code)
+
+class IdempotencyMiddleware:
+    """Replays stored responses for repeated (user, route, Idempotency-Key) requests.
+
+    Only the listed (method, path) routes take part; requests without the
+    header, or without a valid bearer token, pass through untouched. Without
+    an explicit store the module's `idempotency_store` is used, looked up
+    per request so it can be swapped out.
+    """
+
+    def __init__(self, app, routes: Iterable[Tuple[str, str]], store=None, wait: float = IDEMPOTENCY_WAIT):
+        self.app = app
+        self.routes = set(routes)
+        self._store = store
+        self.wait = wait
+
+    @property
+    def store(self):
+        return self._store if self._store is not None else idempotency_store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        client_key = headers.get(IDEMPOTENCY_HEADER)
+        authorization = headers.get("authorization", "")
+        if client_key is None or not authorization.lower().startswith("bearer "):
+            await self.app(scope, receive, send)
+            return
+        if not client_key or len(client_key) > MAX_KEY_LENGTH:
+            await _error(400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")(scope, receive, send)
+            return
+        try:
+            user_id = _decode_user_id(authorization[7:])
+        except HTTPException:
+            # Let the route reject the token as usual
+            await self.app(scope, receive, send)
+            return
+
+        # Buffer the body to fingerprint it, then hand it to the app unchanged
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        fingerprint = _fingerprint(body)
+        key = _scoped_key(user_id, scope["method"], scope["path"], client_key)
+
+        record = await self.store.claim(key, fingerprint)
+        while record is not None:
+            if record.fingerprint != fingerprint:
+                await _error(422, "Idempotency-Key was already used with a different request body")(scope, receive, send)
+                return
+            if record.completed:
+                await self._replay(record, scope, receive, send)
+                return
+            # A duplicate of a request that is still running: wait for its outcome
+            record = await self.store.wait(key, self.wait)
+            if record is None:
+                record = await self.store.claim(key, fingerprint)
+            elif not record.completed:
+                await _error(409, "A request with this Idempotency-Key is still being processed")(scope, receive, send)
+                return
+
+        await self._run(key, fingerprint, body, scope, send)
+
+    async def _run(self, key: str, fingerprint: str, body: bytes, scope, send) -> None:
+        sent_body = False
+        response = StoredResponse(fingerprint)
+        response_chunks = []
+
+        async def replay_body():
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return {"type": "http.disconnect"}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response.status_code = message["status"]
+                response.content_type = Headers(raw=message.get("headers", [])).get("content-type")
+            elif message["type"] == "http.response.body":
+                response_chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_body, capture)
+        except BaseException:
+            await self.store.release(key)
+            raise
+
+        if (response.status_code is None or response.status_code >= 500
+                or response.status_code in TRANSIENT_STATUSES):
+            # Server-side failures and transient refusals are not final; let the client retry
+            await self.store.release(key)
+            return
+        response.body = b"".join(response_chunks)
+        try:
+            await self.store.complete(key, response)
+        except Exception:
+            logger.exception("Failed to store idempotent response")
+            await self.store.release(key)
+
+    async def _replay(self, record: StoredResponse, scope, receive, send) -> None:
+        replay = Response(
+            content=record.body,
+            status_code=record.status_code,
+            media_type=record.content_type,
+            headers={"Idempotent-Replayed": "true"},
+        )
+        await replay(scope, receive, send)
+
+def make_store(name: str = IDEMPOTENCY_STORE):
+    """The key store selected by IDEMPOTENCY_STORE ("database" or "memory")."""
+    if name == "memory":
+        return MemoryIdempotencyStore()
+    if name == "database":
+        return DatabaseIdempotencyStore(AsyncSessionLocal)
+    raise ValueError(f"Unknown IDEMPOTENCY_STORE {name!r}")
+
+idempotency_store = make_store()
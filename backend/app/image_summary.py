@@ -0,0 +1,167 @@
+"""Consistency check for the image summary stored on products.
+
+products.primary_image_url and products.image_count copy what
+product_images holds so listings and carts never read that table. Product
+writes keep them in step; this job catches anything that slipped past
+(manual SQL, an interrupted import) by recomputing them every
+IMAGE_SUMMARY_CHECK_INTERVAL seconds. It walks products in id order,
+IMAGE_SUMMARY_CHECK_BATCH_SIZE at a time with a commit per batch, and only
+rewrites rows that disagree.
+
+Every worker starts the task, but only one runs the check. On Postgres the
+workers compete for a session-level advisory lock (IMAGE_SUMMARY_LOCK_KEY)
+and the winner keeps it, on a connection of its own, until it stops; the
+others try again each interval, so another takes over if it dies. Other
+databases have no such lock and every worker checks.
+"""
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import and_, func, or_, select, text, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from .database import AsyncSessionLocal, async_engine
+from .models import Product, ProductImage
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUMMARY_CHECK_INTERVAL = float(os.getenv("IMAGE_SUMMARY_CHECK_INTERVAL", "3600"))
+IMAGE_SUMMARY_CHECK_BATCH_SIZE = int(os.getenv("IMAGE_SUMMARY_CHECK_BATCH_SIZE", "1000"))
+
+# Advisory lock held by the one worker that runs the check
+IMAGE_SUMMARY_LOCK_KEY = 7242001
+
+def actual_image_count():
+    """Correlated subquery counting the images of the Product in the enclosing query."""
+    return (
+        select(func.count(ProductImage.id))
+        .where(ProductImage.product_id == Product.id)
+        .scalar_subquery()
+    )
+
+def actual_primary_image_url():
+    """Correlated subquery for the primary image of the Product in the enclosing query."""
+    return (
+        select(ProductImage.image_url)
+        .where(and_(ProductImage.product_id == Product.id, ProductImage.is_primary == True))
+        .order_by(ProductImage.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+class ImageSummaryChecker:
+    """Periodically repairs products whose image summary disagrees with product_images."""
+
+    def __init__(self, interval: float, batch_size: int, engine: AsyncEngine = async_engine):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.engine = engine
+        self._task: Optional[asyncio.Task] = None
+        self._lock_connection: Optional[AsyncConnection] = None
+
+    async def lead(self) -> bool:
+        """Whether this process is the one that runs the check, taking the lock if it is free."""
+        if self.engine.dialect.name != "postgresql":
+            return True
+        if self._lock_connection is not None:
+            try:
+                # The lock lives as long as its connection; make sure that is still up
+                await self._lock_connection.execute(text("SELECT 1"))
+                return True
+            except DBAPIError:
+                await self._release()
+        connection = await self.engine.connect()
+        try:
+            connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+            locked = (await connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": IMAGE_SUMMARY_LOCK_KEY}
+            )).scalar()
+        except BaseException:
+            await connection.close()
+            raise
+        if not locked:
+            await connection.close()
+            return False
+        self._lock_connection = connection
+        return True
+
+    async def _release(self) -> None:
+        connection, self._lock_connection = self._lock_connection, None
+        if connection is not None:
+            try:
+                # Closing returns the connection to the pool, so unlock explicitly
+                await connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": IMAGE_SUMMARY_LOCK_KEY})
+            except DBAPIError:
+                await connection.invalidate()
+            await connection.close()
+
+    async def check(self, db: Optional[AsyncSession] = None) -> int:
+        """Recompute every drifted image summary; returns how many products were repaired."""
+        session = db or AsyncSessionLocal()
+        repaired = 0
+        last_id = 0
+        try:
+            while True:
+                ids = (await session.execute(
+                    select(Product.id)
+                    .where(Product.id > last_id)
+                    .order_by(Product.id)
+                    .limit(self.batch_size)
+                )).scalars().all()
+                if not ids:
+                    return repaired
+                last_id = ids[-1]
+                result = await session.execute(
+                    update(Product)
+                    .where(and_(
+                        Product.id.in_(ids),
+                        or_(
+                            Product.image_count != actual_image_count(),
+                            func.coalesce(Product.primary_image_url, "")
+                            != func.coalesce(actual_primary_image_url(), ""),
+                        ),
+                    ))
+                    .values(image_count=actual_image_count(), primary_image_url=actual_primary_image_url()),
+                    execution_options={"synchronize_session": False}
+                )
+                await session.commit()
+                repaired += result.rowcount
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            if db is None:
+                await session.close()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if not await self.lead():
+                    continue
+                repaired = await self.check()
+                if repaired:
+                    logger.warning("Repaired the image summary of %d products", repaired)
+            except Exception:
+                logger.exception("Failed to check product image summaries")
+
+    def start(self) -> None:
+        """Start the periodic check task on the running event loop."""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the periodic check task and hand the lock to another worker."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._release()
+
+image_summary_checker = ImageSummaryChecker(IMAGE_SUMMARY_CHECK_INTERVAL, IMAGE_SUMMARY_CHECK_BATCH_SIZE)
@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+
+from .cache import response_cache
+from .database import replica_set
+from .pool import pool_stats
+
+# Operational endpoints for tuning; keep them off the public ingress
+router = APIRouter(prefix="/internal", tags=["internal"])
+
+@router.get("/cache")
+def get_cache_stats():
+    """Hit/miss/invalidation counters and occupancy of the response cache."""
+    return response_cache.stats()
+
+@router.get("/pool")
+def get_pool_stats():
+    """Occupancy, overflow, checkout wait histogram and timeouts of each connection pool."""
+    return pool_stats()
+
+@router.get("/replicas")
+def get_replica_health():
+    """Health of each read replica as of its last check, in DATABASE_REPLICA_URLS order."""
+    return {"healthy": replica_set.status()}
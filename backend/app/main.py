@@ -1,15 +1,26 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from typing import List, Dict, Any, Optional
 import os
-from .database import engine
-from .models import Base
+from .database import async_engine, replica_set
+from .auth import user_cache
+from .cache import response_cache
+from .pool import reset_after_fork
 from .products import router as products_router
+from .product_import import router as product_import_router
+from .product_export import router as product_export_router
 from .cart_orders import router as cart_orders_router
 from .auth import router as auth_router
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
+from .internal import router as internal_router
+from .metrics import MetricsMiddleware, metrics_collector, router as metrics_router
+from .cart_sweep import cart_sweeper
+from .image_summary import image_summary_checker
+from .idempotency import IdempotencyMiddleware
+from .profiler import QueryProfilerMiddleware
+from .readiness import check_readiness, startup_check
+from .replicas import StickyPrimaryMiddleware
+from .views import view_counter
 
 app = FastAPI(
     title="EcoFinds API",
@@ -17,22 +28,83 @@ app = FastAPI(
     version="0.1.0"
 )
 
-# Configure CORS
+# Keep a client's reads on the primary for a moment after it writes
+app.add_middleware(StickyPrimaryMiddleware)
+
+# Replay retried writes sent with an Idempotency-Key instead of running them again
+app.add_middleware(IdempotencyMiddleware, routes=[("POST", "/api/orders"), ("POST", "/api/cart"), ("POST", "/api/cart/batch")])
+
+# Per-route request metrics for /metrics; inside the profiler so it can read DB time
+app.add_middleware(MetricsMiddleware)
+
+# Count each request's SQL, flag N+1 loops, and send Server-Timing in debug mode
+app.add_middleware(QueryProfilerMiddleware)
+
+# Configure CORS (outermost, so responses that middleware answers itself, like
+# idempotent replays and their errors, carry the headers too)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # In production, replace with specific origins
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Browsers only let scripts read response headers listed here
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed"],
 )
 
 # Include routers
+# Before the products router, whose /api/products/{product_id} would claim /export
+app.include_router(product_export_router)
 app.include_router(products_router)
+app.include_router(product_import_router)
 app.include_router(cart_orders_router)
 app.include_router(auth_router)
+app.include_router(internal_router)
+app.include_router(metrics_router)
+
+def init_worker():
+    """Set up a worker process forked from a server that preloaded the app.
+    
+    Called by gunicorn's post_fork hook. Engines and caches are created at
+    import, in the parent, but hold nothing until used: this drops any pooled
+    connections and cached entries the parent did make so the worker opens
+    its own. Background tasks start per worker with the startup event.
+    """
+    reset_after_fork()
+    response_cache.local.clear()
+    user_cache.clear()
+    view_counter.discard()
+
+@app.on_event("startup")
+async def check_database():
+    # The schema is managed by Alembic; only confirm it is migrated far enough
+    await startup_check()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    view_counter.start()
+    replica_set.start()
+    cart_sweeper.start()
+    image_summary_checker.start()
+    metrics_collector.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    # Flush buffered product views before the worker exits
+    await view_counter.stop()
+    await cart_sweeper.stop()
+    await image_summary_checker.stop()
+    await metrics_collector.stop()
+    await replica_set.stop()
+    await async_engine.dispose()
 
 @app.get("/health")
 def health_check():
     """Check if the API is running."""
     return {"status": "ok"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Check the database answers and is migrated for this build (503 otherwise)."""
+    result = await check_readiness()
+    return JSONResponse(result, status_code=200 if result["ready"] else 503)
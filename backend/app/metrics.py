@@ -0,0 +1,390 @@
+"""Request metrics in the Prometheus text format.
+
+MetricsMiddleware records, per method and route template
+("/api/products/{product_id}", never the raw path):
+
+    http_requests_total{method,route,status}        counter
+    http_request_duration_seconds{method,route}     histogram
+    http_requests_in_flight                         gauge
+    db_queries_total{method,route}                  counter
+    db_query_duration_seconds{method,route}         histogram of DB time per request
+
+Recording is a few dict updates on the event loop, with no locks or I/O.
+DB figures come from the request's QueryProfile, so QueryProfilerMiddleware
+must wrap this middleware.
+
+Each worker process keeps its own figures. With METRICS_DIR set, every
+worker also writes a snapshot there every METRICS_FLUSH_INTERVAL seconds
+and at shutdown, and GET /metrics merges them with its live figures.
+Counters and histograms are summed over every snapshot, including those of
+workers that have exited, so totals never go backwards when workers are
+recycled. When a worker exits, `mark_process_dead` folds its snapshot into
+one file for all dead workers and deletes it, so the directory (and the
+work of a scrape) stays one file per live worker plus one. The in-flight
+gauge only counts snapshots whose process is running and that were written
+within the last few flush intervals, so a reused pid can't revive a dead
+worker's gauge. METRICS_DIR must be cleared when the server starts;
+gunicorn.conf.py calls `clear_snapshots` then and `mark_process_dead` as
+each worker exits. Other workers' figures lag by up to the flush interval.
+"""
+import asyncio
+import contextlib
+import fcntl
+import glob
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from .profiler import current_profile
+
+logger = logging.getLogger(__name__)
+
+# Metrics settings
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Route label for requests that matched no route, so unknown paths can't explode cardinality
+UNMATCHED_ROUTE = "<unmatched>"
+
+# Snapshot of every worker that has exited, kept beside the live workers' files
+DEAD_SNAPSHOT = "metrics_dead.json"
+
+# A snapshot not rewritten for this many flush intervals no longer counts as in flight
+STALE_INTERVALS = 3
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HELP = {
+    "http_requests_total": ("counter", "HTTP requests by method, route template and status."),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by method and route template."),
+    "http_requests_in_flight": ("gauge", "HTTP requests being served."),
+    "db_queries_total": ("counter", "SQL statements run by method and route template."),
+    "db_query_duration_seconds": ("histogram", "Time each request spent in SQL, by method and route template."),
+}
+
+class RequestMetrics:
+    """One process's request figures."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.reset()
+
+    def reset(self) -> None:
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        # Per (method, route): non-cumulative bucket counts, then the sum
+        self.latency: Dict[Tuple[str, str], List[float]] = {}
+        self.db_time: Dict[Tuple[str, str], List[float]] = {}
+        self.db_queries: Dict[Tuple[str, str], int] = {}
+        self.in_flight = 0
+
+    def _observe(self, histogram: Dict[Tuple[str, str], List[float]], key: Tuple[str, str], value: float) -> None:
+        counts = histogram.get(key)
+        if counts is None:
+            counts = histogram[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def observe(self, method: str, route: str, status: int, duration: float,
+                db_queries: Optional[int] = None, db_duration: float = 0.0) -> None:
+        key = (method, route)
+        requests_key = (method, route, str(status))
+        self.requests[requests_key] = self.requests.get(requests_key, 0) + 1
+        self._observe(self.latency, key, duration)
+        if db_queries is not None:
+            self.db_queries[key] = self.db_queries.get(key, 0) + db_queries
+            self._observe(self.db_time, key, db_duration)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serializable copy of the figures, in the shape `merge` and `render` take."""
+        return {
+            "buckets": list(self.buckets),
+            "http_requests_total": [[*key, count] for key, count in self.requests.items()],
+            "http_request_duration_seconds": [[*key, counts] for key, counts in self.latency.items()],
+            "db_queries_total": [[*key, count] for key, count in self.db_queries.items()],
+            "db_query_duration_seconds": [[*key, counts] for key, counts in self.db_time.items()],
+            "http_requests_in_flight": self.in_flight,
+        }
+
+def merge(snapshots: List[Dict[str, Any]], live: List[bool]) -> Dict[str, Any]:
+    """Sum snapshots; the in-flight gauge only counts the ones marked live."""
+    merged: Dict[str, Any] = {"buckets": snapshots[0]["buckets"] if snapshots else list(LATENCY_BUCKETS)}
+    for name in ("http_requests_total", "db_queries_total"):
+        totals: Dict[tuple, int] = {}
+        for snapshot in snapshots:
+            for *key, count in snapshot.get(name, []):
+                totals[tuple(key)] = totals.get(tuple(key), 0) + count
+        merged[name] = [[*key, count] for key, count in totals.items()]
+    for name in ("http_request_duration_seconds", "db_query_duration_seconds"):
+        histograms: Dict[tuple, List[float]] = {}
+        for snapshot in snapshots:
+            for *key, counts in snapshot.get(name, []):
+                total = histograms.setdefault(tuple(key), [0] * len(counts))
+                for index, count in enumerate(counts):
+                    total[index] += count
+        merged[name] = [[*key, counts] for key, counts in histograms.items()]
+    merged["http_requests_in_flight"] = sum(
+        snapshot.get("http_requests_in_flight", 0) for snapshot, alive in zip(snapshots, live) if alive
+    )
+    return merged
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: Tuple[str, ...], values) -> str:
+    return ",".join(f'{name}="{_label(value)}"' for name, value in zip(names, values))
+
+def render(snapshot: Dict[str, Any]) -> str:
+    """The Prometheus text exposition of a (merged) snapshot."""
+    lines = []
+
+    def header(name: str) -> None:
+        kind, description = HELP[name]
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for name, label_names in (
+        ("http_requests_total", ("method", "route", "status")),
+        ("db_queries_total", ("method", "route")),
+    ):
+        header(name)
+        for *key, count in sorted(snapshot[name]):
+            lines.append(f"{name}{{{_labels(label_names, key)}}} {count}")
+
+    bounds = [*map(str, snapshot["buckets"]), "+Inf"]
+    for name in ("http_request_duration_seconds", "db_query_duration_seconds"):
+        header(name)
+        for *key, counts in sorted(snapshot[name], key=lambda entry: entry[:2]):
+            labels = _labels(("method", "route"), key)
+            running = 0
+            for bound, count in zip(bounds, counts):
+                running += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {running}')
+            lines.append(f"{name}_sum{{{labels}}} {counts[-1]}")
+            lines.append(f"{name}_count{{{labels}}} {running}")
+
+    header("http_requests_in_flight")
+    lines.append(f"http_requests_in_flight {snapshot['http_requests_in_flight']}")
+    return "\n".join(lines) + "\n"
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _snapshot_pid(path: str) -> Optional[int]:
+    """The pid in a worker snapshot's name (metrics_<pid>_<start>.json), None for the dead workers' file."""
+    try:
+        return int(os.path.basename(path).split("_")[1])
+    except (IndexError, ValueError):
+        return None
+
+def _write_snapshot(path: str, snapshot: Dict[str, Any]) -> None:
+    """Replace a snapshot file atomically, so readers never see half of one."""
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as snapshot_file:
+        json.dump(snapshot, snapshot_file)
+    os.replace(temporary, path)
+
+@contextlib.contextmanager
+def _directory_lock(directory: str, exclusive: bool):
+    """Keep scrapes from reading the directory halfway through folding a dead worker in."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "metrics.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def clear_snapshots(directory: Optional[str] = METRICS_DIR) -> None:
+    """Remove every worker snapshot, so a restarted server counts from zero."""
+    if directory is None:
+        return
+    for path in glob.glob(os.path.join(directory, "metrics_*.json*")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def mark_process_dead(pid: int, directory: Optional[str] = METRICS_DIR) -> None:
+    """Fold an exited worker's snapshots into the dead workers' file and delete them.
+    
+    Call it once the worker is gone, from the process that manages the
+    workers (gunicorn's child_exit hook), so only one process ever writes
+    the dead workers' file.
+    """
+    if directory is None:
+        return
+    paths = glob.glob(os.path.join(directory, f"metrics_{pid}_*.json"))
+    if not paths:
+        return
+    dead_path = os.path.join(directory, DEAD_SNAPSHOT)
+    with _directory_lock(directory, exclusive=True):
+        snapshots = []
+        for path in [dead_path, *paths]:
+            try:
+                with open(path) as snapshot_file:
+                    snapshots.append(json.load(snapshot_file))
+            except FileNotFoundError:
+                continue
+            except ValueError:
+                logger.warning("Dropping unreadable metrics snapshot %s", path)
+        if snapshots:
+            _write_snapshot(dead_path, merge(snapshots, [False] * len(snapshots)))
+        for path in paths:
+            for leftover in (path, f"{path}.tmp"):
+                try:
+                    os.remove(leftover)
+                except FileNotFoundError:
+                    pass
+
+class MetricsCollector:
+    """This process's metrics, plus the snapshots other workers leave in METRICS_DIR."""
+
+    def __init__(self, directory: Optional[str] = METRICS_DIR, flush_interval: float = METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics = RequestMetrics()
+        self._pid: Optional[int] = None
+        self._path: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def path(self) -> Optional[str]:
+        """This process's snapshot file; named per process start so pid reuse can't clobber it."""
+        if self.directory is None:
+            return None
+        if self._pid != os.getpid():
+            # First use in this process (or after a fork): start from zero under a new name
+            if self._pid is not None:
+                self.metrics.reset()
+            self._pid = os.getpid()
+            self._path = os.path.join(self.directory, f"metrics_{self._pid}_{time.time_ns()}.json")
+        return self._path
+
+    def write(self) -> None:
+        """Publish this process's snapshot for the other workers."""
+        path = self.path
+        if path is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        _write_snapshot(path, self.metrics.snapshot())
+
+    def collect(self) -> Dict[str, Any]:
+        """Figures for every worker: this one's live, the others' from their last snapshot."""
+        snapshots = [self.metrics.snapshot()]
+        live = [True]
+        own = self.path
+        if self.directory is not None:
+            fresh_since = time.time() - STALE_INTERVALS * self.flush_interval
+            with _directory_lock(self.directory, exclusive=False):
+                for path in glob.glob(os.path.join(self.directory, "metrics_*.json")):
+                    if path == own:
+                        continue
+                    try:
+                        written = os.path.getmtime(path)
+                        with open(path) as snapshot_file:
+                            snapshots.append(json.load(snapshot_file))
+                    except (OSError, ValueError):
+                        # Vanished or half-written; it'll be back next scrape
+                        continue
+                    pid = _snapshot_pid(path)
+                    live.append(
+                        pid is not None and _alive(pid)
+                        and (self.flush_interval <= 0 or written >= fresh_since)
+                    )
+        return merge(snapshots, live)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.write()
+            except Exception:
+                logger.exception("Failed to write the metrics snapshot")
+
+    def start(self) -> None:
+        """Start writing snapshots periodically, when METRICS_DIR is set."""
+        if self._task is None and self.directory is not None and self.flush_interval > 0:
+            self.write()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the snapshot task and write a final snapshot."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.directory is not None:
+            self.write()
+
+metrics_collector = MetricsCollector()
+
+class MetricsMiddleware:
+    """Records latency, status and DB time of every HTTP request under its route template."""
+
+    def __init__(self, app, collector: Optional[MetricsCollector] = None):
+        self.app = app
+        self._collector = collector
+
+    @property
+    def collector(self) -> MetricsCollector:
+        return self._collector if self._collector is not None else metrics_collector
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.collector.metrics
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.in_flight -= 1
+            # The router leaves the matched route in the scope
+            route = scope.get("route")
+            profile = current_profile()
+            metrics.observe(
+                scope["method"],
+                getattr(route, "path", UNMATCHED_ROUTE),
+                status_code,
+                time.perf_counter() - started,
+                db_queries=profile.count if profile is not None else None,
+                db_duration=profile.duration if profile is not None else 0.0,
+            )
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Request metrics for every worker, in the Prometheus text format.
+    
+    Async so it reads the live figures on the event loop that updates them.
+    """
+    return Response(content=render(metrics_collector.collect()), media_type=CONTENT_TYPE)
@@ -1,8 +1,28 @@
-from sqlalchemy import Column, Integer, String, Text, DECIMAL, Boolean, DateTime, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, String, Text, DECIMAL, Boolean, DateTime, ForeignKey, CheckConstraint, Index, UniqueConstraint
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql.expression import FunctionElement
 from .database import Base
 
+class db_now(FunctionElement):
+    """Current database timestamp, used for created_at/updated_at defaults.
+
+    SQLite's CURRENT_TIMESTAMP has no fractional part and a different text
+    format from the one SQLAlchemy binds datetimes with, which breaks
+    equality and keyset comparisons; there we store the same
+    "YYYY-MM-DD HH:MM:SS.ffffff" format SQLAlchemy writes.
+    """
+    type = DateTime(timezone=True)
+    inherit_cache = True
+
+@compiles(db_now)
+def _db_now_default(element, compiler, **kw):
+    return "now()"
+
+@compiles(db_now, "sqlite")
+def _db_now_sqlite(element, compiler, **kw):
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
 class User(Base):
     __tablename__ = "users"
     
@@ -13,13 +33,14 @@ class User(Base):
     bio = Column(Text)
     profile_image_url = Column(String(255))
     is_verified = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=db_now())
+    updated_at = Column(DateTime(timezone=True), server_default=db_now(), onupdate=db_now())
     
     # Relationships
-    products = relationship("Product", back_populates="seller")
-    cart = relationship("Cart", back_populates="user", uselist=False)
-    orders = relationship("Order", back_populates="user")
+    products = relationship("Product", back_populates="seller", passive_deletes=True)
+    cart = relationship("Cart", back_populates="user", uselist=False, passive_deletes=True)
+    orders = relationship("Order", back_populates="user", passive_deletes=True)
+    reviews = relationship("Review", back_populates="user", passive_deletes=True)
 
 class Product(Base):
     __tablename__ = "products"
@@ -35,21 +56,46 @@ class Product(Base):
     eco_details = Column(Text)
     status = Column(String(20), default="active")
     views = Column(Integer, default=0)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Summary of product_images, kept in step by product writes (checked by app.image_summary)
+    primary_image_url = Column(String(255))
+    image_count = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime(timezone=True), server_default=db_now())
+    updated_at = Column(DateTime(timezone=True), server_default=db_now(), onupdate=db_now())
     
     # Constraints
     __table_args__ = (
         CheckConstraint("eco_rating BETWEEN 1 AND 5", name="check_eco_rating"),
         CheckConstraint("status IN ('active', 'sold', 'draft', 'deleted')", name="check_status"),
         CheckConstraint("price > 0", name="positive_price"),
+        # Keyset pagination indexes for the feed, with and without a category filter
+        Index(
+            "idx_products_feed",
+            created_at.desc(), id.desc(),
+            postgresql_where=(status == "active"), sqlite_where=(status == "active"),
+        ),
+        Index(
+            "idx_products_feed_category",
+            category, created_at.desc(), id.desc(),
+            postgresql_where=(status == "active"), sqlite_where=(status == "active"),
+        ),
+        # Incremental catalogue exports: WHERE updated_at >= ? ORDER BY updated_at, id
+        Index("idx_products_updated", updated_at, id),
+        # Foreign keys: a seller's listings, and cascades when a user is deleted
+        Index("idx_products_seller_id", seller_id),
     )
     
     # Relationships
     seller = relationship("User", back_populates="products")
-    images = relationship("ProductImage", back_populates="product", cascade="all, delete-orphan")
-    cart_items = relationship("CartItem", back_populates="product")
-    order_items = relationship("OrderItem", back_populates="product")
+    # Primary image first, then the rest in the order they were added
+    images = relationship(
+        "ProductImage",
+        back_populates="product",
+        cascade="all, delete-orphan",
+        order_by=lambda: (ProductImage.is_primary.desc(), ProductImage.id),
+    )
+    cart_items = relationship("CartItem", back_populates="product", passive_deletes=True)
+    order_items = relationship("OrderItem", back_populates="product", passive_deletes=True)
+    reviews = relationship("Review", back_populates="product", passive_deletes=True)
 
 class ProductImage(Base):
     __tablename__ = "product_images"
@@ -58,7 +104,12 @@ class ProductImage(Base):
     product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
     image_url = Column(String(255), nullable=False)
     is_primary = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=db_now())
+    
+    # Image loading and summaries by product, and cascades when a product is deleted
+    __table_args__ = (
+        Index("idx_product_images_product_id", product_id),
+    )
     
     # Relationships
     product = relationship("Product", back_populates="images")
@@ -67,9 +118,10 @@ class Cart(Base):
     __tablename__ = "carts"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # One cart per user; the unique constraint lets carts be created with an upsert
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, unique=True)
+    created_at = Column(DateTime(timezone=True), server_default=db_now())
+    updated_at = Column(DateTime(timezone=True), server_default=db_now(), onupdate=db_now())
     
     # Relationships
     user = relationship("User", back_populates="cart")
@@ -82,11 +134,14 @@ class CartItem(Base):
     cart_id = Column(Integer, ForeignKey("carts.id", ondelete="CASCADE"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
     quantity = Column(Integer, nullable=False, default=1)
-    added_at = Column(DateTime(timezone=True), server_default=func.now())
+    added_at = Column(DateTime(timezone=True), server_default=db_now())
     
     # Constraints
     __table_args__ = (
         CheckConstraint("quantity > 0", name="positive_quantity"),
+        UniqueConstraint("cart_id", "product_id", name="cart_items_cart_id_product_id_key"),
+        # cart_id is covered by the unique constraint above; product_id needs its own for cascades
+        Index("idx_cart_items_product_id", product_id),
     )
     
     # Relationships
@@ -105,12 +160,14 @@ class Order(Base):
     shipping_state = Column(String(100), nullable=False)
     shipping_zip = Column(String(20), nullable=False)
     shipping_country = Column(String(100), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=db_now())
+    updated_at = Column(DateTime(timezone=True), server_default=db_now(), onupdate=db_now())
     
     # Constraints
     __table_args__ = (
         CheckConstraint("status IN ('processing', 'shipped', 'delivered', 'cancelled')", name="check_order_status"),
+        # Order history pages: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        Index("idx_orders_user_created", "user_id", created_at.desc(), id.desc()),
     )
     
     # Relationships
@@ -125,13 +182,60 @@ class OrderItem(Base):
     product_id = Column(Integer, ForeignKey("products.id", ondelete="SET NULL"), nullable=False)
     quantity = Column(Integer, nullable=False)
     price_per_unit = Column(DECIMAL(10, 2), nullable=False)
+    # Snapshot of the listing at checkout, so history survives later edits and deletion
+    product_name = Column(String(255), nullable=False)
+    product_image_url = Column(String(255))
+    product_category = Column(String(50))
     
     # Constraints
     __table_args__ = (
         CheckConstraint("quantity > 0", name="positive_quantity"),
         CheckConstraint("price_per_unit > 0", name="positive_price_per_unit"),
+        # Items of a page of orders, and the products' foreign key
+        Index("idx_order_items_order_id", order_id),
+        Index("idx_order_items_product_id", product_id),
     )
     
     # Relationships
     order = relationship("Order", back_populates="items")
     product = relationship("Product", back_populates="order_items")
+
+class Review(Base):
+    __tablename__ = "reviews"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Only a purchase can be reviewed, and only once by its buyer
+    order_item_id = Column(Integer, ForeignKey("order_items.id", ondelete="CASCADE"), nullable=False)
+    rating = Column(Integer, nullable=False)
+    comment = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=db_now())
+    
+    # Constraints
+    __table_args__ = (
+        CheckConstraint("rating BETWEEN 1 AND 5", name="check_rating"),
+        UniqueConstraint("user_id", "order_item_id", name="reviews_user_id_order_item_id_key"),
+        Index("idx_reviews_product_id", product_id),
+        Index("idx_reviews_user_id", user_id),
+        Index("idx_reviews_rating", rating),
+    )
+    
+    # Relationships
+    product = relationship("Product", back_populates="reviews")
+    user = relationship("User", back_populates="reviews")
+    order_item = relationship("OrderItem")
+
+class IdempotencyKey(Base):
+    """Outcome of a write request sent with an Idempotency-Key (see app.idempotency)."""
+    __tablename__ = "idempotency_keys"
+    
+    # SHA-256 of the user, route and client-supplied key
+    key = Column(String(64), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    # NULL while the first request is still running
+    status_code = Column(Integer)
+    content_type = Column(String(100))
+    response_body = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=db_now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -1,126 +0,0 @@
--- EcoFinds Database Schema
-
--- Users table
-CREATE TABLE users (
-    id SERIAL PRIMARY KEY,
-    email VARCHAR(255) UNIQUE NOT NULL,
-    password_hash VARCHAR(255) NOT NULL,
-    name VARCHAR(255) NOT NULL,
-    bio TEXT,
-    profile_image_url VARCHAR(255),
-    is_verified BOOLEAN DEFAULT FALSE,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-);
-
--- Create index on email for faster lookups during authentication
-CREATE INDEX idx_users_email ON users(email);
-
--- Products table
-CREATE TABLE products (
-    id SERIAL PRIMARY KEY,
-    seller_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    name VARCHAR(255) NOT NULL,
-    description TEXT NOT NULL,
-    price DECIMAL(10, 2) NOT NULL,
-    category VARCHAR(50) NOT NULL,
-    condition VARCHAR(50) NOT NULL,
-    eco_rating INTEGER CHECK (eco_rating BETWEEN 1 AND 5),
-    eco_details TEXT,
-    status VARCHAR(20) DEFAULT 'active' CHECK (status IN ('active', 'sold', 'draft', 'deleted')),
-    views INTEGER DEFAULT 0,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    CONSTRAINT positive_price CHECK (price > 0)
-);
-
--- Create indexes for common product queries
-CREATE INDEX idx_products_seller_id ON products(seller_id);
-CREATE INDEX idx_products_category ON products(category);
-CREATE INDEX idx_products_status ON products(status);
-CREATE INDEX idx_products_price ON products(price);
-CREATE INDEX idx_products_eco_rating ON products(eco_rating);
-
--- Product images
-CREATE TABLE product_images (
-    id SERIAL PRIMARY KEY,
-    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
-    image_url VARCHAR(255) NOT NULL,
-    is_primary BOOLEAN DEFAULT FALSE,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-);
-
-CREATE INDEX idx_product_images_product_id ON product_images(product_id);
-
--- Carts table
-CREATE TABLE carts (
-    id SERIAL PRIMARY KEY,
-    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-);
-
-CREATE INDEX idx_carts_user_id ON carts(user_id);
-
--- Cart items table
-CREATE TABLE cart_items (
-    id SERIAL PRIMARY KEY,
-    cart_id INTEGER NOT NULL REFERENCES carts(id) ON DELETE CASCADE,
-    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
-    quantity INTEGER NOT NULL DEFAULT 1,
-    added_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    CONSTRAINT positive_quantity CHECK (quantity > 0),
-    UNIQUE (cart_id, product_id)
-);
-
-CREATE INDEX idx_cart_items_cart_id ON cart_items(cart_id);
-CREATE INDEX idx_cart_items_product_id ON cart_items(product_id);
-
--- Orders table
-CREATE TABLE orders (
-    id SERIAL PRIMARY KEY,
-    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE SET NULL,
-    status VARCHAR(20) NOT NULL DEFAULT 'processing' 
-        CHECK (status IN ('processing', 'shipped', 'delivered', 'cancelled')),
-    total_amount DECIMAL(10, 2) NOT NULL,
-    shipping_address TEXT NOT NULL,
-    shipping_city VARCHAR(100) NOT NULL,
-    shipping_state VARCHAR(100) NOT NULL,
-    shipping_zip VARCHAR(20) NOT NULL,
-    shipping_country VARCHAR(100) NOT NULL,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-);
-
-CREATE INDEX idx_orders_user_id ON orders(user_id);
-CREATE INDEX idx_orders_status ON orders(status);
-
--- Order items table
-CREATE TABLE order_items (
-    id SERIAL PRIMARY KEY,
-    order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
-    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE SET NULL,
-    quantity INTEGER NOT NULL,
-    price_per_unit DECIMAL(10, 2) NOT NULL,
-    CONSTRAINT positive_quantity CHECK (quantity > 0),
-    CONSTRAINT positive_price_per_unit CHECK (price_per_unit > 0)
-);
-
-CREATE INDEX idx_order_items_order_id ON order_items(order_id);
-CREATE INDEX idx_order_items_product_id ON order_items(product_id);
-
--- Reviews table
-CREATE TABLE reviews (
-    id SERIAL PRIMARY KEY,
-    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
-    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    order_item_id INTEGER NOT NULL REFERENCES order_items(id) ON DELETE CASCADE,
-    rating INTEGER NOT NULL CHECK (rating BETWEEN 1 AND 5),
-    comment TEXT,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    UNIQUE (user_id, order_item_id)
-);
-
-CREATE INDEX idx_reviews_product_id ON reviews(product_id);
-CREATE INDEX idx_reviews_user_id ON reviews(user_id);
-CREATE INDEX idx_reviews_rating ON reviews(rating);
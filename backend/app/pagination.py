@@ -0,0 +1,17 @@
+"""Opaque keyset pagination cursors shared by the list endpoints."""
+import base64
+import json
+from typing import Any, Dict
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """Pack a keyset position into an opaque, URL-safe cursor."""
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Unpack a cursor produced by encode_cursor; raises ValueError if malformed."""
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    position = json.loads(raw)
+    if not isinstance(position, dict):
+        raise ValueError("Cursor is not an object")
+    return position
@@ -0,0 +1,156 @@
+"""Connection pool sizing and instrumentation.
+
+Every engine the app creates gets its pool settings from the environment
+(DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_PRE_PING,
+DB_POOL_RECYCLE) and a pool class that times each checkout. Pools are
+per worker process, so a deployment opens up to
+workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections per engine; keep
+that under Postgres `max_connections`. Live figures are served by
+/internal/pool.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Seconds after which a connection is replaced on checkout; -1 never recycles
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Upper bounds (seconds) of the checkout wait histogram buckets
+WAIT_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class PoolMetrics:
+    """Checkout counters and wait-time histogram for one pool."""
+
+    def __init__(self, buckets: Tuple[float, ...] = WAIT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts: List[int] = [0] * (len(self.buckets) + 1)
+            self._wait_sum = 0.0
+            self._checkouts = 0
+            self._timeouts = 0
+
+    def record_checkout(self, waited: float) -> None:
+        with self._lock:
+            self._counts[bisect_left(self.buckets, waited)] += 1
+            self._wait_sum += waited
+            self._checkouts += 1
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self._timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self._counts)
+            wait_sum = self._wait_sum
+            checkouts = self._checkouts
+            timeouts = self._timeouts
+        # Cumulative buckets, Prometheus style
+        histogram = {}
+        running = 0
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], counts):
+            running += count
+            histogram[bound] = running
+        return {
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "wait_seconds_sum": wait_sum,
+            "wait_seconds_histogram": histogram,
+        }
+
+class _InstrumentedPoolMixin:
+    """Times Pool.connect(), which covers queueing for a slot, connecting and pre-ping."""
+
+    metrics: PoolMetrics
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout(time.perf_counter() - started)
+        return connection
+
+# Engines registered for /internal/pool, by name
+_engines: Dict[str, Any] = {}
+
+def pool_options(url: str, is_async: bool = False) -> Dict[str, Any]:
+    """create_engine()/create_async_engine() keyword arguments for an instrumented pool.
+
+    The metrics live on a pool class made for this engine, so they survive
+    the pool being recreated by engine.dispose().
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # In-memory SQLite needs its single shared connection; leave the default pool
+        return {}
+    base = AsyncAdaptedQueuePool if is_async else QueuePool
+    pool_class = type(
+        f"Instrumented{base.__name__}",
+        (_InstrumentedPoolMixin, base),
+        {"metrics": PoolMetrics()},
+    )
+    return {
+        "poolclass": pool_class,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+def register_engine(name: str, engine) -> None:
+    """Expose an engine's pool on /internal/pool (async engines are unwrapped)."""
+    _engines[name] = getattr(engine, "sync_engine", engine)
+
+def reset_after_fork() -> None:
+    """Give a forked worker pools of its own.
+
+    Connections inherited from the parent are dropped without being closed,
+    since closing them would end the parent's sessions; each pool then
+    connects afresh on first use and counts checkouts from zero.
+    """
+    for engine in _engines.values():
+        engine.dispose(close=False)
+        metrics = getattr(engine.pool, "metrics", None)
+        if metrics is not None:
+            metrics.reset()
+
+def pool_stats() -> Dict[str, Any]:
+    """Live occupancy and checkout metrics for every registered engine."""
+    stats = {}
+    for name, engine in _engines.items():
+        pool = engine.pool
+        entry: Dict[str, Any] = {"pool_class": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            entry.update({
+                "size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "timeout": pool.timeout(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                # Negative while the pool hasn't yet opened pool_size connections
+                "overflow": pool.overflow(),
+            })
+        metrics = getattr(pool, "metrics", None)
+        if metrics is not None:
+            entry.update(metrics.snapshot())
+        stats[name] = entry
+    return stats
@@ -0,0 +1,190 @@
+"""Streaming catalogue export.
+
+GET /api/products/export streams the whole catalogue as NDJSON (default)
+or CSV, one product per line with its seller name and image URLs. Rows are
+read with a server-side cursor in batches of EXPORT_BATCH_SIZE; each batch
+costs at most one extra query for images, and only for products with more
+than one image (the rest come from products.primary_image_url). Memory
+stays flat however large the catalogue is.
+
+Without `updated_since` the export holds active products and may be read
+from a replica. With it, the export is incremental: every product updated
+at or after that time, in any status, so consumers also learn about sold and
+deleted listings. Incremental exports need a signed-in caller, and products
+no longer for sale appear only as their id, status and updated_at (every
+other field empty): enough to drop them from a copy of the catalogue
+without publishing who sold what. Incremental exports always read the
+primary, since a lagging replica would hide rows whose updated_at is
+already behind the watermark. The X-Export-Watermark header is the primary's time when the
+export started, minus EXPORT_WATERMARK_LAG seconds; pass it as the next
+`updated_since`. The lag covers write transactions that stamped updated_at
+before the export began but committed after it. Because of the lag,
+consecutive exports overlap, and a product can appear in both. Consumers
+should upsert by id and keep the record with the latest updated_at.
+
+Clients that send Accept-Encoding: gzip get the stream compressed on the fly.
+"""
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .auth import get_optional_user_id
+from .database import get_db, get_read_db
+from .models import Product, ProductImage, User, db_now
+from .product_import import CSV_IMAGE_SEPARATOR
+
+router = APIRouter()
+
+# Rows fetched from the cursor, and serialized, at a time
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Seconds the watermark trails the export's start; longer than any write transaction
+EXPORT_WATERMARK_LAG = float(os.getenv("EXPORT_WATERMARK_LAG", "60"))
+
+EXPORT_FIELDS = [
+    "id", "seller_id", "seller_name", "name", "description", "price", "category", "condition",
+    "eco_rating", "eco_details", "status", "created_at", "updated_at", "image_urls",
+]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+async def _image_urls(db: AsyncSession, rows) -> Dict[int, List[str]]:
+    """Image URLs for a batch of rows, primary first; reads product_images only when needed."""
+    urls = {row.id: [row.primary_image_url] if row.primary_image_url else [] for row in rows}
+    multiple = [row.id for row in rows if row.image_count > 1 and row.status == "active"]
+    if multiple:
+        for product_id in multiple:
+            urls[product_id] = []
+        images = await db.execute(
+            select(ProductImage.product_id, ProductImage.image_url)
+            .where(ProductImage.product_id.in_(multiple))
+            .order_by(ProductImage.product_id, ProductImage.is_primary.desc(), ProductImage.id)
+        )
+        for image in images:
+            urls[image.product_id].append(image.image_url)
+    return urls
+
+def _record(row, image_urls: List[str]) -> dict:
+    if row.status != "active":
+        record = dict.fromkeys(EXPORT_FIELDS)
+        record.update(id=row.id, status=row.status, image_urls=[],
+                      updated_at=row.updated_at.isoformat() if row.updated_at else None)
+        return record
+    return {
+        "id": row.id,
+        "seller_id": row.seller_id,
+        "seller_name": row.seller_name,
+        "name": row.name,
+        "description": row.description,
+        "price": float(row.price),
+        "category": row.category,
+        "condition": row.condition,
+        "eco_rating": row.eco_rating,
+        "eco_details": row.eco_details,
+        "status": row.status,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+        "image_urls": image_urls,
+    }
+
+def _ndjson(records: List[dict]) -> str:
+    return "".join(json.dumps(record) + "\n" for record in records)
+
+def _csv(records: List[dict], header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    for record in records:
+        writer.writerow([
+            CSV_IMAGE_SEPARATOR.join(record[field]) if field == "image_urls"
+            else "" if record[field] is None else record[field]
+            for field in EXPORT_FIELDS
+        ])
+    return buffer.getvalue()
+
+async def _export(db: AsyncSession, query, file_format: str) -> AsyncIterator[str]:
+    result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    header = file_format == "csv"
+    async for rows in result.partitions():
+        urls = await _image_urls(db, rows)
+        records = [_record(row, urls[row.id]) for row in rows]
+        yield _csv(records, header) if file_format == "csv" else _ndjson(records)
+        header = False
+    if header:
+        # An empty CSV export still has its header row
+        yield _csv([], header=True)
+
+async def _gzip(chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk.encode())
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+@router.get("/api/products/export")
+async def export_products(
+    request: Request,
+    file_format: str = Query("ndjson", alias="format", regex="^(ndjson|csv)$", description="ndjson or csv"),
+    updated_since: Optional[datetime] = Query(None, description="Only products updated at or after this time, in any status"),
+    primary_db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db),
+    user_id: Optional[int] = Depends(get_optional_user_id)
+):
+    """Stream the catalogue, or the products changed since `updated_since`."""
+    if updated_since is not None and user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sign in to export changes",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # Sessions connect on first use, so only the one picked here opens a connection
+    db = primary_db if updated_since is not None else read_db
+    watermark = (await db.execute(select(db_now()))).scalar_one() - timedelta(seconds=EXPORT_WATERMARK_LAG)
+    if updated_since is not None and updated_since.tzinfo is not None:
+        # Timestamps are stored in UTC; SQLite compares them as naive text
+        updated_since = updated_since.astimezone(timezone.utc)
+
+    query = (
+        select(
+            Product.id,
+            Product.seller_id,
+            User.name.label("seller_name"),
+            Product.name,
+            Product.description,
+            Product.price,
+            Product.category,
+            Product.condition,
+            Product.eco_rating,
+            Product.eco_details,
+            Product.status,
+            Product.created_at,
+            Product.updated_at,
+            Product.primary_image_url,
+            Product.image_count,
+        )
+        .join(User, User.id == Product.seller_id)
+    )
+    if updated_since is not None:
+        # Served by idx_products_updated (updated_at, id)
+        query = query.where(Product.updated_at >= updated_since).order_by(Product.updated_at, Product.id)
+    else:
+        query = query.where(Product.status == "active").order_by(Product.id)
+
+    body = _export(db, query, file_format)
+    headers = {"X-Export-Watermark": watermark.isoformat(), "Vary": "Accept-Encoding"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = _gzip(body)
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(body, media_type=MEDIA_TYPES[file_format], headers=headers)
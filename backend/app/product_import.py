@@ -0,0 +1,295 @@
+"""Bulk product import.
+
+POST /api/products/import takes a file of listings for the current user,
+either as the raw request body (Content-Type application/x-ndjson or
+text/csv) or as the `file` field of a multipart upload:
+
+    curl -X POST /api/products/import -H "Content-Type: application/x-ndjson" \
+         --data-binary @listings.ndjson
+
+NDJSON has one ProductCreate object per line. CSV has a header row with
+the ProductCreate field names, with image_urls separated by "|". Every row
+is validated like POST /api/products. Valid rows are inserted
+IMPORT_CHUNK_SIZE at a time: one multi-row INSERT for the products, one
+for their images and a commit per chunk. If the database rejects a chunk,
+that chunk is retried row by row so only the offending rows fail.
+
+The body is read as a stream, so memory depends on IMPORT_CHUNK_SIZE and
+IMPORT_MAX_LINE_BYTES rather than on the file size. The response counts
+imported and failed rows and lists the first MAX_IMPORT_ERRORS errors.
+"""
+import csv
+import json
+import logging
+import os
+from typing import AsyncIterator, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .auth import get_current_user_id
+from .cache import response_cache
+from .database import get_db
+from .models import Product, ProductImage
+from .products import ProductCreate, _validation_error
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Import settings
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", "65536"))
+
+# Row errors listed in the response; later ones are only counted
+MAX_IMPORT_ERRORS = 1000
+
+# Separator for the image_urls column of CSV imports
+CSV_IMAGE_SEPARATOR = "|"
+
+# Bytes read from a multipart upload at a time
+UPLOAD_READ_SIZE = 64 * 1024
+
+class ImportRowError(BaseModel):
+    row: int  # 1-based line (NDJSON) or record after the header (CSV)
+    error: str
+
+class ImportResponse(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ImportRowError]
+
+class _Report:
+    """Running totals for one import, keeping at most MAX_IMPORT_ERRORS errors."""
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[ImportRowError] = []
+
+    def fail(self, row: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append(ImportRowError(row=row, error=error))
+
+async def _body_chunks(request: Request) -> AsyncIterator[bytes]:
+    """The uploaded file's bytes, from a multipart `file` field or the raw body."""
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        # Starlette spools the upload to disk past 1 MB, so this stays bounded too
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Multipart imports must send the listings as a 'file' field"
+            )
+        while True:
+            chunk = await upload.read(UPLOAD_READ_SIZE)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        async for chunk in request.stream():
+            yield chunk
+
+async def _lines(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[Optional[bytes]]:
+    """Split a byte stream on newlines; a line longer than `max_bytes` comes out as None."""
+    buffer = b""
+    overflow = False
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if overflow or len(line) > max_bytes:
+                overflow = False
+                yield None
+            else:
+                yield line
+        if len(buffer) > max_bytes:
+            # Drop the rest of this line as it arrives instead of buffering it
+            overflow = True
+            buffer = b""
+    if overflow or len(buffer) > max_bytes:
+        yield None
+    elif buffer:
+        yield buffer
+
+def _decode(line: bytes, first: bool) -> str:
+    text = line.decode("utf-8").rstrip("\r")
+    return text.lstrip("\ufeff") if first else text
+
+def _parse_product(fields: dict) -> Tuple[Optional[ProductCreate], Optional[str]]:
+    """Validate one row; returns the product or the reason it was rejected."""
+    try:
+        product_data = ProductCreate.parse_obj(fields)
+    except ValidationError as error:
+        return None, "; ".join(
+            f"{'.'.join(map(str, detail['loc']))}: {detail['msg']}" for detail in error.errors()
+        )
+    error = _validation_error(product_data)
+    if error is not None:
+        return None, error
+    return product_data, None
+
+async def _ndjson_rows(lines: AsyncIterator[Optional[bytes]]) -> AsyncIterator[Tuple[int, Optional[ProductCreate], Optional[str]]]:
+    number = 0
+    async for line in lines:
+        number += 1
+        if line is None:
+            yield number, None, f"Line is longer than {IMPORT_MAX_LINE_BYTES} bytes"
+            continue
+        try:
+            text = _decode(line, number == 1)
+            if not text.strip():
+                continue
+            fields = json.loads(text)
+        except (UnicodeDecodeError, ValueError) as error:
+            yield number, None, f"Invalid JSON: {error}"
+            continue
+        if not isinstance(fields, dict):
+            yield number, None, "Each line must be a JSON object"
+            continue
+        yield (number, *_parse_product(fields))
+
+def _csv_fields(header: List[str], values: List[str]) -> dict:
+    fields = {name: value for name, value in zip(header, values) if value != ""}
+    if "image_urls" in fields:
+        fields["image_urls"] = [
+            url.strip() for url in fields["image_urls"].split(CSV_IMAGE_SEPARATOR) if url.strip()
+        ]
+    return fields
+
+async def _csv_rows(lines: AsyncIterator[Optional[bytes]]) -> AsyncIterator[Tuple[int, Optional[ProductCreate], Optional[str]]]:
+    header: Optional[List[str]] = None
+    number = 0
+    first = True
+    record = ""
+    async for line in lines:
+        if line is None:
+            record = ""
+            number += 1
+            yield number, None, f"Row is longer than {IMPORT_MAX_LINE_BYTES} bytes"
+            continue
+        try:
+            text = _decode(line, first)
+        except UnicodeDecodeError as error:
+            record = ""
+            number += 1
+            yield number, None, f"Invalid UTF-8: {error}"
+            continue
+        first = False
+        # A quoted field may span lines; gather lines until the quotes balance
+        record = f"{record}\n{text}" if record else text
+        if record.count('"') % 2:
+            if len(record) <= IMPORT_MAX_LINE_BYTES:
+                continue
+            record = ""
+            number += 1
+            yield number, None, f"Row is longer than {IMPORT_MAX_LINE_BYTES} bytes"
+            continue
+        complete, record = record, ""
+        if not complete.strip():
+            continue
+        try:
+            values = next(csv.reader([complete]))
+        except csv.Error as error:
+            number += 1
+            yield number, None, f"Invalid CSV: {error}"
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        number += 1
+        yield (number, *_parse_product(_csv_fields(header, values)))
+    if record:
+        number += 1
+        yield number, None, "Invalid CSV: unterminated quoted field"
+
+def _product_values(seller_id: int, product_data: ProductCreate) -> dict:
+    image_urls = list(dict.fromkeys(product_data.image_urls))
+    return {
+        "seller_id": seller_id,
+        "name": product_data.name,
+        "description": product_data.description,
+        "price": product_data.price,
+        "category": product_data.category,
+        "condition": product_data.condition,
+        "eco_rating": product_data.eco_rating,
+        "eco_details": product_data.eco_details,
+        "status": "active",
+        "primary_image_url": image_urls[0] if image_urls else None,
+        "image_count": len(image_urls),
+    }
+
+async def _insert_products(db: AsyncSession, seller_id: int, products: List[ProductCreate]) -> None:
+    """Insert products and their images with one multi-row INSERT each."""
+    product_ids = (await db.execute(
+        insert(Product).returning(Product.id, sort_by_parameter_order=True),
+        [_product_values(seller_id, product_data) for product_data in products]
+    )).scalars().all()
+    images = [
+        {"product_id": product_id, "image_url": image_url, "is_primary": i == 0}
+        for product_id, product_data in zip(product_ids, products)
+        for i, image_url in enumerate(dict.fromkeys(product_data.image_urls))
+    ]
+    if images:
+        await db.execute(insert(ProductImage), images)
+
+async def _flush_chunk(db: AsyncSession, seller_id: int, chunk: List[Tuple[int, ProductCreate]], report: _Report) -> None:
+    """Commit one chunk; if the database rejects it, retry row by row to find the bad rows."""
+    try:
+        await _insert_products(db, seller_id, [product_data for _, product_data in chunk])
+        await db.commit()
+        report.imported += len(chunk)
+        return
+    except DBAPIError:
+        await db.rollback()
+
+    for number, product_data in chunk:
+        try:
+            await _insert_products(db, seller_id, [product_data])
+            await db.commit()
+            report.imported += 1
+        except DBAPIError as error:
+            await db.rollback()
+            report.fail(number, f"Rejected by the database: {str(error.orig).splitlines()[0]}")
+
+@router.post("/api/products/import", response_model=ImportResponse)
+async def import_products(
+    request: Request,
+    file_format: Optional[str] = Query(None, alias="format", regex="^(ndjson|csv)$",
+                                       description="ndjson or csv; defaults from Content-Type"),
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Create many listings from an NDJSON or CSV file, reporting errors per row."""
+    if file_format is None:
+        file_format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+
+    lines = _lines(_body_chunks(request), IMPORT_MAX_LINE_BYTES)
+    rows = _csv_rows(lines) if file_format == "csv" else _ndjson_rows(lines)
+
+    report = _Report()
+    chunk: List[Tuple[int, ProductCreate]] = []
+    categories = set()
+    async for number, product_data, error in rows:
+        if product_data is None:
+            report.fail(number, error)
+            continue
+        chunk.append((number, product_data))
+        categories.add(product_data.category)
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            await _flush_chunk(db, current_user_id, chunk, report)
+            chunk = []
+    if chunk:
+        await _flush_chunk(db, current_user_id, chunk, report)
+
+    if report.imported:
+        # New products only appear in feeds and search, never in cached product pages
+        response_cache.invalidate("feed:*", "search", *(f"feed:{category}" for category in categories))
+
+    logger.info("Imported %d products for user %d (%d rows failed)", report.imported, current_user_id, report.failed)
+    return ImportResponse(imported=report.imported, failed=report.failed, errors=report.errors)
@@ -1,12 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.sql import Select
+from sqlalchemy import and_, delete, desc, insert, select, tuple_, update
 from typing import List, Optional
-from .database import get_db
+from .database import get_db, get_read_db
 from .models import Product, ProductImage, User
-from .auth import get_current_user
+from .auth import get_current_user_id
+from .search import apply_search, parse_terms
+from .cache import response_cache, feed_tags, product_tags
+from .replicas import read_from_replica
+from .views import view_counter
+from .pagination import decode_cursor, encode_cursor
 from pydantic import BaseModel
 from datetime import datetime
+import json
 
 router = APIRouter()
 
@@ -50,6 +60,8 @@ class ProductResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
     image_urls: List[str]
+    primary_image_url: Optional[str] = None
+    image_count: int = 0
     seller_name: str
 
     class Config:
@@ -74,146 +86,263 @@ CATEGORIES = [
     "Other"
 ]
 
+def _validation_error(product_data: ProductCreate) -> Optional[str]:
+    """Why a new listing is invalid, or None; shared by create_product and the bulk import."""
+    if product_data.category not in CATEGORIES:
+        return f"Invalid category. Must be one of: {', '.join(CATEGORIES)}"
+    if product_data.eco_rating is not None and not (1 <= product_data.eco_rating <= 5):
+        return "Eco rating must be between 1 and 5"
+    if product_data.price <= 0:
+        return "Price must be greater than 0"
+    return None
+
+def _with_feed_options(query: Select) -> Select:
+    """Eager-load what ProductResponse needs so a page costs a fixed number of queries.
+
+    The seller name comes in through a JOIN on the page query and the images
+    for the whole page through one extra SELECT ... WHERE product_id IN (...),
+    so hydration is two round trips no matter how large `limit` is.
+    """
+    return query.options(
+        joinedload(Product.seller).load_only(User.name),
+        selectinload(Product.images),
+    )
+
+async def _load_product(db: AsyncSession, product_id: int) -> Optional[Product]:
+    """Fetch a single product with its images and seller name.
+
+    Rows already in the session are refreshed, so server-generated columns
+    written by the caller's last commit are loaded rather than left expired.
+    """
+    result = await db.execute(
+        _with_feed_options(select(Product))
+        .where(Product.id == product_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
+async def _sync_images(db: AsyncSession, product: Product, image_urls: List[str]) -> None:
+    """Make the product's images match `image_urls`, the first being primary.
+    
+    Computed as a diff against the stored images: rows whose URL is still
+    wanted are kept (only their primary flag may change), the rest are
+    deleted and new URLs are inserted in one statement. Resubmitting the
+    same list writes nothing to product_images.
+    
+    Images are read back primary first, then by id, so the diff only works
+    when that gives `image_urls` back. A list that reorders the kept images
+    or puts a new URL before a kept one replaces every row instead.
+    """
+    wanted = list(dict.fromkeys(image_urls))
+    primary_url = wanted[0] if wanted else None
+    
+    kept = {}
+    stale = []
+    for image in (await db.execute(
+        select(ProductImage.id, ProductImage.image_url, ProductImage.is_primary)
+        .where(ProductImage.product_id == product.id)
+        .order_by(ProductImage.id)
+    )).all():
+        if image.image_url in wanted and image.image_url not in kept:
+            kept[image.image_url] = image
+        else:
+            stale.append(image.id)
+    
+    # Kept rows stay in id order and new ones get higher ids
+    stored_order = [url for url in [*kept, *(url for url in wanted if url not in kept)] if url != primary_url]
+    if wanted and [primary_url, *stored_order] != wanted:
+        stale.extend(image.id for image in kept.values())
+        kept = {}
+    
+    if stale:
+        await db.execute(
+            delete(ProductImage).where(ProductImage.id.in_(stale)),
+            execution_options={"synchronize_session": False}
+        )
+    
+    # Move the primary flag onto the first URL if it isn't there already
+    flipped = [image.id for url, image in kept.items() if bool(image.is_primary) != (url == primary_url)]
+    if flipped:
+        await db.execute(
+            update(ProductImage)
+            .where(ProductImage.id.in_(flipped))
+            .values(is_primary=ProductImage.image_url == primary_url),
+            execution_options={"synchronize_session": False}
+        )
+    
+    added = [url for url in wanted if url not in kept]
+    if added:
+        await db.execute(insert(ProductImage), [
+            {"product_id": product.id, "image_url": url, "is_primary": url == primary_url}
+            for url in added
+        ])
+    
+    product.primary_image_url = primary_url
+    product.image_count = len(wanted)
+
+def _to_response(product: Product) -> ProductResponse:
+    """Build the API representation of an already hydrated product."""
+    return ProductResponse(
+        id=product.id,
+        seller_id=product.seller_id,
+        name=product.name,
+        description=product.description,
+        price=float(product.price),
+        category=product.category,
+        condition=product.condition,
+        eco_rating=product.eco_rating,
+        eco_details=product.eco_details,
+        status=product.status,
+        views=product.views,
+        created_at=product.created_at,
+        updated_at=product.updated_at,
+        image_urls=[img.image_url for img in product.images],
+        primary_image_url=product.primary_image_url,
+        image_count=product.image_count,
+        seller_name=product.seller.name
+    )
+
 @router.get("/api/products", response_model=ProductListResponse)
-def get_products(
+async def get_products(
     category: Optional[str] = Query(None, description="Filter by category"),
-    q: Optional[str] = Query(None, description="Search query for product name"),
+    q: Optional[str] = Query(None, description="Full-text search query"),
     cursor: Optional[str] = Query(None, description="Pagination cursor"),
     limit: int = Query(20, ge=1, le=100, description="Number of products to return"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get a paginated list of products with optional filtering and search."""
     
+    # Serve from the response cache, keyed by the normalized filters
+    if category not in CATEGORIES:
+        category = None
+    cache_key, cached = response_cache.get(
+        "feed",
+        (category, " ".join(parse_terms(q)) if q else None, cursor, limit),
+        feed_tags(category, q)
+    )
+    if cached is not None:
+        return JSONResponse(cached)
+    
     # Build query
-    query = db.query(Product).filter(Product.status == "active")
+    query = _with_feed_options(select(Product)).where(Product.status == "active")
     
     # Apply category filter
-    if category and category in CATEGORIES:
-        query = query.filter(Product.category == category)
+    if category:
+        query = query.where(Product.category == category)
     
-    # Apply search filter
+    # Apply full-text search; matches are ordered by relevance, then by id
+    score = None
     if q:
-        query = query.filter(Product.name.ilike(f"%{q}%"))
+        query, score = apply_search(query, q, db.get_bind().dialect.name)
+        if score is not None:
+            query = query.add_columns(score)
     
-    # Apply cursor-based pagination
+    # Apply keyset pagination; ties are broken by id so no row is skipped or repeated
     if cursor:
         try:
-            cursor_time = datetime.fromisoformat(cursor)
-            query = query.filter(Product.created_at < cursor_time)
-        except ValueError:
+            position = decode_cursor(cursor)
+            if score is not None:
+                query = query.where(tuple_(score, Product.id) < tuple_(float(position["s"]), int(position["id"])))
+            else:
+                cursor_time = datetime.fromisoformat(position["t"])
+                query = query.where(
+                    tuple_(Product.created_at, Product.id) < tuple_(cursor_time, int(position["id"]))
+                )
+        except (ValueError, KeyError, TypeError):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid cursor format"
             )
     
-    # Order by created_at descending and limit
-    query = query.order_by(desc(Product.created_at)).limit(limit + 1)
-    
-    products = query.all()
+    # Order by relevance (when searching) or newest first, matching idx_products_feed*
+    if score is not None:
+        query = query.order_by(desc(score), desc(Product.id))
+    else:
+        query = query.order_by(desc(Product.created_at), desc(Product.id))
+    rows = (await db.execute(query.limit(limit + 1))).all()
     
     # Check if there are more products
-    has_more = len(products) > limit
+    has_more = len(rows) > limit
     if has_more:
-        products = products[:-1]
+        rows = rows[:-1]
+    
+    products = [row[0] for row in rows]
     
     # Get next cursor
     next_cursor = None
-    if has_more and products:
-        next_cursor = products[-1].created_at.isoformat()
+    if has_more and rows:
+        if score is not None:
+            last_product, last_score = rows[-1]
+            next_cursor = encode_cursor({"s": last_score, "id": last_product.id})
+        else:
+            last_product = products[-1]
+            next_cursor = encode_cursor({"t": last_product.created_at.isoformat(), "id": last_product.id})
     
     # Convert to response format
-    product_responses = []
-    for product in products:
-        # Get image URLs
-        image_urls = [img.image_url for img in product.images]
-        
-        product_responses.append(ProductResponse(
-            id=product.id,
-            seller_id=product.seller_id,
-            name=product.name,
-            description=product.description,
-            price=float(product.price),
-            category=product.category,
-            condition=product.condition,
-            eco_rating=product.eco_rating,
-            eco_details=product.eco_details,
-            status=product.status,
-            views=product.views,
-            created_at=product.created_at,
-            updated_at=product.updated_at,
-            image_urls=image_urls,
-            seller_name=product.seller.name
-        ))
-    
-    return ProductListResponse(
+    product_responses = [_to_response(product) for product in products]
+    
+    body = jsonable_encoder(ProductListResponse(
         products=product_responses,
         next_cursor=next_cursor,
         has_more=has_more
-    )
+    ))
+    # Only primary reads are cached; a lagging replica's body could outlive the write it missed
+    if not read_from_replica(db):
+        response_cache.set(cache_key, body)
+    
+    return JSONResponse(body)
 
 @router.get("/api/products/{product_id}", response_model=ProductResponse)
-def get_product(product_id: int, db: Session = Depends(get_db)):
+async def get_product(product_id: int, db: AsyncSession = Depends(get_read_db)):
     """Get a specific product by ID."""
-    product = db.query(Product).filter(
-        and_(Product.id == product_id, Product.status == "active")
-    ).first()
-    
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Product not found"
+    cache_key, cached = response_cache.get("product", (product_id,), [f"product:{product_id}"])
+    if cached is None:
+        result = await db.execute(
+            _with_feed_options(select(Product)).where(
+                and_(Product.id == product_id, Product.status == "active")
+            )
         )
+        product = result.scalars().first()
+        
+        if not product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Product not found"
+            )
+        
+        cached = jsonable_encoder(_to_response(product))
+        if not read_from_replica(db):
+            response_cache.set(cache_key, cached)
     
-    # Increment view count
-    product.views += 1
-    db.commit()
-    
-    # Get image URLs
-    image_urls = [img.image_url for img in product.images]
+    # Views are buffered and written behind; show the stored count plus this worker's backlog
+    pending_views = view_counter.record(product_id)
     
-    return ProductResponse(
-        id=product.id,
-        seller_id=product.seller_id,
-        name=product.name,
-        description=product.description,
-        price=float(product.price),
-        category=product.category,
-        condition=product.condition,
-        eco_rating=product.eco_rating,
-        eco_details=product.eco_details,
-        status=product.status,
-        views=product.views,
-        created_at=product.created_at,
-        updated_at=product.updated_at,
-        image_urls=image_urls,
-        seller_name=product.seller.name
-    )
+    return JSONResponse({**cached, "views": cached["views"] + pending_views})
 
 @router.post("/api/products", response_model=ProductResponse)
-def create_product(
+async def create_product(
     product_data: ProductCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Create a new product."""
+    """Create a new product.
     
-    # Validate category
-    if product_data.category not in CATEGORIES:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid category. Must be one of: {', '.join(CATEGORIES)}"
-        )
+    The product and all of its images are written in one transaction, the
+    images with a single multi-row INSERT.
+    """
     
-    # Validate eco_rating
-    if product_data.eco_rating is not None and not (1 <= product_data.eco_rating <= 5):
+    error = _validation_error(product_data)
+    if error is not None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Eco rating must be between 1 and 5"
+            detail=error
         )
     
+    image_urls = list(dict.fromkeys(product_data.image_urls))
+    
     # Create product
     product = Product(
-        seller_id=current_user.id,
+        seller_id=current_user_id,
         name=product_data.name,
         description=product_data.description,
         price=product_data.price,
@@ -221,55 +350,36 @@ def create_product(
         condition=product_data.condition,
         eco_rating=product_data.eco_rating,
         eco_details=product_data.eco_details,
-        status="active"
+        status="active",
+        primary_image_url=image_urls[0] if image_urls else None,
+        image_count=len(image_urls)
     )
     
     db.add(product)
-    db.commit()
-    db.refresh(product)
-    
-    # Add images
-    for i, image_url in enumerate(product_data.image_urls):
-        image = ProductImage(
-            product_id=product.id,
-            image_url=image_url,
-            is_primary=(i == 0)  # First image is primary
-        )
-        db.add(image)
+    await db.flush()
     
-    db.commit()
+    # Add images; the first one is primary
+    if image_urls:
+        await db.execute(insert(ProductImage), [
+            {"product_id": product.id, "image_url": image_url, "is_primary": i == 0}
+            for i, image_url in enumerate(image_urls)
+        ])
     
-    # Get image URLs
-    image_urls = [img.image_url for img in product.images]
+    await db.commit()
+    response_cache.invalidate(*product_tags(product.id, product.category))
     
-    return ProductResponse(
-        id=product.id,
-        seller_id=product.seller_id,
-        name=product.name,
-        description=product.description,
-        price=float(product.price),
-        category=product.category,
-        condition=product.condition,
-        eco_rating=product.eco_rating,
-        eco_details=product.eco_details,
-        status=product.status,
-        views=product.views,
-        created_at=product.created_at,
-        updated_at=product.updated_at,
-        image_urls=image_urls,
-        seller_name=product.seller.name
-    )
+    return _to_response(await _load_product(db, product.id))
 
 @router.put("/api/products/{product_id}", response_model=ProductResponse)
-def update_product(
+async def update_product(
     product_id: int,
     product_data: ProductUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
 ):
     """Update a product (owner only)."""
     
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     
     if not product:
         raise HTTPException(
@@ -278,12 +388,14 @@ def update_product(
         )
     
     # Check ownership
-    if product.seller_id != current_user.id:
+    if product.seller_id != current_user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to update this product"
         )
     
+    previous_category = product.category
+    
     # Update fields
     if product_data.name is not None:
         product.name = product_data.name
@@ -310,53 +422,24 @@ def update_product(
     if product_data.eco_details is not None:
         product.eco_details = product_data.eco_details
     
-    # Update images if provided
+    # Update images if provided, rewriting only the rows that change
     if product_data.image_urls is not None:
-        # Delete existing images
-        db.query(ProductImage).filter(ProductImage.product_id == product_id).delete()
-        
-        # Add new images
-        for i, image_url in enumerate(product_data.image_urls):
-            image = ProductImage(
-                product_id=product.id,
-                image_url=image_url,
-                is_primary=(i == 0)
-            )
-            db.add(image)
+        await _sync_images(db, product, product_data.image_urls)
     
-    db.commit()
-    db.refresh(product)
+    await db.commit()
+    response_cache.invalidate(*product_tags(product.id, previous_category, product.category))
     
-    # Get image URLs
-    image_urls = [img.image_url for img in product.images]
-    
-    return ProductResponse(
-        id=product.id,
-        seller_id=product.seller_id,
-        name=product.name,
-        description=product.description,
-        price=float(product.price),
-        category=product.category,
-        condition=product.condition,
-        eco_rating=product.eco_rating,
-        eco_details=product.eco_details,
-        status=product.status,
-        views=product.views,
-        created_at=product.created_at,
-        updated_at=product.updated_at,
-        image_urls=image_urls,
-        seller_name=product.seller.name
-    )
+    return _to_response(await _load_product(db, product.id))
 
 @router.delete("/api/products/{product_id}")
-def delete_product(
+async def delete_product(
     product_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete a product (owner only)."""
     
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     
     if not product:
         raise HTTPException(
@@ -365,7 +448,7 @@ def delete_product(
         )
     
     # Check ownership
-    if product.seller_id != current_user.id:
+    if product.seller_id != current_user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to delete this product"
@@ -373,11 +456,19 @@ def delete_product(
     
     # Mark as deleted instead of actually deleting
     product.status = "deleted"
-    db.commit()
+    await db.commit()
+    response_cache.invalidate(*product_tags(product.id, product.category))
     
     return {"message": "Product deleted successfully"}
 
+# The category list is static, so encode its response body once
+_CATEGORIES_BODY = json.dumps({"categories": CATEGORIES}).encode()
+
 @router.get("/api/categories")
 def get_categories():
     """Get list of available product categories."""
-    return {"categories": CATEGORIES}
+    return Response(
+        content=_CATEGORIES_BODY,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
@@ -0,0 +1,151 @@
+"""Per-request SQL profiling and N+1 detection.
+
+QueryProfilerMiddleware gives each request a QueryProfile that the engine
+event listeners below fill in: how many statements ran, the time spent in
+them, and how often each statement shape repeated. A shape is the SQL text
+with placeholder lists collapsed, so the same lookup with different
+parameters counts as one shape. A shape run N_PLUS_ONE_THRESHOLD or more
+times in one request is logged as a suspected N+1 loop. With DEBUG on, the
+figures are also sent back in a Server-Timing header, which browser dev
+tools show next to the request:
+
+    Server-Timing: db;dur=4.21;desc="6 queries", app;dur=9.87
+
+`count_queries` captures statements process-wide instead of per request;
+tests use it (through the `max_queries` fixture) to pin query budgets.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+# Profiler settings
+QUERY_PROFILER = os.getenv("QUERY_PROFILER", "true").lower() in ("1", "true", "yes")
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true", "yes")
+
+# A parenthesised list of placeholders in any DBAPI paramstyle: (?, ?), ($1, $2), (%(a)s), (:a)
+_PLACEHOLDER = r"(?:\?|\$\d+|%\(\w+\)s|%s|:\w+)"
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+_profile: ContextVar[Optional["QueryProfile"]] = ContextVar("query_profile", default=None)
+
+def statement_shape(statement: str) -> str:
+    """The statement with whitespace normalized and placeholder lists collapsed."""
+    return _PLACEHOLDER_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+def current_profile() -> Optional["QueryProfile"]:
+    """The profile of the request being served, if it is being profiled."""
+    return _profile.get()
+
+class QueryProfile:
+    """Statements run on behalf of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> List[tuple]:
+        """(shape, count) for every shape run at least `threshold` times, most frequent first."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _profile.get() is not None:
+        context._profiler_started = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    profile = _profile.get()
+    started = getattr(context, "_profiler_started", None)
+    if profile is not None and started is not None:
+        profile.record(statement, time.perf_counter() - started)
+
+class QueryProfilerMiddleware:
+    """Profiles the SQL each HTTP request runs and flags repeated statement shapes."""
+
+    def __init__(self, app, enabled: bool = QUERY_PROFILER, server_timing: bool = DEBUG,
+                 threshold: int = N_PLUS_ONE_THRESHOLD):
+        self.app = app
+        self.enabled = enabled
+        self.server_timing = server_timing
+        self.threshold = threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+        token = _profile.set(profile)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and self.server_timing:
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "server-timing",
+                    f'db;dur={profile.duration * 1000:.2f};desc="{profile.count} queries", '
+                    f"app;dur={(time.perf_counter() - started) * 1000:.2f}",
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _profile.reset(token)
+            for shape, count in profile.repeated(self.threshold):
+                logger.warning(
+                    "Suspected N+1 on %s %s: %d runs of %s",
+                    scope["method"], scope["path"], count, shape[:500],
+                )
+
+class QueryCapture:
+    """Statements seen by count_queries()."""
+
+    def __init__(self):
+        self.statements: List[str] = []
+        self._lock = threading.Lock()
+
+    def add(self, statement: str) -> None:
+        with self._lock:
+            self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def __len__(self) -> int:
+        return self.count
+
+@contextmanager
+def count_queries() -> Iterator[QueryCapture]:
+    """Capture every statement any engine runs inside the block, from any thread."""
+    capture = QueryCapture()
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        capture.add(statement)
+
+    event.listen(Engine, "before_cursor_execute", listener)
+    try:
+        yield capture
+    finally:
+        event.remove(Engine, "before_cursor_execute", listener)
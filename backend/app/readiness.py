@@ -0,0 +1,72 @@
+"""Readiness: whether this process can serve traffic.
+
+The schema belongs to the Alembic migrations in migrations/; the app never
+creates or alters tables. Run `alembic upgrade head` once per deploy, before
+the new version starts. A worker is ready when the primary database answers
+and its schema is at least at the newest migration this build ships with:
+
+    ready        alembic_version is this build's head, or a revision this
+                 build doesn't know (a later deploy migrated ahead of it;
+                 migrations are kept backward compatible)
+    not ready    the database is unreachable, has never been migrated, or is
+                 at an older revision than this build needs
+
+The check is one small query. It runs at startup, where a schema that is
+behind stops the worker from booting, and on every GET /ready.
+"""
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Tuple
+
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .database import async_engine
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+@lru_cache(maxsize=1)
+def known_revisions() -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """(head revisions, every revision) of the migrations this build ships with."""
+    script = ScriptDirectory(MIGRATIONS_DIR)
+    return frozenset(script.get_heads()), frozenset(rev.revision for rev in script.walk_revisions())
+
+async def check_readiness(engine: AsyncEngine = async_engine) -> Dict[str, Any]:
+    """Whether the database is reachable and migrated far enough for this build."""
+    heads, revisions = known_revisions()
+    result: Dict[str, Any] = {"ready": False, "reachable": True, "revision": None, "expected": sorted(heads)}
+    try:
+        async with engine.connect() as conn:
+            try:
+                current = set((await conn.execute(text("SELECT version_num FROM alembic_version"))).scalars())
+            except DBAPIError:
+                result["detail"] = "Database has not been migrated; run `alembic upgrade head`"
+                return result
+    except (DBAPIError, OSError) as error:
+        result["reachable"] = False
+        result["detail"] = f"Database unreachable: {error}"
+        return result
+
+    result["revision"] = sorted(current)
+    if not current:
+        result["detail"] = "Database has not been migrated; run `alembic upgrade head`"
+    elif current & heads or not current <= revisions:
+        result["ready"] = True
+    else:
+        result["detail"] = "Database schema is behind this build; run `alembic upgrade head`"
+    return result
+
+async def startup_check(engine: AsyncEngine = async_engine) -> None:
+    """Refuse to start on a schema that is behind; an unreachable database is only logged."""
+    result = await check_readiness(engine)
+    if result["ready"]:
+        return
+    if not result["reachable"]:
+        logger.warning("%s; /ready reports 503 until it answers", result["detail"])
+        return
+    raise RuntimeError(f"{result['detail']} (at {result['revision']}, expected {result['expected']})")
@@ -0,0 +1,239 @@
+"""Read-replica routing.
+
+Read-only endpoints take their session from `get_read_db`, which binds
+SELECTs to a replica chosen round-robin among the healthy ones and
+everything else (flushes, UPDATE/DELETE/INSERT, SELECT ... FOR UPDATE) to
+the primary. A session that has written keeps reading from the primary.
+
+Replicas lag, so a client that has just written is pinned to the primary
+for REPLICA_STICKY_SECONDS, which should exceed typical replication lag.
+A successful non-GET request records the time against the user in its
+bearer token (in the CACHE_URL backend, so every worker sees it; per process
+without one), and that user's reads skip the replicas until the window ends.
+This works for the SPA, which sends a token but no cookies to the API.
+The request also sets a short-lived cookie that does the same for clients
+without a token that keep cookies. Other
+clients can see replica data up to the replication lag old. Responses read
+from a replica are never put in the response cache (see `read_from_replica`):
+a lagging replica read stored under tag versions a write has just bumped would
+be served to everyone, the writer included, for RESPONSE_CACHE_TTL.
+"""
+import asyncio
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import cookie_parser
+
+from .cache import CACHE_URL, LocalBackend, RedisBackend
+
+logger = logging.getLogger(__name__)
+
+# Routing settings
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "10"))
+
+PRIMARY_COOKIE = "db_primary_until"
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+_prefer_primary: ContextVar[bool] = ContextVar("prefer_primary", default=False)
+
+# Users who wrote within the sticky window, shared by every worker when CACHE_URL is set
+recent_writers = RedisBackend(CACHE_URL, prefix="ecofinds:primary:") if CACHE_URL else LocalBackend()
+
+def _bearer_user_id(scope) -> Optional[int]:
+    """The user a request's bearer token was issued for, if it carries a valid one."""
+    authorization = Headers(scope=scope).get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    # Imported here: auth imports app.database, which imports this module
+    from .auth import _decode_user_id
+    try:
+        return _decode_user_id(authorization[7:])
+    except HTTPException:
+        return None
+
+class RoutingSession(Session):
+    """Session that sends plain reads to `replica` and everything else to `primary`."""
+
+    def __init__(self, primary: Engine, replica: Optional[Engine] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.primary = primary
+        self.replica = replica
+        self._wrote = False
+        # Whether any statement has been sent to the replica
+        self.used_replica = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.replica is None or self._wrote:
+            return self.primary
+        if self._flushing or not isinstance(clause, Select) or clause._for_update_arg is not None:
+            # Read-your-writes within the session: stay on the primary from here on
+            self._wrote = True
+            return self.primary
+        self.used_replica = True
+        return self.replica
+
+def read_from_replica(db: AsyncSession) -> bool:
+    """Whether any of this session's reads went to a replica, so its results may lag."""
+    return getattr(db.sync_session, "used_replica", False)
+
+class ReplicaSet:
+    """Round-robin over replica engines, skipping those that failed their last health check."""
+
+    def __init__(self, engines: List[AsyncEngine], check_interval: float = REPLICA_CHECK_INTERVAL):
+        self.engines = engines
+        self.check_interval = check_interval
+        self._healthy: Dict[int, bool] = {index: True for index in range(len(engines))}
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        for index, engine in enumerate(engines):
+            event.listen(engine.sync_engine, "handle_error", self._on_error(index))
+
+    def _on_error(self, index: int):
+        def handle_error(context) -> None:
+            # A dropped connection takes the replica out until the next check passes
+            if context.is_disconnect:
+                self.mark(index, healthy=False)
+        return handle_error
+
+    def mark(self, index: int, healthy: bool) -> None:
+        with self._lock:
+            if self._healthy[index] != healthy:
+                logger.warning("Read replica %d is %s", index, "healthy" if healthy else "unhealthy")
+            self._healthy[index] = healthy
+
+    def choose(self) -> Optional[AsyncEngine]:
+        """The next healthy replica, or None when there are none to use."""
+        with self._lock:
+            for _ in range(len(self.engines)):
+                index = next(self._turn) % len(self.engines)
+                if self._healthy[index]:
+                    return self.engines[index]
+        return None
+
+    def status(self) -> List[bool]:
+        with self._lock:
+            return [self._healthy[index] for index in range(len(self.engines))]
+
+    async def check(self) -> None:
+        """Ping every replica and update its health."""
+        for index, engine in enumerate(self.engines):
+            try:
+                async with engine.connect() as connection:
+                    await connection.execute(text("SELECT 1"))
+            except Exception:
+                logger.exception("Health check failed for read replica %d", index)
+                self.mark(index, healthy=False)
+            else:
+                self.mark(index, healthy=True)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+    def start(self) -> None:
+        """Start the periodic health check task on the running event loop."""
+        if self._task is None and self.engines:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the health checks and close the replica pools."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for engine in self.engines:
+            await engine.dispose()
+
+class ReadRouter:
+    """Hands out sessions for read-only endpoints."""
+
+    def __init__(self, primary: AsyncEngine, replicas: ReplicaSet):
+        self.primary = primary
+        self.replicas = replicas
+        self._sessions = async_sessionmaker(
+            sync_session_class=RoutingSession,
+            expire_on_commit=False,
+            autoflush=False,
+        )
+
+    def session(self) -> AsyncSession:
+        replica = None if _prefer_primary.get() else self.replicas.choose()
+        return self._sessions(
+            primary=self.primary.sync_engine,
+            replica=replica.sync_engine if replica is not None else None,
+        )
+
+class StickyPrimaryMiddleware:
+    """Pins a user's (or cookie-keeping client's) reads to the primary for a while after it writes.
+
+    Without an explicit `writers` backend the module's `recent_writers` is
+    used, looked up per request so it can be swapped out.
+    """
+
+    def __init__(self, app, window: float = REPLICA_STICKY_SECONDS, writers=None):
+        self.app = app
+        self.window = window
+        self._writers = writers
+
+    @property
+    def writers(self):
+        return self._writers if self._writers is not None else recent_writers
+
+    def _sticky(self, scope) -> bool:
+        cookies = cookie_parser(dict(scope["headers"]).get(b"cookie", b"").decode("latin-1"))
+        try:
+            if float(cookies.get(PRIMARY_COOKIE, 0)) > time.time():
+                return True
+        except ValueError:
+            pass
+        user_id = _bearer_user_id(scope)
+        return user_id is not None and self.writers.get(f"user:{user_id}") is not None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.window <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] in SAFE_METHODS:
+            token = _prefer_primary.set(self._sticky(scope))
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _prefer_primary.reset(token)
+            return
+
+        user_id = _bearer_user_id(scope)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                if user_id is not None:
+                    self.writers.set(f"user:{user_id}", f"{time.time():.3f}", self.window)
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "set-cookie",
+                    f"{PRIMARY_COOKIE}={time.time() + self.window:.3f}; "
+                    f"Max-Age={math.ceil(self.window)}; Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,63 @@
+"""Full-text product search.
+
+On Postgres products carry a stored, weighted `search_vector` tsvector with a
+GIN index over it; on SQLite an FTS5 external-content table `products_fts`
+is kept in sync by triggers. Both are created by migration 0001; the models
+don't declare them.
+Searches match every term as a prefix and are ranked by relevance, with
+higher scores first on both backends.
+"""
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, false, func, literal_column, table, column, text
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import ColumnElement
+
+from .models import Product
+
+# Text search configuration used for the Postgres search_vector column
+SEARCH_CONFIG = "english"
+
+# Ignore anything past this many terms so a pasted paragraph can't blow up the query
+MAX_TERMS = 8
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+_products_fts = table("products_fts", column("rowid"), column("rank"))
+
+def parse_terms(q: str) -> List[str]:
+    """Split a raw search string into lowercase word terms."""
+    return _TERM_RE.findall(q.lower())[:MAX_TERMS]
+
+def _postgres_search(query: Select, terms: List[str]) -> Tuple[Select, ColumnElement]:
+    # Terms are \w+ only, so they are safe to splice into to_tsquery syntax
+    ts_query = func.to_tsquery(SEARCH_CONFIG, " & ".join(f"{term}:*" for term in terms))
+    search_vector = literal_column("products.search_vector")
+    query = query.filter(search_vector.op("@@")(ts_query))
+    return query, func.ts_rank(search_vector, ts_query)
+
+def _sqlite_search(query: Select, terms: List[str]) -> Tuple[Select, ColumnElement]:
+    match = " ".join('"{}"*'.format(term) for term in terms)
+    query = query.join(_products_fts, _products_fts.c.rowid == Product.id).filter(
+        text("products_fts MATCH :fts_match").bindparams(fts_match=match)
+    )
+    # FTS5 rank is bm25(), where lower means more relevant
+    return query, -_products_fts.c.rank
+
+def apply_search(query: Select, q: str, dialect_name: str) -> Tuple[Select, Optional[ColumnElement]]:
+    """Restrict a Product select to matches for `q`.
+
+    Returns the filtered select and a relevance score expression (higher is
+    better), or no score when `q` contains no searchable terms, in which
+    case the select matches nothing.
+    """
+    terms = parse_terms(q)
+    if not terms:
+        return query.filter(false()), None
+    if dialect_name == "postgresql":
+        return _postgres_search(query, terms)
+    if dialect_name == "sqlite":
+        return _sqlite_search(query, terms)
+    # Fallback for backends without a full-text index
+    return query.filter(and_(*(Product.name.ilike(f"%{term}%") for term in terms))), None
@@ -0,0 +1,108 @@
+"""Write-behind product view counter.
+
+Product detail reads only record a view in memory; each worker flushes its
+buffered counts to the database every VIEW_FLUSH_INTERVAL seconds with one
+bulk UPDATE, and once more on shutdown. A crash loses at most one interval
+of views, so the interval is the loss window.
+"""
+import asyncio
+import logging
+import os
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+from sqlalchemy import case, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import response_cache
+from .database import AsyncSessionLocal
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+VIEW_FLUSH_INTERVAL = float(os.getenv("VIEW_FLUSH_INTERVAL", "5"))
+
+# Keep each UPDATE's CASE expression and IN list to a reasonable size
+FLUSH_BATCH_SIZE = 500
+
+class ViewCounter:
+    """Buffers view increments per product and writes them in batches."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._pending: Counter = Counter()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, product_id: int) -> int:
+        """Count one view; returns the views buffered for the product so far."""
+        with self._lock:
+            self._pending[product_id] += 1
+            return self._pending[product_id]
+
+    def discard(self) -> None:
+        """Drop buffered views without writing them (used by tests and forked workers)."""
+        with self._lock:
+            self._pending.clear()
+
+    async def flush(self, db: Optional[AsyncSession] = None) -> int:
+        """Write all buffered views to the database; returns how many were written."""
+        with self._lock:
+            counts: Dict[int, int] = dict(self._pending)
+            self._pending.clear()
+        if not counts:
+            return 0
+
+        session = db or AsyncSessionLocal()
+        try:
+            ids = list(counts)
+            for start in range(0, len(ids), FLUSH_BATCH_SIZE):
+                batch = {product_id: counts[product_id] for product_id in ids[start:start + FLUSH_BATCH_SIZE]}
+                await session.execute(
+                    update(Product)
+                    .where(Product.id.in_(list(batch)))
+                    # Keep updated_at: views aren't an edit, and incremental exports key on it
+                    .values(views=Product.views + case(batch, value=Product.id, else_=0), updated_at=Product.updated_at),
+                    execution_options={"synchronize_session": False}
+                )
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            # Put the counts back so the next flush retries them
+            with self._lock:
+                self._pending.update(counts)
+            raise
+        finally:
+            if db is None:
+                await session.close()
+
+        # Cached detail bodies hold the pre-flush count; drop them so they don't go backwards
+        response_cache.invalidate(*(f"product:{product_id}" for product_id in counts))
+        return sum(counts.values())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush product view counts")
+
+    def start(self) -> None:
+        """Start the periodic flush task on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the periodic task and flush whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+view_counter = ViewCounter(VIEW_FLUSH_INTERVAL)
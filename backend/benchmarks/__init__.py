@@ -0,0 +1,20 @@
+"""Load tests and benchmarks.
+
+Two steps, run from the backend directory against the database in
+DATABASE_URL (SQLite or Postgres, already migrated with `alembic upgrade head`):
+
+    python -m benchmarks.seed --users 1000 --products 50000 --reset
+    python -m benchmarks.load --url http://localhost:8000 --concurrency 32 --duration 60
+
+`seed` fills the database with synthetic users, products with images,
+carts and past orders, and writes a manifest (benchmark_manifest.json) of
+the accounts and product ids it created. The same --seed and sizes always
+produce the same catalogue. `load` logs in as the seeded users and drives a
+weighted mix of the feed, search, product detail, add-to-cart, checkout and
+order history endpoints from a fixed number of concurrent clients, then
+prints throughput and p50/p95/p99 latency per endpoint as JSON.
+
+Checkouts sell products, so reseed with --reset before runs you compare.
+Feed and product detail responses are cached (RESPONSE_CACHE_TTL); set it
+to 0 on the server to measure the database rather than the cache.
+"""
@@ -0,0 +1,317 @@
+"""Fixed-concurrency load driver.
+
+    python -m benchmarks.load --url http://localhost:8000 --concurrency 32 --duration 60
+
+Each of --concurrency clients logs in as its own seeded user and then runs
+operations back to back, picked at random with the --mix weights:
+
+    feed             GET /api/products, sometimes filtered by category or on page two
+    search           GET /api/products?q=...
+    product_detail   GET /api/products/{id}
+    add_to_cart      POST /api/cart
+    checkout         POST /api/orders (after adding a product if the cart is empty)
+    order_history    GET /api/orders
+
+Every client has its own connection and cookie jar, so the sticky-primary
+cookie one user earns by writing doesn't pin the others to the primary.
+Products are drawn from the seeded active catalogue, and a product leaves it
+once a client buys it (or finds it gone), so later picks stay buyable.
+
+Only requests started after --warmup seconds are counted. The report gives
+per-endpoint throughput, latency percentiles (milliseconds) and status
+counts, and the same totals over every endpoint. Housekeeping requests
+(logins, clearing a cart whose checkout failed) run but are not counted.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from contextlib import AsyncExitStack
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from .seed import MANIFEST_PATH
+
+DEFAULT_MIX = {
+    "feed": 35,
+    "search": 20,
+    "product_detail": 25,
+    "add_to_cart": 10,
+    "checkout": 5,
+    "order_history": 5,
+}
+
+SHIPPING = {
+    "shipping_address": "1 Benchmark Way",
+    "shipping_city": "Springfield",
+    "shipping_state": "CA",
+    "shipping_zip": "90210",
+    "shipping_country": "US",
+}
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """'feed=3,search=1' -> {'feed': 3, 'search': 1}"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[name] = int(weight or 1)
+    return mix
+
+class Recorder:
+    """Latencies and statuses of the counted requests."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.counting = False
+
+    def record(self, name: str, started: float, status: str) -> None:
+        if not self.counting:
+            return
+        self.samples.setdefault(name, []).append(time.perf_counter() - started)
+        statuses = self.statuses.setdefault(name, {})
+        statuses[status] = statuses.get(status, 0) + 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        def summary(samples: List[float], statuses: Dict[str, int]) -> Dict[str, Any]:
+            latencies = sorted(sample * 1000 for sample in samples)
+            return {
+                "requests": len(latencies),
+                "throughput": round(len(latencies) / elapsed, 2) if elapsed else None,
+                "errors": sum(count for status, count in statuses.items() if not status.startswith(("2", "3"))),
+                "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else None,
+                **{
+                    f"p{int(fraction * 100)}_ms": round(value, 3) if value is not None else None
+                    for fraction, value in ((q, percentile(latencies, q)) for q in (0.5, 0.95, 0.99))
+                },
+                "max_ms": round(latencies[-1], 3) if latencies else None,
+                "statuses": dict(sorted(statuses.items())),
+            }
+
+        total_statuses: Dict[str, int] = {}
+        for statuses in self.statuses.values():
+            for status, count in statuses.items():
+                total_statuses[status] = total_statuses.get(status, 0) + count
+        return {
+            "total": summary([sample for samples in self.samples.values() for sample in samples], total_statuses),
+            "endpoints": {name: summary(self.samples[name], self.statuses[name]) for name in sorted(self.samples)},
+        }
+
+class Catalogue:
+    """The products still for sale, shared by every client."""
+
+    def __init__(self, product_ids: List[int], sellers: List[int]):
+        self.product_ids = list(product_ids)
+        self.sellers = list(sellers)
+        self.positions = {product_id: index for index, product_id in enumerate(self.product_ids)}
+
+    def pick(self, rng: random.Random, buyer: Optional[int] = None) -> Optional[int]:
+        """A random product, not one of `buyer`'s own; None once nothing is left."""
+        for _ in range(100):
+            if not self.product_ids:
+                return None
+            index = rng.randrange(len(self.product_ids))
+            if self.sellers[index] != buyer:
+                return self.product_ids[index]
+        return None
+
+    def discard(self, product_id: int) -> None:
+        """Drop a sold product by moving the last one into its slot."""
+        index = self.positions.pop(product_id, None)
+        if index is None:
+            return
+        last_id, last_seller = self.product_ids.pop(), self.sellers.pop()
+        if last_id != product_id:
+            self.product_ids[index], self.sellers[index] = last_id, last_seller
+            self.positions[last_id] = index
+
+class VirtualUser:
+    """One logged-in client running operations back to back."""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, manifest: Dict[str, Any],
+                 catalogue: Catalogue, user_index: int, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.manifest = manifest
+        self.catalogue = catalogue
+        self.user_index = user_index
+        self.email = manifest["users"][user_index]
+        self.rng = rng
+        self.headers: Dict[str, str] = {}
+        self.cart: List[int] = []
+
+    async def request(self, name: Optional[str], method: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers=self.headers, **kwargs)
+        except httpx.HTTPError as error:
+            if name is not None:
+                self.recorder.record(name, started, type(error).__name__)
+            return None
+        if name is not None:
+            self.recorder.record(name, started, str(response.status_code))
+        return response
+
+    async def login(self) -> None:
+        response = await self.client.post(
+            "/api/auth/login", json={"email": self.email, "password": self.manifest["password"]}
+        )
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        # Start from an empty cart; seeded carts may hold products that have since sold
+        await self.clear_cart()
+
+    async def clear_cart(self) -> None:
+        response = await self.request(None, "GET", "/api/cart")
+        if response is not None and response.status_code == 200:
+            product_ids = [item["product_id"] for item in response.json()["items"]]
+            if product_ids:
+                await self.request(None, "POST", "/api/cart/batch", json={"remove": product_ids})
+        self.cart = []
+
+    def product_id(self, buying: bool = False) -> Optional[int]:
+        return self.catalogue.pick(self.rng, self.user_index if buying else None)
+
+    async def feed(self) -> None:
+        params: Dict[str, Any] = {"limit": 20}
+        if self.rng.random() < 0.5:
+            params["category"] = self.rng.choice(self.manifest["categories"])
+        response = await self.request("feed", "GET", "/api/products", params=params)
+        if response is not None and response.status_code == 200 and self.rng.random() < 0.3:
+            next_cursor = response.json().get("next_cursor")
+            if next_cursor:
+                await self.request("feed", "GET", "/api/products", params={**params, "cursor": next_cursor})
+
+    async def search(self) -> None:
+        terms = self.rng.sample(self.manifest["search_terms"], self.rng.randint(1, 2))
+        await self.request("search", "GET", "/api/products", params={"q": " ".join(terms), "limit": 20})
+
+    async def product_detail(self) -> None:
+        product_id = self.product_id()
+        if product_id is not None:
+            await self.request("product_detail", "GET", f"/api/products/{product_id}")
+
+    async def add_to_cart(self) -> None:
+        product_id = self.product_id(buying=True)
+        if product_id is None:
+            return
+        response = await self.request("add_to_cart", "POST", "/api/cart", json={"product_id": product_id})
+        if response is not None and response.status_code == 200:
+            self.cart.append(product_id)
+        elif response is not None and response.status_code == 404:
+            # Another client bought it
+            self.catalogue.discard(product_id)
+
+    async def checkout(self) -> None:
+        if not self.cart:
+            await self.add_to_cart()
+            if not self.cart:
+                return
+        response = await self.request("checkout", "POST", "/api/orders", json=SHIPPING)
+        if response is not None and response.status_code == 200:
+            for product_id in self.cart:
+                self.catalogue.discard(product_id)
+            self.cart = []
+        else:
+            # A product in the cart sold or is locked elsewhere; start over with an empty cart
+            await self.clear_cart()
+
+    async def order_history(self) -> None:
+        await self.request("order_history", "GET", "/api/orders", params={"limit": 10})
+
+    async def run(self, mix: Dict[str, int], deadline: float) -> None:
+        operations = [getattr(self, name) for name in mix]
+        weights = list(mix.values())
+        while time.perf_counter() < deadline:
+            await self.rng.choices(operations, weights)[0]()
+
+async def run(
+    make_client: Callable[[], httpx.AsyncClient],
+    manifest: Dict[str, Any],
+    concurrency: int = 16,
+    duration: float = 30,
+    warmup: float = 5,
+    mix: Optional[Dict[str, int]] = None,
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """Drive the mix from `concurrency` clients, each from `make_client()`, and return the report."""
+    mix = mix or DEFAULT_MIX
+    if concurrency > len(manifest["users"]):
+        raise ValueError(f"Only {len(manifest['users'])} seeded users for {concurrency} clients; seed more users")
+    recorder = Recorder()
+    catalogue = Catalogue(manifest["active_product_ids"], manifest["active_product_sellers"])
+    rng = random.Random(seed)
+    async with AsyncExitStack() as clients:
+        users = [
+            VirtualUser(await clients.enter_async_context(make_client()), recorder, manifest, catalogue,
+                        n, random.Random(rng.random()))
+            for n in range(concurrency)
+        ]
+        await asyncio.gather(*(user.login() for user in users))
+
+        started = time.perf_counter()
+        deadline = started + warmup + duration
+        tasks = [asyncio.create_task(user.run(mix, deadline)) for user in users]
+        await asyncio.sleep(warmup)
+        recorder.counting = True
+        counted_from = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - counted_from
+
+    return {
+        "database": manifest.get("database"),
+        "concurrency": concurrency,
+        "duration": round(elapsed, 3),
+        "warmup": warmup,
+        "seed": seed,
+        "mix": mix,
+        **recorder.report(elapsed),
+    }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Drive the API at fixed concurrency and report latencies as JSON.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="written by benchmarks.seed")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="seconds counted")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds run before counting")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="operation weights, e.g. feed=3,search=1 (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    with open(args.manifest) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    def make_client() -> httpx.AsyncClient:
+        # One request in flight per client, so one kept-alive connection each
+        limits = httpx.Limits(max_connections=1, max_keepalive_connections=1)
+        return httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30)
+
+    async def drive() -> Dict[str, Any]:
+        return await run(make_client, manifest, args.concurrency, args.duration, args.warmup, args.mix, args.seed)
+
+    report = asyncio.run(drive())
+    report["url"] = args.url
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output + "\n")
+    sys.stdout.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
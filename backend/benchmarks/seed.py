@@ -0,0 +1,255 @@
+"""Synthetic benchmark data.
+
+    python -m benchmarks.seed --users 1000 --products 50000 --reset
+
+Rows are written with multi-row INSERTs of SEED_BATCH_SIZE, so a catalogue
+of a few hundred thousand products takes seconds on Postgres. Every user
+shares one password (hashed once). Product names and descriptions are drawn
+from a small vocabulary so full-text searches have matches. Sellers and
+buyers are always different users, and every product in a seeded order is
+marked sold.
+"""
+import argparse
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Engine, create_engine, insert, inspect, text, update
+
+from app.auth import get_password_hash
+from app.cart_orders import ORDER_STATUSES
+from app.database import DATABASE_URL
+from app.models import Base, Cart, CartItem, Order, OrderItem, Product, ProductImage, User
+from app.products import CATEGORIES
+
+# Rows per multi-row INSERT
+SEED_BATCH_SIZE = 1000
+
+# Password of every seeded user
+PASSWORD = "Benchmark123"
+
+CONDITIONS = ["New", "Like New", "Good", "Fair"]
+
+ADJECTIVES = [
+    "recycled", "organic", "bamboo", "vintage", "handmade", "solar", "reusable", "compostable",
+    "refurbished", "upcycled", "natural", "wooden", "hemp", "biodegradable", "secondhand", "local",
+]
+
+NOUNS = {
+    "Electronics": ["laptop", "phone", "charger", "speaker", "headphones", "camera", "tablet", "lamp"],
+    "Clothing": ["jacket", "shirt", "jeans", "sweater", "dress", "scarf", "boots", "hat"],
+    "Home & Garden": ["planter", "chair", "table", "rug", "compost bin", "vase", "shelf", "blanket"],
+    "Books": ["novel", "cookbook", "atlas", "textbook", "poetry collection", "field guide", "biography", "comic"],
+    "Sports & Outdoors": ["bicycle", "tent", "backpack", "yoga mat", "kayak", "helmet", "water bottle", "skateboard"],
+    "Beauty & Health": ["soap", "shampoo bar", "toothbrush", "lotion", "razor", "hairbrush", "balm", "sponge"],
+    "Toys & Games": ["puzzle", "board game", "doll", "building blocks", "kite", "train set", "teddy bear", "yo-yo"],
+    "Automotive": ["seat cover", "roof rack", "bike carrier", "floor mat", "dash camera", "tyre pump", "sunshade", "toolkit"],
+    "Food & Beverages": ["coffee", "tea", "honey", "granola", "olive oil", "chocolate", "jam", "spice set"],
+    "Other": ["tote bag", "notebook", "umbrella", "wallet", "candle", "clock", "mirror", "basket"],
+}
+
+MANIFEST_PATH = "benchmark_manifest.json"
+
+def _batches(rows: List[Dict[str, Any]], size: int = SEED_BATCH_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def _insert_returning_ids(conn, model, rows: List[Dict[str, Any]]) -> List[int]:
+    """Insert rows in batches, returning their ids in row order."""
+    ids: List[int] = []
+    for batch in _batches(rows):
+        result = conn.execute(insert(model).returning(model.id, sort_by_parameter_order=True), batch)
+        ids.extend(row.id for row in result)
+    return ids
+
+def _insert(conn, model, rows: List[Dict[str, Any]]) -> None:
+    for batch in _batches(rows):
+        conn.execute(insert(model), batch)
+
+def reset(engine: Engine) -> None:
+    """Delete every row the app owns, keeping the schema."""
+    with engine.begin() as conn:
+        tables = [table.name for table in Base.metadata.sorted_tables]
+        if engine.dialect.name == "postgresql":
+            conn.execute(text(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE"))
+        else:
+            for table in reversed(Base.metadata.sorted_tables):
+                conn.execute(table.delete())
+
+def seed(
+    engine: Engine,
+    users: int = 100,
+    products: int = 2000,
+    max_images: int = 3,
+    cart_fraction: float = 0.3,
+    orders_per_user: int = 2,
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """Write the synthetic data set and return its manifest."""
+    if users < 2:
+        raise ValueError("At least two users are needed so buyers are never the seller")
+    if not inspect(engine).has_table(Product.__tablename__):
+        raise RuntimeError("The schema is missing; run `alembic upgrade head` first")
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    password_hash = get_password_hash(PASSWORD)
+
+    with engine.begin() as conn:
+        emails = [f"bench{n}@example.com" for n in range(users)]
+        user_ids = _insert_returning_ids(conn, User, [
+            {
+                "email": email,
+                "password_hash": password_hash,
+                "name": f"Bench User {n}",
+                "created_at": now - timedelta(days=rng.randint(0, 730)),
+            }
+            for n, email in enumerate(emails)
+        ])
+
+        product_rows = []
+        image_urls = []
+        for n in range(products):
+            category = rng.choice(CATEGORIES)
+            noun = rng.choice(NOUNS[category])
+            adjectives = rng.sample(ADJECTIVES, 2)
+            created_at = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+            urls = [f"https://images.example.com/products/{n}/{i}.jpg" for i in range(rng.randint(0, max_images))]
+            image_urls.append(urls)
+            product_rows.append({
+                "seller_id": rng.choice(user_ids),
+                "name": f"{adjectives[0].title()} {adjectives[1]} {noun}",
+                "description": f"A {adjectives[0]} {noun} made from {adjectives[1]} materials, "
+                               f"in {rng.choice(CONDITIONS).lower()} condition.",
+                "price": round(rng.uniform(1, 500), 2),
+                "category": category,
+                "condition": rng.choice(CONDITIONS),
+                "eco_rating": rng.choice([None, 1, 2, 3, 4, 5]),
+                "status": "active",
+                "views": rng.randint(0, 1000),
+                "primary_image_url": urls[0] if urls else None,
+                "image_count": len(urls),
+                "created_at": created_at,
+                "updated_at": created_at,
+            })
+        product_ids = _insert_returning_ids(conn, Product, product_rows)
+        _insert(conn, ProductImage, [
+            {"product_id": product_id, "image_url": url, "is_primary": i == 0}
+            for product_id, urls in zip(product_ids, image_urls)
+            for i, url in enumerate(urls)
+        ])
+
+        # Past orders, each for one to three products that are then sold
+        unsold = list(range(products))
+        rng.shuffle(unsold)
+        order_rows = []
+        order_products: List[List[int]] = []
+        for user_id in user_ids:
+            for _ in range(rng.randint(0, orders_per_user * 2)):
+                picked = []
+                wanted = rng.randint(1, 3)
+                for _ in range(wanted * 2):
+                    if not unsold or len(picked) == wanted:
+                        break
+                    index = unsold.pop()
+                    if product_rows[index]["seller_id"] == user_id:
+                        unsold.insert(0, index)
+                        continue
+                    picked.append(index)
+                if not picked:
+                    break
+                order_products.append(picked)
+                order_rows.append({
+                    "user_id": user_id,
+                    "status": rng.choice(ORDER_STATUSES),
+                    "total_amount": sum(product_rows[index]["price"] for index in picked),
+                    "shipping_address": f"{rng.randint(1, 999)} Green Street",
+                    "shipping_city": "Springfield",
+                    "shipping_state": "CA",
+                    "shipping_zip": f"{rng.randint(10000, 99999)}",
+                    "shipping_country": "US",
+                    "created_at": now - timedelta(seconds=rng.randint(0, 180 * 24 * 3600)),
+                })
+        order_ids = _insert_returning_ids(conn, Order, order_rows)
+        _insert(conn, OrderItem, [
+            {
+                "order_id": order_id,
+                "product_id": product_ids[index],
+                "quantity": 1,
+                "price_per_unit": product_rows[index]["price"],
+                "product_name": product_rows[index]["name"],
+                "product_image_url": product_rows[index]["primary_image_url"],
+                "product_category": product_rows[index]["category"],
+            }
+            for order_id, picked in zip(order_ids, order_products)
+            for index in picked
+        ])
+        sold_ids = [product_ids[index] for picked in order_products for index in picked]
+        for batch in _batches(sold_ids, 500):
+            conn.execute(update(Product).where(Product.id.in_(batch)).values(status="sold"))
+
+        # Open carts of still-active products
+        active = sorted(product_ids[index] for index in unsold)
+        sellers = {product_ids[index]: product_rows[index]["seller_id"] for index in unsold}
+        cart_users = rng.sample(user_ids, int(len(user_ids) * cart_fraction))
+        cart_ids = _insert_returning_ids(conn, Cart, [{"user_id": user_id} for user_id in cart_users])
+        cart_items = []
+        for cart_id, user_id in zip(cart_ids, cart_users):
+            for product_id in rng.sample(active, min(len(active), rng.randint(1, 3))):
+                if sellers[product_id] != user_id:
+                    cart_items.append({"cart_id": cart_id, "product_id": product_id, "quantity": 1})
+        _insert(conn, CartItem, cart_items)
+
+    user_indexes = {user_id: index for index, user_id in enumerate(user_ids)}
+    return {
+        "database": engine.dialect.name,
+        "seed": seed,
+        "password": PASSWORD,
+        "users": emails,
+        "active_product_ids": active,
+        # Index into "users" of each active product's seller, who can't buy it
+        "active_product_sellers": [user_indexes[sellers[product_id]] for product_id in active],
+        "categories": CATEGORIES,
+        "search_terms": sorted(ADJECTIVES + sorted({noun for nouns in NOUNS.values() for noun in nouns})),
+        "counts": {
+            "users": len(user_ids),
+            "products": len(product_ids),
+            "active_products": len(active),
+            "orders": len(order_ids),
+            "carts": len(cart_ids),
+        },
+    }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Fill the database with synthetic benchmark data.")
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--max-images", type=int, default=3, help="images per product are 0..N")
+    parser.add_argument("--cart-fraction", type=float, default=0.3, help="share of users with an open cart")
+    parser.add_argument("--orders-per-user", type=int, default=2, help="mean past orders per user")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="delete existing rows first")
+    parser.add_argument("--manifest", default=MANIFEST_PATH)
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    if args.reset:
+        reset(engine)
+    manifest = seed(
+        engine,
+        users=args.users,
+        products=args.products,
+        max_images=args.max_images,
+        cart_fraction=args.cart_fraction,
+        orders_per_user=args.orders_per_user,
+        seed=args.seed,
+    )
+    with open(args.manifest, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    json.dump(manifest["counts"], sys.stdout)
+    sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Production server settings: gunicorn managing uvicorn workers.
+
+    gunicorn app.main:app -c gunicorn.conf.py
+
+Run `alembic upgrade head` first: workers check the schema when they start
+and won't boot on an older one. The app is imported once in the master and
+forked into WEB_CONCURRENCY workers (default: one per CPU), each running its
+own event loop. After the fork every worker gets fresh connection pools and
+caches (app.main.init_worker) and starts its background tasks. A worker exits after MAX_REQUESTS requests,
+plus up to MAX_REQUESTS_JITTER so they don't all restart at once, and the
+master replaces it, which bounds memory growth.
+
+Workers only share the response cache and read-your-writes pins through
+CACHE_URL (Redis). Without it each worker would keep its own cache tag
+versions, and an update, delete or checkout handled by one worker would not
+invalidate the others. They would keep serving the old listing for up to
+RESPONSE_CACHE_TTL. So with more than one worker and no CACHE_URL, the
+response cache is turned off.
+
+On SIGTERM the master stops accepting connections and each worker finishes
+its in-flight requests and runs the shutdown handlers (flushing buffered
+views and metrics) for up to GRACEFUL_TIMEOUT seconds before it is killed.
+Give the container a longer stop timeout than that.
+"""
+import multiprocessing
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+preload_app = True
+
+# Worker recycling; 0 disables it
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+accesslog = "-"
+
+# Workers share their request metrics through METRICS_DIR; this runs before the
+# app is imported, so app.metrics picks the default up
+if workers > 1:
+    os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "ecofinds-metrics"))
+
+# Tag versions are per process without a shared backend, so invalidation can't reach other workers
+CACHE_DISABLED = workers > 1 and not os.getenv("CACHE_URL") and os.getenv("RESPONSE_CACHE_TTL") != "0"
+if CACHE_DISABLED:
+    os.environ["RESPONSE_CACHE_TTL"] = "0"
+
+def on_starting(server):
+    if CACHE_DISABLED:
+        server.log.warning("Response cache disabled: %d workers and no CACHE_URL to share invalidations", workers)
+    # Snapshots left by a previous run would be summed into this one's totals
+    from app.metrics import clear_snapshots
+    clear_snapshots(os.getenv("METRICS_DIR"))
+
+def child_exit(server, worker):
+    # Fold the exited worker's metrics into the dead workers' snapshot
+    from app.metrics import mark_process_dead
+    mark_process_dead(worker.pid, os.getenv("METRICS_DIR"))
+
+def post_fork(server, worker):
+    from app.main import init_worker
+    init_worker()
@@ -0,0 +1,173 @@
+"""Initial schema
+
+Matches the tables the app created with Base.metadata.create_all before
+migrations were introduced, including full-text search support. Databases
+created that way can be adopted with `alembic stamp 0001`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-09-06 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.models import db_now
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C') || "
+    "setweight(to_tsvector('english', coalesce(eco_details, '')), 'D')"
+)
+
+FTS_COLUMNS = "name, description, category, eco_details"
+
+
+def _timestamps():
+    return [
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=db_now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=db_now()),
+    ]
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('email', sa.String(255), nullable=False),
+        sa.Column('password_hash', sa.String(255), nullable=False),
+        sa.Column('name', sa.String(255), nullable=False),
+        sa.Column('bio', sa.Text()),
+        sa.Column('profile_image_url', sa.String(255)),
+        sa.Column('is_verified', sa.Boolean()),
+        *_timestamps(),
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+    op.create_table(
+        'products',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('seller_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('name', sa.String(255), nullable=False),
+        sa.Column('description', sa.Text(), nullable=False),
+        sa.Column('price', sa.DECIMAL(10, 2), nullable=False),
+        sa.Column('category', sa.String(50), nullable=False),
+        sa.Column('condition', sa.String(50), nullable=False),
+        sa.Column('eco_rating', sa.Integer()),
+        sa.Column('eco_details', sa.Text()),
+        sa.Column('status', sa.String(20)),
+        sa.Column('views', sa.Integer()),
+        *_timestamps(),
+        sa.CheckConstraint('eco_rating BETWEEN 1 AND 5', name='check_eco_rating'),
+        sa.CheckConstraint("status IN ('active', 'sold', 'draft', 'deleted')", name='check_status'),
+        sa.CheckConstraint('price > 0', name='positive_price'),
+    )
+    op.create_index('ix_products_id', 'products', ['id'])
+
+    op.create_table(
+        'product_images',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('image_url', sa.String(255), nullable=False),
+        sa.Column('is_primary', sa.Boolean()),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=db_now()),
+    )
+    op.create_index('ix_product_images_id', 'product_images', ['id'])
+
+    op.create_table(
+        'carts',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        *_timestamps(),
+    )
+    op.create_index('ix_carts_id', 'carts', ['id'])
+
+    op.create_table(
+        'cart_items',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('cart_id', sa.Integer(), sa.ForeignKey('carts.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('added_at', sa.DateTime(timezone=True), server_default=db_now()),
+        sa.CheckConstraint('quantity > 0', name='positive_quantity'),
+    )
+    op.create_index('ix_cart_items_id', 'cart_items', ['id'])
+
+    op.create_table(
+        'orders',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='SET NULL'), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('total_amount', sa.DECIMAL(10, 2), nullable=False),
+        sa.Column('shipping_address', sa.Text(), nullable=False),
+        sa.Column('shipping_city', sa.String(100), nullable=False),
+        sa.Column('shipping_state', sa.String(100), nullable=False),
+        sa.Column('shipping_zip', sa.String(20), nullable=False),
+        sa.Column('shipping_country', sa.String(100), nullable=False),
+        *_timestamps(),
+        sa.CheckConstraint("status IN ('processing', 'shipped', 'delivered', 'cancelled')", name='check_order_status'),
+    )
+    op.create_index('ix_orders_id', 'orders', ['id'])
+
+    op.create_table(
+        'order_items',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('order_id', sa.Integer(), sa.ForeignKey('orders.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='SET NULL'), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('price_per_unit', sa.DECIMAL(10, 2), nullable=False),
+        sa.CheckConstraint('quantity > 0', name='positive_quantity'),
+        sa.CheckConstraint('price_per_unit > 0', name='positive_price_per_unit'),
+    )
+    op.create_index('ix_order_items_id', 'order_items', ['id'])
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute(
+            f"ALTER TABLE products ADD COLUMN search_vector tsvector "
+            f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED"
+        )
+        op.execute("CREATE INDEX idx_products_search ON products USING GIN (search_vector)")
+    elif dialect == 'sqlite':
+        op.execute(
+            f"CREATE VIRTUAL TABLE products_fts USING fts5({FTS_COLUMNS}, "
+            f"content='products', content_rowid='id', tokenize='porter unicode61')"
+        )
+        op.execute(
+            f"CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN "
+            f"INSERT INTO products_fts(rowid, {FTS_COLUMNS}) "
+            f"VALUES (new.id, new.name, new.description, new.category, new.eco_details); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER products_fts_ad AFTER DELETE ON products BEGIN "
+            f"INSERT INTO products_fts(products_fts, rowid, {FTS_COLUMNS}) "
+            f"VALUES ('delete', old.id, old.name, old.description, old.category, old.eco_details); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER products_fts_au AFTER UPDATE OF {FTS_COLUMNS} ON products BEGIN "
+            f"INSERT INTO products_fts(products_fts, rowid, {FTS_COLUMNS}) "
+            f"VALUES ('delete', old.id, old.name, old.description, old.category, old.eco_details); "
+            f"INSERT INTO products_fts(rowid, {FTS_COLUMNS}) "
+            f"VALUES (new.id, new.name, new.description, new.category, new.eco_details); END"
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS products_fts")
+    op.drop_table('order_items')
+    op.drop_table('orders')
+    op.drop_table('cart_items')
+    op.drop_table('carts')
+    op.drop_table('product_images')
+    op.drop_table('products')
+    op.drop_table('users')
@@ -0,0 +1,45 @@
+"""Feed keyset pagination indexes
+
+Partial composite indexes that let every feed page, with or without a
+category filter, be served by a single index range scan on
+(created_at DESC, id DESC). On Postgres they are built CONCURRENTLY so
+the products table stays writable during the migration.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-09-08 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+ACTIVE = sa.text("status = 'active'")
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_products_feed', 'products',
+            [sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_where=ACTIVE, sqlite_where=ACTIVE,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'idx_products_feed_category', 'products',
+            ['category', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_where=ACTIVE, sqlite_where=ACTIVE,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_products_feed_category', 'products', postgresql_concurrently=True)
+        op.drop_index('idx_products_feed', 'products', postgresql_concurrently=True)
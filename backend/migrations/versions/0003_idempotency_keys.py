@@ -0,0 +1,39 @@
+"""Idempotency keys
+
+Stores the outcome of POST /api/orders and POST /api/cart requests sent
+with an Idempotency-Key header so retries are replayed, not re-run.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-09-10 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.models import db_now
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('key', sa.String(64), primary_key=True),
+        sa.Column('fingerprint', sa.String(64), nullable=False),
+        sa.Column('status_code', sa.Integer()),
+        sa.Column('content_type', sa.String(100)),
+        sa.Column('response_body', sa.Text()),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=db_now()),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_idempotency_keys_expires_at', 'idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,33 @@
+"""Order history index
+
+Composite index for paginated order history (WHERE user_id = ? ORDER BY
+created_at DESC, id DESC), built CONCURRENTLY on Postgres so checkout
+keeps writing to orders during the migration.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-09-11 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_orders_user_created', 'orders',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_orders_user_created', 'orders', postgresql_concurrently=True)
@@ -0,0 +1,61 @@
+"""Cart uniqueness constraints
+
+One cart per user and one item per (cart, product), which cart upserts
+(INSERT ... ON CONFLICT) rely on. Racing get-or-create and add-to-cart
+requests may already have left duplicates: extra carts are merged into
+each user's oldest cart and duplicate items into one row with the summed
+quantity before the constraints are added. Databases built from
+models.sql already have the cart_items constraint.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2025-09-12 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def _has_unique(table, columns):
+    constraints = sa.inspect(op.get_bind()).get_unique_constraints(table)
+    return any(sorted(constraint['column_names']) == sorted(columns) for constraint in constraints)
+
+
+def upgrade() -> None:
+    # Move items from duplicate carts into the user's oldest cart, then drop the extras
+    op.execute(
+        "UPDATE cart_items SET cart_id = ("
+        "SELECT MIN(keeper.id) FROM carts keeper WHERE keeper.user_id = "
+        "(SELECT duplicate.user_id FROM carts duplicate WHERE duplicate.id = cart_items.cart_id)) "
+        "WHERE cart_id NOT IN (SELECT MIN(id) FROM carts GROUP BY user_id)"
+    )
+    op.execute("DELETE FROM carts WHERE id NOT IN (SELECT MIN(id) FROM carts GROUP BY user_id)")
+
+    # Merge duplicate items into the oldest row for each (cart, product)
+    op.execute(
+        "UPDATE cart_items SET quantity = ("
+        "SELECT SUM(other.quantity) FROM cart_items other "
+        "WHERE other.cart_id = cart_items.cart_id AND other.product_id = cart_items.product_id) "
+        "WHERE id IN (SELECT MIN(id) FROM cart_items GROUP BY cart_id, product_id HAVING COUNT(*) > 1)"
+    )
+    op.execute("DELETE FROM cart_items WHERE id NOT IN (SELECT MIN(id) FROM cart_items GROUP BY cart_id, product_id)")
+
+    if not _has_unique('carts', ['user_id']):
+        with op.batch_alter_table('carts') as batch:
+            batch.create_unique_constraint('carts_user_id_key', ['user_id'])
+    if not _has_unique('cart_items', ['cart_id', 'product_id']):
+        with op.batch_alter_table('cart_items') as batch:
+            batch.create_unique_constraint('cart_items_cart_id_product_id_key', ['cart_id', 'product_id'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('cart_items') as batch:
+        batch.drop_constraint('cart_items_cart_id_product_id_key', type_='unique')
+    with op.batch_alter_table('carts') as batch:
+        batch.drop_constraint('carts_user_id_key', type_='unique')
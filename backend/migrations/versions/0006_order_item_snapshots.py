@@ -0,0 +1,72 @@
+"""Order item snapshots
+
+Order items keep the product name, primary image URL and category as they
+were at checkout, so order history reads only orders and order_items and
+stays correct after a listing is edited or deleted. Items whose product is
+gone get the placeholder name the API used to show.
+
+This is the expand half of the change. The columns stay nullable, because
+the previous build keeps inserting order items without them until the
+rollout finishes. 0011 makes product_name NOT NULL once no such build runs.
+
+The columns are added in a short transaction of their own (a catalog-only
+change). Existing items are then backfilled from their products in id
+ranges of BACKFILL_BATCH_SIZE, each UPDATE committing on its own, so
+order_items is never locked for longer than one batch. The loop re-reads
+the highest id, so items ordered meanwhile are covered.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2025-09-13 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+MISSING_PRODUCT_NAME = 'Product no longer available'
+
+
+def upgrade() -> None:
+    op.add_column('order_items', sa.Column('product_name', sa.String(255)))
+    op.add_column('order_items', sa.Column('product_image_url', sa.String(255)))
+    op.add_column('order_items', sa.Column('product_category', sa.String(50)))
+
+    backfill = sa.text(
+        "UPDATE order_items SET "
+        "product_name = COALESCE("
+        "(SELECT name FROM products WHERE products.id = order_items.product_id), :missing), "
+        "product_category = (SELECT category FROM products WHERE products.id = order_items.product_id), "
+        "product_image_url = ("
+        "SELECT image_url FROM product_images "
+        "WHERE product_images.product_id = order_items.product_id AND product_images.is_primary = :primary "
+        "ORDER BY product_images.id LIMIT 1) "
+        "WHERE id > :low AND id <= :high"
+    )
+
+    # Commit the DDL, then run every batch in autocommit mode
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        low = 0
+        while low < (bind.execute(sa.text('SELECT MAX(id) FROM order_items')).scalar() or 0):
+            bind.execute(backfill, {
+                'missing': MISSING_PRODUCT_NAME,
+                'primary': True,
+                'low': low,
+                'high': low + BACKFILL_BATCH_SIZE,
+            })
+            low += BACKFILL_BATCH_SIZE
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('order_items') as batch:
+        batch.drop_column('product_category')
+        batch.drop_column('product_image_url')
+        batch.drop_column('product_name')
@@ -0,0 +1,55 @@
+"""Product image summary
+
+products.primary_image_url and products.image_count mirror product_images
+so listings and carts can render without reading that table.
+
+Adding the columns is a short transaction of its own: it holds the table's
+ACCESS EXCLUSIVE lock only for the catalog change. Existing products are
+then backfilled outside any migration transaction, in id ranges of
+BACKFILL_BATCH_SIZE that each commit as they go, so feed reads and
+checkouts only ever wait on one short UPDATE. The loop re-reads the
+highest id as it goes, so products listed during the backfill are covered.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2025-09-14 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    op.add_column('products', sa.Column('primary_image_url', sa.String(255)))
+    op.add_column('products', sa.Column('image_count', sa.Integer(), nullable=False, server_default='0'))
+
+    backfill = sa.text(
+        "UPDATE products SET "
+        "image_count = (SELECT COUNT(*) FROM product_images WHERE product_images.product_id = products.id), "
+        "primary_image_url = ("
+        "SELECT image_url FROM product_images "
+        "WHERE product_images.product_id = products.id AND product_images.is_primary = :primary "
+        "ORDER BY product_images.id LIMIT 1) "
+        "WHERE id > :low AND id <= :high"
+    )
+    # Commit the DDL, then run every batch in autocommit mode
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        low = 0
+        while low < (bind.execute(sa.text('SELECT MAX(id) FROM products')).scalar() or 0):
+            bind.execute(backfill, {'primary': True, 'low': low, 'high': low + BACKFILL_BATCH_SIZE})
+            low += BACKFILL_BATCH_SIZE
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('products') as batch:
+        batch.drop_column('image_count')
+        batch.drop_column('primary_image_url')
@@ -0,0 +1,31 @@
+"""Product updated_at index
+
+Index for incremental catalogue exports (WHERE updated_at >= ? ORDER BY
+updated_at, id), built CONCURRENTLY on Postgres so product writes carry on
+during the migration.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2025-09-15 00:00:00
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_products_updated', 'products', ['updated_at', 'id'],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_products_updated', 'products', postgresql_concurrently=True)
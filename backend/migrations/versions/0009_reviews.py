@@ -0,0 +1,44 @@
+"""Reviews
+
+Product reviews, one per purchased order item and buyer, as described in
+models.sql. The table is new and empty, so its indexes are built in the
+same transaction rather than concurrently.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2025-09-16 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.models import db_now
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'reviews',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('order_item_id', sa.Integer(), sa.ForeignKey('order_items.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('rating', sa.Integer(), nullable=False),
+        sa.Column('comment', sa.Text()),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=db_now()),
+        sa.CheckConstraint('rating BETWEEN 1 AND 5', name='check_rating'),
+        sa.UniqueConstraint('user_id', 'order_item_id', name='reviews_user_id_order_item_id_key'),
+    )
+    op.create_index('ix_reviews_id', 'reviews', ['id'])
+    op.create_index('idx_reviews_product_id', 'reviews', ['product_id'])
+    op.create_index('idx_reviews_user_id', 'reviews', ['user_id'])
+    op.create_index('idx_reviews_rating', 'reviews', ['rating'])
+
+
+def downgrade() -> None:
+    op.drop_table('reviews')
@@ -0,0 +1,50 @@
+"""Foreign key indexes
+
+Postgres doesn't index foreign keys by itself. models.sql declared these
+indexes, but 0001 never created them, so image loading, the order history
+item batch, the image summary subqueries and ON DELETE CASCADE from
+products and users scanned whole tables. They are built CONCURRENTLY on
+Postgres so writes carry on during the migration. Databases built from
+models.sql already have them and are left alone.
+
+carts.user_id and cart_items.cart_id need no index of their own: the
+unique constraints from 0005 lead with them.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2025-09-17 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('idx_products_seller_id', 'products', ['seller_id']),
+    ('idx_product_images_product_id', 'product_images', ['product_id']),
+    ('idx_cart_items_product_id', 'cart_items', ['product_id']),
+    ('idx_order_items_order_id', 'order_items', ['order_id']),
+    ('idx_order_items_product_id', 'order_items', ['product_id']),
+]
+
+
+def _has_index(table, name):
+    return any(index['name'] == name for index in sa.inspect(op.get_bind()).get_indexes(table))
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            if not _has_index(table, name):
+                op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table, postgresql_concurrently=True)
@@ -0,0 +1,82 @@
+"""Order item name NOT NULL
+
+The contract half of 0006. Apply it only once every running build writes
+order_items.product_name, that is, after a build that includes 0006 has
+fully replaced any older one. Items the older build inserted during that
+rollout have no snapshot yet. They are filled in first, in id ranges of
+BACKFILL_BATCH_SIZE that each commit on their own.
+
+On Postgres a NOT VALID check is added and then validated, which only
+takes a SHARE UPDATE EXCLUSIVE lock. SET NOT NULL then trusts the check
+instead of scanning order_items under ACCESS EXCLUSIVE. Items inserted
+after the backfill are filled in again in the short transaction that adds
+the check, so none can slip in without a name.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2025-09-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+MISSING_PRODUCT_NAME = 'Product no longer available'
+
+NOT_NULL_CHECK = 'order_items_product_name_not_null'
+
+BACKFILL = sa.text(
+    "UPDATE order_items SET "
+    "product_name = COALESCE("
+    "(SELECT name FROM products WHERE products.id = order_items.product_id), :missing), "
+    "product_category = (SELECT category FROM products WHERE products.id = order_items.product_id), "
+    "product_image_url = ("
+    "SELECT image_url FROM product_images "
+    "WHERE product_images.product_id = order_items.product_id AND product_images.is_primary = :primary "
+    "ORDER BY product_images.id LIMIT 1) "
+    "WHERE id > :low AND id <= :high AND product_name IS NULL"
+)
+
+
+def _backfill(bind, low: int) -> int:
+    """Fill in every unnamed item above `low`, returning where it stopped."""
+    while low < (bind.execute(sa.text('SELECT MAX(id) FROM order_items')).scalar() or 0):
+        bind.execute(BACKFILL, {
+            'missing': MISSING_PRODUCT_NAME,
+            'primary': True,
+            'low': low,
+            'high': low + BACKFILL_BATCH_SIZE,
+        })
+        low += BACKFILL_BATCH_SIZE
+    return low
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        done = _backfill(op.get_bind(), 0)
+    _backfill(op.get_bind(), done)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            f'ALTER TABLE order_items ADD CONSTRAINT {NOT_NULL_CHECK} '
+            'CHECK (product_name IS NOT NULL) NOT VALID'
+        )
+        with op.get_context().autocommit_block():
+            op.execute(f'ALTER TABLE order_items VALIDATE CONSTRAINT {NOT_NULL_CHECK}')
+        op.alter_column('order_items', 'product_name', existing_type=sa.String(255), nullable=False)
+        op.drop_constraint(NOT_NULL_CHECK, 'order_items', type_='check')
+    else:
+        with op.batch_alter_table('order_items') as batch:
+            batch.alter_column('product_name', existing_type=sa.String(255), nullable=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('order_items') as batch:
+        batch.alter_column('product_name', existing_type=sa.String(255), nullable=True)
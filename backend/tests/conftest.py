@@ -0,0 +1,68 @@
+import os
+
+# Point every app engine (primary, async, replicas) at the local SQLite test
+# database before app.database is imported, whatever the environment says;
+# CI's DATABASE_URL is for checking the migrations, not for the suite
+os.environ["DATABASE_URL"] = "sqlite:///./test.db"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.pop("DATABASE_REPLICA_URLS", None)
+
+from contextlib import contextmanager
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine
+
+from app.auth import user_cache
+from app.cache import response_cache
+from app.models import Base
+from app.profiler import count_queries
+from app.replicas import recent_writers
+from app.views import view_counter
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+def migrate(path: str) -> None:
+    """Build a fresh SQLite database at `path` with the migrations, the only schema source."""
+    if os.path.exists(path):
+        os.remove(path)
+    # No ini file, so running the migrations leaves the test run's logging alone
+    config = Config()
+    config.set_main_option("script_location", MIGRATIONS_DIR)
+    config.set_main_option("sqlalchemy.url", f"sqlite:///{path}")
+    command.upgrade(config, "head")
+
+migrate("./test.db")
+engine = create_engine("sqlite:///./test.db", connect_args={"check_same_thread": False})
+
+@pytest.fixture(autouse=True)
+def reset_database():
+    """Start every test from empty tables so rows never leak between tests."""
+    with engine.begin() as conn:
+        # Deleting products fires the triggers that empty the SQLite search index too
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    # Fixtures write rows directly, bypassing the endpoints that invalidate the cache
+    response_cache.clear()
+    user_cache.clear()
+    view_counter.discard()
+    recent_writers.flush()
+    yield
+
+@pytest.fixture
+def migrated_database():
+    """Build extra SQLite databases (e.g. a stand-in replica) the way test.db is built."""
+    return migrate
+
+@pytest.fixture
+def max_queries():
+    """Query budget: `with max_queries(2): client.get(...)` fails if the block runs more statements."""
+    @contextmanager
+    def budget(limit: int):
+        with count_queries() as capture:
+            yield capture
+        assert capture.count <= limit, (
+            f"{capture.count} queries, budget is {limit}:\n" + "\n".join(capture.statements)
+        )
+    return budget
@@ -1,11 +1,17 @@
+import asyncio
+import time
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool, StaticPool
 
+import app.auth as auth_module
 from app.main import app
-from app.database import Base, get_db
+from app.database import get_db
 from app.models import User
 
 # Create a test database
@@ -17,13 +23,13 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Override the get_db dependency
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
+# Override the get_db dependency; routes use an AsyncSession on the same file
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+async def override_get_db():
+    async with AsyncTestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 app.dependency_overrides[get_db] = override_get_db
 
@@ -32,11 +38,8 @@ client = TestClient(app)
 
 @pytest.fixture
 def test_db():
-    # Create tables
-    Base.metadata.create_all(bind=engine)
+    # conftest migrates the schema once and empties it before every test
     yield
-    # Drop tables
-    Base.metadata.drop_all(bind=engine)
 
 def test_signup(test_db):
     # Test signup with valid data
@@ -155,3 +158,91 @@ def test_me_endpoint(test_db):
     assert response.status_code == 200
     data = response.json()
     assert data["name"] == "updatedname"
+
+def _signup_and_login(email):
+    client.post(
+        "/api/auth/signup",
+        json={"email": email, "password": "Password123", "username": "cacheuser"}
+    )
+    response = client.post("/api/auth/login", json={"email": email, "password": "Password123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_current_user_is_cached_and_invalidated_on_update(test_db, max_queries):
+    headers = _signup_and_login("cache@example.com")
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    
+    # Served from the user cache
+    with max_queries(0):
+        response = client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 200
+    
+    client.put("/api/auth/me", json={"username": "renamed"}, headers=headers)
+    assert client.get("/api/auth/me", headers=headers).json()["name"] == "renamed"
+
+def test_update_after_account_deletion_is_unauthorized(test_db):
+    headers = _signup_and_login("deleted@example.com")
+    # Cache the user, then delete the row behind the cache's back
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    db = TestingSessionLocal()
+    db.query(User).filter(User.email == "deleted@example.com").delete()
+    db.commit()
+    db.close()
+    
+    response = client.put("/api/auth/me", json={"username": "ghost"}, headers=headers)
+    assert response.status_code == 401
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+def test_trusted_token_claims_skip_user_lookup(test_db, monkeypatch, max_queries):
+    headers = _signup_and_login("claims@example.com")
+    
+    def users_queries():
+        with max_queries(2) as capture:
+            assert client.get("/api/cart", headers=headers).status_code == 200
+        return [statement for statement in capture.statements if "FROM users" in statement]
+    
+    assert len(users_queries()) == 1
+    
+    auth_module.user_cache.clear()
+    monkeypatch.setattr(auth_module, "AUTH_TRUST_TOKEN_CLAIMS", True)
+    assert users_queries() == []
+
+def test_login_burst_does_not_stall_event_loop(test_db):
+    # bcrypt and DB calls run off the event loop, so other requests keep being served
+    client.post(
+        "/api/auth/signup",
+        json={
+            "email": "burst@example.com",
+            "password": "Password123",
+            "username": "burstuser"
+        }
+    )
+    
+    async def scenario():
+        stalls = []
+        done = asyncio.Event()
+        
+        async def heartbeat():
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                stalls.append(now - last)
+                last = now
+        
+        async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+            ticker = asyncio.create_task(heartbeat())
+            logins = await asyncio.gather(*[
+                async_client.post(
+                    "/api/auth/login",
+                    json={"email": "burst@example.com", "password": "Password123"}
+                )
+                for _ in range(4)
+            ])
+            done.set()
+            await ticker
+        return logins, max(stalls)
+    
+    logins, longest_stall = asyncio.run(scenario())
+    assert all(response.status_code == 200 for response in logins)
+    # A single bcrypt verification on the loop would stall it for longer than this
+    assert longest_stall < 0.15
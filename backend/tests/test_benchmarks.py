@@ -0,0 +1,70 @@
+import asyncio
+import random
+
+import httpx
+from sqlalchemy import create_engine, func, select
+
+from app.main import app
+from app.models import Order, Product, User
+from benchmarks.load import DEFAULT_MIX, Catalogue, percentile, run
+from benchmarks.seed import seed
+
+engine = create_engine("sqlite:///./test.db", connect_args={"check_same_thread": False})
+
+def test_seed_is_reproducible_and_consistent():
+    manifest = seed(engine, users=5, products=60, seed=7)
+    with engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(User)) == 5
+        assert conn.scalar(select(func.count()).select_from(Product)) == 60
+        active = conn.scalars(select(Product.id).where(Product.status == "active").order_by(Product.id)).all()
+        names = conn.scalars(select(Product.name).order_by(Product.id)).all()
+        orders = conn.scalar(select(func.count()).select_from(Order))
+    assert manifest["active_product_ids"] == active
+    assert manifest["counts"]["orders"] == orders > 0
+
+    # The same seed yields the same catalogue
+    with engine.begin() as conn:
+        for table in ("order_items", "orders", "cart_items", "carts", "product_images", "products", "users"):
+            conn.exec_driver_sql(f"DELETE FROM {table}")
+    seed(engine, users=5, products=60, seed=7)
+    with engine.connect() as conn:
+        assert conn.scalars(select(Product.name).order_by(Product.id)).all() == names
+
+def test_percentile_is_nearest_rank():
+    values = [float(n) for n in range(1, 101)]
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([3.0], 0.95) == 3
+    assert percentile([], 0.5) is None
+
+def test_catalogue_drops_sold_products_and_skips_the_buyers_own():
+    catalogue = Catalogue([10, 11, 12], [0, 1, 0])
+    catalogue.discard(10)
+    catalogue.discard(10)
+    assert sorted(catalogue.product_ids) == [11, 12]
+    rng = random.Random(3)
+    assert {catalogue.pick(rng, buyer=0) for _ in range(20)} == {11}
+    catalogue.discard(11)
+    assert catalogue.pick(rng, buyer=0) is None
+    assert catalogue.pick(rng) == 12
+
+def test_load_reports_every_endpoint():
+    manifest = seed(engine, users=4, products=200, seed=1)
+    clients = []
+
+    def make_client():
+        clients.append(httpx.AsyncClient(app=app, base_url="http://test"))
+        return clients[-1]
+
+    report = asyncio.run(run(make_client, manifest, concurrency=2, duration=1, warmup=0.2))
+    # One client, and so one cookie jar, per virtual user
+    assert len(clients) == 2
+
+    assert set(report["endpoints"]) == set(DEFAULT_MIX)
+    assert report["total"]["requests"] == sum(endpoint["requests"] for endpoint in report["endpoints"].values())
+    assert report["total"]["throughput"] > 0
+    assert report["endpoints"]["feed"]["statuses"] == {"200": report["endpoints"]["feed"]["requests"]}
+    assert report["endpoints"]["search"]["p50_ms"] <= report["endpoints"]["search"]["p99_ms"]
+    # Only contention between the clients fails: a product the other one bought
+    for endpoint in report["endpoints"].values():
+        assert set(endpoint["statuses"]) <= {"200", "400", "404", "409"}
@@ -0,0 +1,49 @@
+import time
+
+from app.cache import LRUCache, LocalBackend, ResponseCache, feed_tags, product_tags
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+def test_lru_entries_expire():
+    cache = LRUCache(maxsize=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+def test_invalidation_reaches_other_workers_through_shared_backend():
+    shared = LocalBackend()
+    worker_a = ResponseCache(maxsize=10, ttl=60, shared=shared)
+    worker_b = ResponseCache(maxsize=10, ttl=60, shared=shared)
+    parts = ("Books", None, None, 20)
+    tags = feed_tags("Books", None)
+    
+    key, value = worker_a.get("feed", parts, tags)
+    assert value is None
+    worker_a.set(key, {"products": []})
+    
+    # Worker B is served from the shared tier, then from its own LRU
+    assert worker_b.get("feed", parts, tags)[1] == {"products": []}
+    assert worker_b.get("feed", parts, tags)[1] == {"products": []}
+    assert worker_b.stats()["namespaces"]["feed"]["shared_hits"] == 1
+    assert worker_b.stats()["namespaces"]["feed"]["hits"] == 1
+    
+    # A write in another category leaves the entry alone; one in Books drops it everywhere
+    worker_a.invalidate(*product_tags(1, "Clothing"))
+    assert worker_b.get("feed", parts, tags)[1] == {"products": []}
+    worker_a.invalidate(*product_tags(2, "Books"))
+    assert worker_a.get("feed", parts, tags)[1] is None
+    assert worker_b.get("feed", parts, tags)[1] is None
+
+def test_disabled_cache_never_stores():
+    cache = ResponseCache(maxsize=10, ttl=0)
+    key, value = cache.get("feed", (None, None, None, 20), ["feed:*"])
+    cache.set(key, {"products": []})
+    assert cache.get("feed", (None, None, None, 20), ["feed:*"])[1] is None
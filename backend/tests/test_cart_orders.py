@@ -1,31 +1,43 @@
+import asyncio
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.main import app
 from app.database import get_db
-from app.models import Base, User, Product, ProductImage, Cart, CartItem, Order, OrderItem
+from app.models import User, Product, ProductImage, Cart, CartItem, Order, OrderItem
 from app.auth import get_password_hash, create_access_token
+from app.cart_sweep import cart_sweeper
+from datetime import datetime
 
 # Test database setup
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+async def override_get_db():
+    async with AsyncTestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 app.dependency_overrides[get_db] = override_get_db
 
-# Create test database
-Base.metadata.create_all(bind=engine)
-
 client = TestClient(app)
 
+CHECKOUT = {
+    "shipping_address": "123 Test St",
+    "shipping_city": "Test City",
+    "shipping_state": "Test State",
+    "shipping_zip": "12345",
+    "shipping_country": "Test Country"
+}
+
 @pytest.fixture
 def test_user():
     """Create a test user."""
@@ -84,7 +96,9 @@ def test_product(test_seller):
         condition="Good",
         eco_rating=4,
         eco_details="Eco-friendly product",
-        status="active"
+        status="active",
+        primary_image_url="https://example.com/image.jpg",
+        image_count=1
     )
     db.add(product)
     db.commit()
@@ -139,6 +153,104 @@ class TestCart:
         assert data["total_items"] == 2
         assert data["total_amount"] == 59.98
 
+    def test_get_cart_flags_unavailable_items(self, test_user, test_product, max_queries):
+        """Test that the cart is read in one query and unavailable items are flagged, not deleted."""
+        client.post(
+            "/api/cart",
+            json={"product_id": test_product.id, "quantity": 2},
+            headers=test_user["headers"]
+        )
+        db = TestingSessionLocal()
+        db.get(Product, test_product.id).status = "sold"
+        db.commit()
+        
+        # Warm the authenticated-user cache so only the cart query is counted
+        client.get("/api/cart", headers=test_user["headers"])
+        with max_queries(1):
+            response = client.get("/api/cart", headers=test_user["headers"])
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["items"]) == 1
+        assert data["items"][0]["available"] is False
+        assert data["items"][0]["product_image_url"] == "https://example.com/image.jpg"
+        assert data["total_items"] == 0
+        assert data["total_amount"] == 0.0
+        assert db.query(CartItem).count() == 1
+        db.close()
+
+    def test_cart_sweep_removes_unavailable_items(self, test_user, test_product):
+        """Test that the background sweep deletes items for inactive products."""
+        client.post(
+            "/api/cart",
+            json={"product_id": test_product.id, "quantity": 1},
+            headers=test_user["headers"]
+        )
+        db = TestingSessionLocal()
+        db.get(Product, test_product.id).status = "deleted"
+        db.commit()
+        db.close()
+        
+        async def sweep():
+            async with AsyncTestingSessionLocal() as session:
+                return await cart_sweeper.sweep(session)
+        
+        assert asyncio.run(sweep()) == 1
+        assert asyncio.run(sweep()) == 0
+        assert client.get("/api/cart", headers=test_user["headers"]).json()["items"] == []
+
+    def test_concurrent_adds_share_one_cart_and_item(self, test_user, test_product):
+        """Test that racing adds of the same product neither fail nor duplicate rows."""
+        async def add_all():
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                return await asyncio.gather(*[
+                    async_client.post(
+                        "/api/cart",
+                        json={"product_id": test_product.id, "quantity": 1},
+                        headers=test_user["headers"]
+                    )
+                    for _ in range(8)
+                ])
+        
+        responses = asyncio.run(add_all())
+        assert [response.status_code for response in responses] == [200] * 8
+        db = TestingSessionLocal()
+        assert db.query(Cart).count() == 1
+        items = db.query(CartItem).all()
+        assert len(items) == 1
+        assert items[0].quantity == 8
+        db.close()
+
+    def test_cart_batch_adds_and_removes(self, test_user, test_seller, test_product):
+        """Test that a batch applies all of its changes, or none when an add is invalid."""
+        db = TestingSessionLocal()
+        extra = Product(seller_id=test_seller.id, name="Bundle Extra", description="Goes with it",
+                        price=5, category="Electronics", condition="Good", status="active")
+        db.add(extra)
+        db.commit()
+        extra_id = extra.id
+        db.close()
+        
+        client.post("/api/cart", json={"product_id": test_product.id}, headers=test_user["headers"])
+        response = client.post("/api/cart/batch", json={
+            "add": [{"product_id": extra_id, "quantity": 2}, {"product_id": extra_id}],
+            "remove": [test_product.id]
+        }, headers=test_user["headers"])
+        assert response.status_code == 200
+        assert response.json()["removed"] == 1
+        
+        data = client.get("/api/cart", headers=test_user["headers"]).json()
+        assert [(item["product_id"], item["quantity"]) for item in data["items"]] == [(extra_id, 3)]
+        
+        response = client.post("/api/cart/batch", json={
+            "add": [{"product_id": test_product.id}, {"product_id": 999}],
+            "remove": [extra_id]
+        }, headers=test_user["headers"])
+        assert response.status_code == 404
+        assert "999" in response.json()["detail"]
+        data = client.get("/api/cart", headers=test_user["headers"]).json()
+        assert [(item["product_id"], item["quantity"]) for item in data["items"]] == [(extra_id, 3)]
+
     def test_add_to_cart_product_not_found(self, test_user):
         """Test adding a non-existent product to cart."""
         cart_data = {
@@ -268,6 +380,78 @@ class TestOrders:
         cart_data = response.json()
         assert len(cart_data["items"]) == 0
 
+    def test_checkout_statement_count_is_constant(self, test_user, test_seller, max_queries):
+        """Test that checkout costs the same number of statements for any cart size."""
+        db = TestingSessionLocal()
+        cart = Cart(user_id=test_user["user"].id)
+        db.add(cart)
+        db.flush()
+        for i in range(5):
+            product = Product(seller_id=test_seller.id, name=f"Product {i}", description="Bulk",
+                              price=10 + i, category="Books", condition="Good", status="active")
+            db.add(product)
+            db.flush()
+            db.add(CartItem(cart_id=cart.id, product_id=product.id, quantity=1))
+        db.commit()
+        db.close()
+        
+        # Warm the authenticated-user cache so only checkout statements are counted
+        client.get("/api/auth/me", headers=test_user["headers"])
+        # Cart read, product lock, status UPDATE, order INSERT, bulk item INSERT, cart DELETE
+        with max_queries(6):
+            response = client.post("/api/orders", json=CHECKOUT, headers=test_user["headers"])
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["items"]) == 5
+        assert data["total_amount"] == 60.0
+
+    def test_concurrent_checkouts_never_sell_a_product_twice(self, test_seller):
+        """Test that buyers racing for the same products each get them at most once."""
+        db = TestingSessionLocal()
+        products = []
+        for i in range(3):
+            product = Product(seller_id=test_seller.id, name=f"One-off {i}", description="Unique item",
+                              price=15, category="Clothing", condition="Good", status="active")
+            db.add(product)
+            products.append(product)
+        db.flush()
+        
+        headers = []
+        for i in range(12):
+            buyer = User(email=f"buyer{i}@example.com", password_hash="x", name=f"Buyer {i}")
+            db.add(buyer)
+            db.flush()
+            cart = Cart(user_id=buyer.id)
+            db.add(cart)
+            db.flush()
+            # Overlapping carts: every buyer wants product 0 and one of the others
+            for product in (products[0], products[1 + i % 2]):
+                db.add(CartItem(cart_id=cart.id, product_id=product.id, quantity=1))
+            headers.append({"Authorization": f"Bearer {create_access_token({'sub': str(buyer.id)})}"})
+        db.commit()
+        product_ids = [product.id for product in products]
+        db.close()
+        
+        async def checkout_all():
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                return await asyncio.gather(*[
+                    async_client.post("/api/orders", json=CHECKOUT, headers=buyer_headers)
+                    for buyer_headers in headers
+                ])
+        
+        responses = asyncio.run(checkout_all())
+        statuses = [response.status_code for response in responses]
+        assert set(statuses) <= {200, 400, 409}
+        assert statuses.count(200) == 1
+        
+        db = TestingSessionLocal()
+        for product_id in product_ids:
+            assert db.query(OrderItem).filter(OrderItem.product_id == product_id).count() <= 1
+        sold = db.query(Product).filter(Product.status == "sold").count()
+        assert sold == db.query(OrderItem).count() == 2
+        db.close()
+
     def test_create_order_empty_cart(self, test_user):
         """Test creating an order with empty cart."""
         order_data = {
@@ -331,6 +515,85 @@ class TestOrders:
         assert data[0]["status"] == "processing"
         assert data[0]["total_amount"] == 29.99
 
+    def test_get_orders_pages_with_batched_items(self, test_user, test_seller, max_queries):
+        """Test that order history is keyset-paginated and each page costs a fixed number of queries."""
+        db = TestingSessionLocal()
+        product = Product(seller_id=test_seller.id, name="Boxed Set", description="Books",
+                          price=5, category="Books", condition="Good", status="sold")
+        db.add(product)
+        db.flush()
+        db.add(ProductImage(product_id=product.id, image_url="https://example.com/set.jpg", is_primary=True))
+        created_at = datetime(2024, 5, 1, 9, 30)
+        for i in range(5):
+            order = Order(user_id=test_user["user"].id, status="delivered" if i % 2 else "processing",
+                          total_amount=10, created_at=created_at, **CHECKOUT)
+            db.add(order)
+            db.flush()
+            for _ in range(3):
+                db.add(OrderItem(order_id=order.id, product_id=product.id, quantity=1, price_per_unit=5,
+                                 product_name="Boxed Set", product_image_url="https://example.com/set.jpg",
+                                 product_category="Books"))
+        db.commit()
+        db.close()
+        
+        client.get("/api/auth/me", headers=test_user["headers"])
+        seen = []
+        params = {"limit": 2}
+        # Three pages, two queries each
+        with max_queries(6):
+            while True:
+                response = client.get("/api/orders", params=params, headers=test_user["headers"])
+                assert response.status_code == 200
+                page = response.json()
+                assert all(len(order["items"]) == 3 for order in page)
+                assert page[0]["items"][0]["product_name"] == "Boxed Set"
+                assert page[0]["items"][0]["product_image_url"] == "https://example.com/set.jpg"
+                seen.extend(order["id"] for order in page)
+                if "X-Next-Cursor" not in response.headers:
+                    break
+                params["cursor"] = response.headers["X-Next-Cursor"]
+        
+        assert seen == sorted(set(seen), reverse=True)
+        assert len(seen) == 5
+        
+        response = client.get("/api/orders", params={"status": "delivered"}, headers=test_user["headers"])
+        assert [order["status"] for order in response.json()] == ["delivered", "delivered"]
+        assert client.get("/api/orders", params={"status": "lost"}, headers=test_user["headers"]).status_code == 400
+
+    def test_order_cursor_is_readable_cross_origin(self, test_user):
+        """Test that browsers on another origin may read the X-Next-Cursor header."""
+        response = client.get(
+            "/api/orders",
+            headers={**test_user["headers"], "Origin": "http://localhost:3000"}
+        )
+        assert response.status_code == 200
+        exposed = response.headers["Access-Control-Expose-Headers"].lower().split(", ")
+        assert "x-next-cursor" in exposed
+
+    def test_order_history_keeps_the_checkout_snapshot(self, test_user, test_product, max_queries):
+        """Test that order items keep the name, image and category the product had at checkout."""
+        client.post("/api/cart", json={"product_id": test_product.id}, headers=test_user["headers"])
+        order = client.post("/api/orders", json=CHECKOUT, headers=test_user["headers"]).json()
+        assert order["items"][0]["product_category"] == "Electronics"
+        
+        db = TestingSessionLocal()
+        product = db.get(Product, test_product.id)
+        product.name = "Renamed"
+        product.category = "Other"
+        db.query(ProductImage).delete()
+        db.commit()
+        db.close()
+        
+        # The orders, then their items
+        with max_queries(2) as capture:
+            response = client.get("/api/orders", headers=test_user["headers"])
+        
+        item = response.json()[0]["items"][0]
+        assert item["product_name"] == test_product.name
+        assert item["product_image_url"] == "https://example.com/image.jpg"
+        assert item["product_category"] == "Electronics"
+        assert not any("products" in statement or "product_images" in statement for statement in capture.statements)
+
     def test_get_orders_unauthorized(self):
         """Test getting orders without authentication."""
         response = client.get("/api/orders")
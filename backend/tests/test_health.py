@@ -1,10 +1,60 @@
+import asyncio
+
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
 from app.main import app
+from app.readiness import known_revisions, startup_check
 
 client = TestClient(app)
 
+engine = create_engine("sqlite:///./test.db", connect_args={"check_same_thread": False})
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+
+@pytest.fixture
+def stamp():
+    """Record a migration revision in the test database, as `alembic stamp` would."""
+    def set_revision(revision):
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE IF NOT EXISTS alembic_version (version_num VARCHAR(32) NOT NULL)"))
+            conn.execute(text("DELETE FROM alembic_version"))
+            conn.execute(text("INSERT INTO alembic_version VALUES (:revision)"), {"revision": revision})
+    yield set_revision
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+
 def test_health_endpoint():
     """Test that the health endpoint returns the correct response."""
     response = client.get("/health")
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
+
+def test_ready_when_migrated_to_head(stamp):
+    head, = known_revisions()[0]
+    stamp(head)
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["revision"] == [head]
+
+def test_not_ready_before_migrations():
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert "has not been migrated" in response.json()["detail"]
+    with pytest.raises(RuntimeError, match="has not been migrated"):
+        asyncio.run(startup_check(async_engine))
+
+def test_not_ready_when_schema_is_behind(stamp):
+    stamp("0001")
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert "behind this build" in response.json()["detail"]
+    with pytest.raises(RuntimeError, match="behind this build"):
+        asyncio.run(startup_check(async_engine))
+
+def test_ready_when_a_later_deploy_migrated_ahead(stamp):
+    stamp("ffffffffffff")
+    assert client.get("/ready").status_code == 200
+    asyncio.run(startup_check(async_engine))
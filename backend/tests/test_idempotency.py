@@ -0,0 +1,172 @@
+import asyncio
+import sqlite3
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+import app.cart_orders as cart_orders_module
+import app.idempotency as idempotency_module
+from app.auth import create_access_token
+from app.idempotency import DatabaseIdempotencyStore, MemoryIdempotencyStore, StoredResponse
+from app.main import app
+from app.models import Cart, CartItem, Order, Product, User
+
+engine = create_engine("sqlite:///./test.db", connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+client = TestClient(app)
+
+CHECKOUT = {
+    "shipping_address": "123 Test St",
+    "shipping_city": "Test City",
+    "shipping_state": "Test State",
+    "shipping_zip": "12345",
+    "shipping_country": "Test Country"
+}
+
+@pytest.fixture(params=["database", "memory"])
+def store(request, monkeypatch):
+    """Run each test against both key stores."""
+    if request.param == "database":
+        store = DatabaseIdempotencyStore(AsyncTestingSessionLocal)
+    else:
+        store = MemoryIdempotencyStore()
+    monkeypatch.setattr(idempotency_module, "idempotency_store", store)
+    return store
+
+@pytest.fixture
+def buyer():
+    """A buyer with an empty cart and a product they can buy."""
+    db = TestingSessionLocal()
+    seller = User(email="seller@example.com", password_hash="x", name="Seller")
+    buyer = User(email="buyer@example.com", password_hash="x", name="Buyer")
+    db.add_all([seller, buyer])
+    db.flush()
+    product = Product(seller_id=seller.id, name="Lamp", description="Vintage lamp", price=25,
+                      category="Home & Garden", condition="Good", status="active")
+    db.add(product)
+    db.commit()
+    data = {
+        "product_id": product.id,
+        "headers": {"Authorization": f"Bearer {create_access_token({'sub': str(buyer.id)})}"},
+    }
+    db.close()
+    return data
+
+def _cart_quantity():
+    db = TestingSessionLocal()
+    quantity = sum(item.quantity for item in db.query(CartItem).all())
+    db.close()
+    return quantity
+
+def test_retried_checkout_replays_the_first_order(store, buyer):
+    headers = {**buyer["headers"], "Idempotency-Key": "checkout-1"}
+    client.post("/api/cart", json={"product_id": buyer["product_id"]}, headers=buyer["headers"])
+
+    first = client.post("/api/orders", json=CHECKOUT, headers=headers)
+    retry = client.post("/api/orders", json=CHECKOUT, headers=headers)
+
+    assert first.status_code == 200
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    db = TestingSessionLocal()
+    assert db.query(Order).count() == 1
+    db.close()
+
+def test_replays_and_errors_carry_cors_headers(store, buyer):
+    headers = {**buyer["headers"], "Idempotency-Key": "add-cors", "Origin": "http://localhost:3000"}
+    client.post("/api/cart", json={"product_id": buyer["product_id"]}, headers=headers)
+
+    replay = client.post("/api/cart", json={"product_id": buyer["product_id"]}, headers=headers)
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.headers["Access-Control-Allow-Origin"]
+    assert "idempotent-replayed" in replay.headers["Access-Control-Expose-Headers"].lower()
+
+    reused = client.post("/api/cart", json={"product_id": buyer["product_id"], "quantity": 2}, headers=headers)
+    assert reused.status_code == 422
+    assert reused.headers["Access-Control-Allow-Origin"]
+
+def test_retried_checkout_runs_again_after_a_lock_conflict(store, buyer, monkeypatch):
+    headers = {**buyer["headers"], "Idempotency-Key": "checkout-contended"}
+    client.post("/api/cart", json={"product_id": buyer["product_id"]}, headers=buyer["headers"])
+
+    # Another checkout holds the product's lock the first time round
+    def locked(*args, **kwargs):
+        raise OperationalError("UPDATE products", {}, sqlite3.OperationalError("database is locked"))
+    with monkeypatch.context() as patch:
+        patch.setattr(cart_orders_module, "update", locked)
+        first = client.post("/api/orders", json=CHECKOUT, headers=headers)
+    retry = client.post("/api/orders", json=CHECKOUT, headers=headers)
+
+    assert first.status_code == 409
+    assert retry.status_code == 200
+    assert "Idempotent-Replayed" not in retry.headers
+    db = TestingSessionLocal()
+    assert db.query(Order).count() == 1
+    db.close()
+
+def test_abandoned_claim_is_taken_over_once_its_lease_runs_out(store, buyer):
+    # A worker claimed the key and was killed before storing or releasing it
+    store.ttl, store.lease = 3600, 0.2
+    assert asyncio.run(store.claim("abandoned", "fingerprint")) is None
+    assert not asyncio.run(store.claim("abandoned", "fingerprint")).completed
+
+    time.sleep(0.3)
+    assert asyncio.run(store.claim("abandoned", "fingerprint")) is None
+    # A finished request keeps its response for the TTL, not the lease
+    asyncio.run(store.complete("abandoned", StoredResponse("fingerprint", 200, "application/json", b"{}")))
+    time.sleep(0.3)
+    assert asyncio.run(store.claim("abandoned", "fingerprint")).status_code == 200
+
+def test_key_reused_with_different_body_is_rejected(store, buyer):
+    headers = {**buyer["headers"], "Idempotency-Key": "add-1"}
+    assert client.post("/api/cart", json={"product_id": buyer["product_id"]}, headers=headers).status_code == 200
+    response = client.post("/api/cart", json={"product_id": buyer["product_id"], "quantity": 3}, headers=headers)
+    assert response.status_code == 422
+    assert _cart_quantity() == 1
+
+def test_keys_are_scoped_to_the_user(store, buyer):
+    db = TestingSessionLocal()
+    other = User(email="other@example.com", password_hash="x", name="Other")
+    db.add(other)
+    db.commit()
+    other_headers = {"Authorization": f"Bearer {create_access_token({'sub': str(other.id)})}"}
+    db.close()
+
+    for headers in (buyer["headers"], other_headers):
+        response = client.post(
+            "/api/cart",
+            json={"product_id": buyer["product_id"]},
+            headers={**headers, "Idempotency-Key": "shared-key"}
+        )
+        assert "Idempotent-Replayed" not in response.headers
+    assert _cart_quantity() == 2
+
+def test_concurrent_duplicates_run_once(store, buyer):
+    headers = {**buyer["headers"], "Idempotency-Key": "add-burst"}
+
+    async def burst():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+            return await asyncio.gather(*[
+                async_client.post("/api/cart", json={"product_id": buyer["product_id"]}, headers=headers)
+                for _ in range(6)
+            ])
+
+    responses = asyncio.run(burst())
+    assert [response.status_code for response in responses] == [200] * 6
+    assert sum("Idempotent-Replayed" not in response.headers for response in responses) == 1
+    assert _cart_quantity() == 1
+    db = TestingSessionLocal()
+    assert db.query(Cart).count() == 1
+    db.close()
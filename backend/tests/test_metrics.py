@@ -0,0 +1,116 @@
+import json
+import os
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.metrics as metrics_module
+from app.main import app
+from app.metrics import MetricsCollector, clear_snapshots, mark_process_dead
+
+client = TestClient(app)
+
+@pytest.fixture
+def collector(monkeypatch, tmp_path):
+    """A fresh collector sharing a snapshot directory, as every worker would."""
+    collector = MetricsCollector(directory=str(tmp_path))
+    monkeypatch.setattr(metrics_module, "metrics_collector", collector)
+    return collector
+
+def _sample(body, name, **labels):
+    """The value of one sample in a Prometheus text body."""
+    wanted = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf"^{re.escape(name)}{{{re.escape(wanted)}}} (\S+)$", body, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+def test_requests_are_labelled_by_route_template(collector):
+    client.get("/api/products/1")
+    client.get("/api/products/2")
+    client.get("/no-such-page")
+
+    body = client.get("/metrics").text
+    assert _sample(body, "http_requests_total", method="GET", route="/api/products/{product_id}", status="404") == 2
+    assert _sample(body, "http_requests_total", method="GET", route="<unmatched>", status="404") == 1
+    assert "/api/products/1" not in body
+    assert _sample(body, "http_request_duration_seconds_count", method="GET", route="/api/products/{product_id}") == 2
+    assert _sample(
+        body, "http_request_duration_seconds_bucket", method="GET", route="/api/products/{product_id}", le="+Inf"
+    ) == 2
+    # Each product lookup runs one statement
+    assert _sample(body, "db_queries_total", method="GET", route="/api/products/{product_id}") == 2
+    # The scrape itself is in flight
+    assert "http_requests_in_flight 1" in body
+
+def test_metrics_are_merged_across_workers(collector, tmp_path):
+    client.get("/api/categories")
+
+    other = {
+        "buckets": list(metrics_module.LATENCY_BUCKETS),
+        "http_requests_total": [["GET", "/api/categories", "200", 5]],
+        "http_request_duration_seconds": [
+            ["GET", "/api/categories", [5] + [0] * len(metrics_module.LATENCY_BUCKETS) + [0.01]]
+        ],
+        "db_queries_total": [],
+        "db_query_duration_seconds": [],
+        "http_requests_in_flight": 3,
+    }
+    # A worker that has exited: above the kernel's pid limit, so never running
+    with open(tmp_path / f"metrics_{2 ** 22 + 1}_0.json", "w") as snapshot_file:
+        json.dump(other, snapshot_file)
+    # A live worker
+    with open(tmp_path / f"metrics_{os.getppid()}_0.json", "w") as snapshot_file:
+        json.dump({**other, "http_requests_in_flight": 2}, snapshot_file)
+
+    body = client.get("/metrics").text
+    assert _sample(body, "http_requests_total", method="GET", route="/api/categories", status="200") == 11
+    assert _sample(body, "http_request_duration_seconds_count", method="GET", route="/api/categories") == 11
+    # Only this scrape and the live worker's requests are in flight
+    assert "http_requests_in_flight 3" in body
+
+def _worker_snapshot(requests, in_flight=0):
+    return {
+        "buckets": list(metrics_module.LATENCY_BUCKETS),
+        "http_requests_total": [["GET", "/api/categories", "200", requests]],
+        "http_request_duration_seconds": [],
+        "db_queries_total": [],
+        "db_query_duration_seconds": [],
+        "http_requests_in_flight": in_flight,
+    }
+
+def test_exited_workers_are_folded_into_one_snapshot(collector, tmp_path):
+    for pid, requests in ((101, 4), (102, 6)):
+        with open(tmp_path / f"metrics_{pid}_0.json", "w") as snapshot_file:
+            json.dump(_worker_snapshot(requests, in_flight=1), snapshot_file)
+        mark_process_dead(pid, str(tmp_path))
+
+    assert sorted(path.name for path in tmp_path.glob("metrics_*.json")) == ["metrics_dead.json"]
+    body = client.get("/metrics").text
+    assert _sample(body, "http_requests_total", method="GET", route="/api/categories", status="200") == 10
+    assert "http_requests_in_flight 1" in body
+
+def test_stale_snapshot_of_a_reused_pid_is_not_in_flight(collector, tmp_path):
+    # The pid is running again, but as a process that never rewrote the snapshot
+    path = tmp_path / f"metrics_{os.getppid()}_0.json"
+    with open(path, "w") as snapshot_file:
+        json.dump(_worker_snapshot(2, in_flight=4), snapshot_file)
+    written = path.stat().st_mtime - metrics_module.STALE_INTERVALS * collector.flush_interval - 1
+    os.utime(path, (written, written))
+
+    body = client.get("/metrics").text
+    assert _sample(body, "http_requests_total", method="GET", route="/api/categories", status="200") == 2
+    assert "http_requests_in_flight 1" in body
+
+def test_snapshots_are_written_for_other_workers(collector, tmp_path):
+    client.get("/api/categories")
+    collector.write()
+    files = list(tmp_path.glob("metrics_*.json"))
+    assert [path.name.split("_")[1] for path in files] == [str(os.getpid())]
+    snapshot = json.loads(files[0].read_text())
+    assert ["GET", "/api/categories", "200", 1] in snapshot["http_requests_total"]
+
+def test_server_start_clears_old_snapshots(collector, tmp_path):
+    collector.write()
+    (tmp_path / "other.txt").write_text("kept")
+    clear_snapshots(str(tmp_path))
+    assert [path.name for path in tmp_path.iterdir()] == ["other.txt"]
@@ -0,0 +1,67 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, exc, text
+
+from app.main import app
+from app.pool import PoolMetrics, pool_options, pool_stats, register_engine, reset_after_fork
+
+client = TestClient(app)
+
+def test_histogram_buckets_are_cumulative():
+    metrics = PoolMetrics(buckets=(0.01, 0.1))
+    metrics.record_checkout(0.005)
+    metrics.record_checkout(0.05)
+    metrics.record_checkout(3)
+    metrics.record_timeout()
+    snapshot = metrics.snapshot()
+    assert snapshot["checkouts"] == 3
+    assert snapshot["timeouts"] == 1
+    assert snapshot["wait_seconds_histogram"] == {"0.01": 1, "0.1": 2, "+Inf": 3}
+
+def test_pool_counts_checkouts_and_timeouts(monkeypatch):
+    monkeypatch.setattr("app.pool.DB_POOL_SIZE", 1)
+    monkeypatch.setattr("app.pool.DB_MAX_OVERFLOW", 0)
+    monkeypatch.setattr("app.pool.DB_POOL_TIMEOUT", 0.05)
+    monkeypatch.setattr("app.pool._engines", {})
+    url = "sqlite:///./test.db"
+    engine = create_engine(url, **pool_options(url))
+    register_engine("test", engine)
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            stats = pool_stats()["test"]
+            assert stats["checked_out"] == 1
+            assert stats["size"] == 1
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+        
+        stats = client.get("/internal/pool").json()["test"]
+        assert stats["checked_out"] == 0
+        assert stats["checkouts"] == 1
+        assert stats["timeouts"] == 1
+        assert stats["wait_seconds_histogram"]["+Inf"] == 1
+    finally:
+        engine.dispose()
+
+def test_app_engines_are_registered():
+    stats = client.get("/internal/pool").json()
+    assert "primary" in stats
+    assert stats["primary"]["pool_class"] == "InstrumentedAsyncAdaptedQueuePool"
+
+def test_forked_workers_get_fresh_pools(monkeypatch):
+    monkeypatch.setattr("app.pool._engines", {})
+    url = "sqlite:///./test.db"
+    engine = create_engine(url, **pool_options(url))
+    register_engine("test", engine)
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        inherited = engine.pool
+        assert inherited.checkedin() == 1
+        
+        reset_after_fork()
+        assert engine.pool is not inherited
+        assert engine.pool.checkedin() == 0
+        assert pool_stats()["test"]["checkouts"] == 0
+    finally:
+        engine.dispose()
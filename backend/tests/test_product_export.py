@@ -0,0 +1,134 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.product_export as product_export
+from app.auth import create_access_token
+from app.main import app
+from app.models import Product, ProductImage, User
+
+engine = create_engine("sqlite:///./test.db", connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+client = TestClient(app)
+
+@pytest.fixture
+def catalogue(monkeypatch):
+    """Five active products (one with three images), one sold and one deleted."""
+    # Small batches so the export spans several cursor fetches
+    monkeypatch.setattr(product_export, "EXPORT_BATCH_SIZE", 2)
+    db = TestingSessionLocal()
+    seller = User(email="seller@example.com", password_hash="x", name="Seller")
+    db.add(seller)
+    db.flush()
+    for i in range(5):
+        urls = [f"https://example.com/{i}-{n}.jpg" for n in range(3 if i == 0 else 1)]
+        product = Product(seller_id=seller.id, name=f"Product {i}", description="Used, good", price=10 + i,
+                          category="Books", condition="Good", status="active",
+                          primary_image_url=urls[0], image_count=len(urls))
+        product.images = [ProductImage(image_url=url, is_primary=(n == 0)) for n, url in enumerate(urls)]
+        db.add(product)
+    for status in ("sold", "deleted"):
+        db.add(Product(seller_id=seller.id, name=status.title(), description="Gone", price=5,
+                       category="Books", condition="Good", status=status))
+    db.commit()
+    db.close()
+
+def _signed_in():
+    db = TestingSessionLocal()
+    seller_id = db.query(User.id).filter_by(email="seller@example.com").scalar()
+    db.close()
+    return {"Authorization": f"Bearer {create_access_token({'sub': str(seller_id)})}"}
+
+def _ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+def test_export_streams_active_products_as_ndjson(catalogue):
+    response = client.get("/api/products/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "X-Export-Watermark" in response.headers
+    records = _ndjson(response)
+    assert [record["name"] for record in records] == [f"Product {i}" for i in range(5)]
+    assert records[0]["image_urls"] == [f"https://example.com/0-{n}.jpg" for n in range(3)]
+    assert records[1]["image_urls"] == ["https://example.com/1-0.jpg"]
+    assert records[0]["seller_name"] == "Seller"
+    assert records[0]["price"] == 10.0
+
+def test_export_as_csv(catalogue):
+    response = client.get("/api/products/export", params={"format": "csv"})
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 5
+    assert rows[0]["image_urls"] == "|".join(f"https://example.com/0-{n}.jpg" for n in range(3))
+    assert rows[2]["eco_rating"] == ""
+
+def test_incremental_export_includes_status_changes(catalogue):
+    headers = _signed_in()
+    db = TestingSessionLocal()
+    for product in db.query(Product).all():
+        product.updated_at = datetime(2024, 1, 1)
+    db.commit()
+    db.close()
+    response = client.get("/api/products/export", params={"updated_since": "2024-06-01T00:00:00"}, headers=headers)
+    assert _ndjson(response) == []
+
+    db = TestingSessionLocal()
+    db.query(Product).filter_by(name="Product 3").update({"status": "sold", "updated_at": datetime(2024, 7, 1)})
+    db.query(Product).filter_by(name="Product 4").update({"price": 99, "updated_at": datetime(2024, 8, 1)})
+    db.commit()
+    db.close()
+
+    response = client.get("/api/products/export", params={"updated_since": "2024-06-01T02:00:00+02:00"}, headers=headers)
+    sold, changed = _ndjson(response)
+    assert (changed["name"], changed["status"], changed["price"]) == ("Product 4", "active", 99.0)
+    # Sold products leave only a tombstone: who sold what stays private
+    assert sold["status"] == "sold" and sold["updated_at"].startswith("2024-07-01")
+    assert {field for field, value in sold.items() if value} == {"id", "status", "updated_at"}
+
+    watermark = datetime.fromisoformat(response.headers["X-Export-Watermark"])
+    later = client.get("/api/products/export", params={"updated_since": (watermark + timedelta(seconds=1)).isoformat()},
+                       headers=headers)
+    assert _ndjson(later) == []
+
+def test_watermark_trails_the_export_so_late_commits_are_not_missed(catalogue, monkeypatch):
+    monkeypatch.setattr(product_export, "EXPORT_WATERMARK_LAG", 60)
+    db = TestingSessionLocal()
+    for product in db.query(Product).all():
+        product.updated_at = datetime(2024, 1, 1)
+    db.commit()
+    db.close()
+    headers = _signed_in()
+    watermark = datetime.fromisoformat(client.get("/api/products/export", params={"updated_since": "2024-06-01T00:00:00"},
+                                                  headers=headers).headers["X-Export-Watermark"])
+
+    # A write that stamped updated_at just before that export started, but committed after it
+    started = watermark + timedelta(seconds=product_export.EXPORT_WATERMARK_LAG)
+    db = TestingSessionLocal()
+    db.query(Product).filter_by(name="Product 2").update(
+        {"price": 42, "updated_at": started - timedelta(seconds=30)}
+    )
+    db.commit()
+    db.close()
+
+    records = _ndjson(client.get("/api/products/export", params={"updated_since": watermark.isoformat()}, headers=headers))
+    assert [(record["name"], record["price"]) for record in records] == [("Product 2", 42.0)]
+
+def test_incremental_export_requires_sign_in(catalogue):
+    response = client.get("/api/products/export", params={"updated_since": "2024-06-01T00:00:00"})
+    assert response.status_code == 401
+    # The active catalogue stays public
+    assert client.get("/api/products/export").status_code == 200
+
+def test_export_is_gzipped_on_request(catalogue):
+    with client.stream("GET", "/api/products/export", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        body = b"".join(response.iter_raw())
+    assert len(gzip.decompress(body).decode().splitlines()) == 5
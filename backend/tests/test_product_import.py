@@ -0,0 +1,116 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.product_import as product_import
+from app.auth import create_access_token
+from app.main import app
+from app.models import Product, ProductImage, User
+
+engine = create_engine("sqlite:///./test.db", connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+client = TestClient(app)
+
+def _listing(name, **fields):
+    return {
+        "name": name,
+        "description": f"{name} description",
+        "price": 12.5,
+        "category": "Books",
+        "condition": "Good",
+        **fields
+    }
+
+@pytest.fixture
+def seller():
+    """A seller and their auth headers."""
+    db = TestingSessionLocal()
+    user = User(email="seller@example.com", password_hash="x", name="Seller")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+    db.close()
+    return headers
+
+def test_ndjson_import_reports_errors_per_row(seller, monkeypatch):
+    # Small chunks so the file spans several multi-row INSERTs
+    monkeypatch.setattr(product_import, "IMPORT_CHUNK_SIZE", 2)
+    lines = [
+        json.dumps(_listing("Atlas", image_urls=["https://example.com/a1.jpg", "https://example.com/a2.jpg"])),
+        json.dumps(_listing("Bad Category", category="Gadgets")),
+        "",
+        "{not json",
+        json.dumps(_listing("Bad Rating", eco_rating=9)),
+        json.dumps(_listing("Compass", eco_rating=5)),
+        json.dumps(_listing("Free", price=0)),
+        json.dumps({"name": "No Price"}),
+        json.dumps(_listing("Drum")),
+    ]
+    response = client.post(
+        "/api/products/import",
+        content="\n".join(lines).encode(),
+        headers={**seller, "Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 3
+    assert report["failed"] == 5
+    assert [error["row"] for error in report["errors"]] == [2, 4, 5, 7, 8]
+    assert report["errors"][0]["error"].startswith("Invalid category")
+
+    db = TestingSessionLocal()
+    products = {product.name: product for product in db.query(Product).all()}
+    assert set(products) == {"Atlas", "Compass", "Drum"}
+    assert products["Atlas"].primary_image_url == "https://example.com/a1.jpg"
+    assert products["Atlas"].image_count == 2
+    assert db.query(ProductImage).filter_by(product_id=products["Atlas"].id, is_primary=True).count() == 1
+    db.close()
+
+    # Imported listings show up in the feed straight away
+    names = [product["name"] for product in client.get("/api/products").json()["products"]]
+    assert sorted(names) == ["Atlas", "Compass", "Drum"]
+
+def test_csv_import_with_quoted_fields_and_images(seller):
+    body = (
+        "name,description,price,category,condition,eco_rating,image_urls\r\n"
+        'Lamp,"Brass lamp, ""vintage""\nwith shade",25,Home & Garden,Good,,https://example.com/l1.jpg|https://example.com/l2.jpg\r\n'
+        "Kite,Red kite,-3,Toys & Games,New,4,\r\n"
+        "Ball,Football,8,Sports & Outdoors,Used,3,\r\n"
+    )
+    response = client.post("/api/products/import?format=csv", content=body.encode(), headers=seller)
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 2
+    assert report["errors"] == [{"row": 2, "error": "Price must be greater than 0"}]
+
+    db = TestingSessionLocal()
+    lamp = db.query(Product).filter_by(name="Lamp").one()
+    assert lamp.description == 'Brass lamp, "vintage"\nwith shade'
+    assert lamp.eco_rating is None
+    assert lamp.image_count == 2
+    db.close()
+
+def test_overlong_lines_are_rejected_without_buffering(seller, monkeypatch):
+    monkeypatch.setattr(product_import, "IMPORT_MAX_LINE_BYTES", 200)
+    lines = [
+        json.dumps(_listing("Huge", description="x" * 5000)),
+        json.dumps(_listing("Small")),
+    ]
+    response = client.post(
+        "/api/products/import",
+        files={"file": ("listings.ndjson", "\n".join(lines).encode(), "application/x-ndjson")},
+        headers=seller
+    )
+    assert response.json() == {
+        "imported": 1,
+        "failed": 1,
+        "errors": [{"row": 1, "error": "Line is longer than 200 bytes"}],
+    }
+
+def test_import_requires_authentication():
+    response = client.post("/api/products/import", content=b"{}")
+    assert response.status_code == 401
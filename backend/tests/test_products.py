@@ -1,29 +1,32 @@
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.main import app
 from app.database import get_db
-from app.models import Base, User, Product, ProductImage
+from app.models import User, Product, ProductImage
 from app.auth import get_password_hash, create_access_token
+from app.views import view_counter
+from app.image_summary import image_summary_checker
+from datetime import datetime
 
 # Test database setup
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+async def override_get_db():
+    async with AsyncTestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 app.dependency_overrides[get_db] = override_get_db
 
-# Create test database
-Base.metadata.create_all(bind=engine)
-
 client = TestClient(app)
 
 @pytest.fixture
@@ -65,7 +68,9 @@ def test_product(test_user):
         condition="Good",
         eco_rating=4,
         eco_details="Eco-friendly product",
-        status="active"
+        status="active",
+        primary_image_url="https://example.com/image.jpg",
+        image_count=1
     )
     db.add(product)
     db.commit()
@@ -106,6 +111,95 @@ class TestProducts:
         assert data["products"][0]["price"] == 29.99
         assert data["products"][0]["category"] == "Electronics"
 
+    def test_get_products_query_count_is_constant(self, test_user, max_queries):
+        """Test that hydrating a feed page does not issue per-product queries."""
+        db = TestingSessionLocal()
+        for i in range(5):
+            product = Product(
+                seller_id=test_user["user"].id,
+                name=f"Product {i}",
+                description="A test product description",
+                price=10 + i,
+                category="Books",
+                condition="Good",
+                status="active"
+            )
+            product.images = [
+                ProductImage(image_url=f"https://example.com/{i}-a.jpg", is_primary=True),
+                ProductImage(image_url=f"https://example.com/{i}-b.jpg")
+            ]
+            db.add(product)
+        db.commit()
+        db.close()
+        
+        with max_queries(2):
+            response = client.get("/api/products?limit=100")
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["products"]) == 5
+        assert all(len(p["image_urls"]) == 2 for p in data["products"])
+        assert all(p["seller_name"] == "Test User" for p in data["products"])
+        # One query for the page with seller names, one for all of its images
+
+    def test_pagination_is_stable_for_same_timestamp(self, test_user):
+        """Test that products created in the same instant are neither skipped nor repeated."""
+        db = TestingSessionLocal()
+        created_at = datetime(2024, 1, 1, 12, 0, 0)
+        for i in range(5):
+            db.add(Product(
+                seller_id=test_user["user"].id,
+                name=f"Bulk Product {i}",
+                description="Imported in one batch",
+                price=10,
+                category="Books",
+                condition="Good",
+                status="active",
+                created_at=created_at
+            ))
+        db.commit()
+        db.close()
+        
+        for category in [None, "Books"]:
+            seen = []
+            params = {"limit": 2}
+            if category:
+                params["category"] = category
+            while True:
+                response = client.get("/api/products", params=params)
+                assert response.status_code == 200
+                data = response.json()
+                seen.extend(p["id"] for p in data["products"])
+                if not data["has_more"]:
+                    break
+                params["cursor"] = data["next_cursor"]
+            
+            assert len(seen) == 5
+            assert seen == sorted(set(seen), reverse=True)
+
+    def test_get_products_invalid_cursor(self):
+        """Test that a malformed cursor is rejected."""
+        response = client.get("/api/products?cursor=not-a-cursor")
+        assert response.status_code == 400
+
+    def test_feed_is_cached_until_a_product_changes(self, test_user, test_product, max_queries):
+        """Test that repeat feed requests skip the database until a write invalidates them."""
+        assert len(client.get("/api/products").json()["products"]) == 1
+        with max_queries(0):
+            response = client.get("/api/products")
+        assert len(response.json()["products"]) == 1
+        
+        client.put(
+            f"/api/products/{test_product.id}",
+            json={"name": "Renamed Product"},
+            headers=test_user["headers"]
+        )
+        response = client.get("/api/products")
+        assert response.json()["products"][0]["name"] == "Renamed Product"
+        
+        client.delete(f"/api/products/{test_product.id}", headers=test_user["headers"])
+        assert client.get("/api/products").json()["products"] == []
+
     def test_get_products_with_category_filter(self, test_product):
         """Test getting products with category filter."""
         response = client.get("/api/products?category=Electronics")
@@ -130,6 +224,50 @@ class TestProducts:
         data = response.json()
         assert len(data["products"]) == 0
 
+    def test_search_matches_prefixes_across_fields(self, test_product):
+        """Test that search covers description and eco details and matches prefixes."""
+        for query in ["prod", "descript", "eco-friendly", "electron", "test product"]:
+            response = client.get(f"/api/products?q={query}")
+            assert response.status_code == 200
+            assert len(response.json()["products"]) == 1, query
+        
+        response = client.get("/api/products?q=Test&category=Clothing")
+        assert response.status_code == 200
+        assert response.json()["products"] == []
+
+    def test_search_ranks_and_paginates(self, test_user):
+        """Test that search results are ranked by relevance and page without gaps."""
+        db = TestingSessionLocal()
+        names = ["Bamboo toothbrush", "Steel bottle", "Bamboo cutlery", "Wool socks"]
+        for name in names:
+            db.add(Product(
+                seller_id=test_user["user"].id,
+                name=name,
+                description="Made from bamboo" if name == "Steel bottle" else "Plastic free",
+                price=5,
+                category="Home & Garden",
+                condition="New",
+                status="active"
+            ))
+        db.commit()
+        db.close()
+        
+        seen = []
+        cursor = None
+        while True:
+            url = "/api/products?q=bamboo&limit=1" + (f"&cursor={cursor}" if cursor else "")
+            response = client.get(url)
+            assert response.status_code == 200
+            data = response.json()
+            seen.extend(p["name"] for p in data["products"])
+            if not data["has_more"]:
+                break
+            cursor = data["next_cursor"]
+        
+        assert sorted(seen) == ["Bamboo cutlery", "Bamboo toothbrush", "Steel bottle"]
+        # A name match outranks a description-only match
+        assert seen[-1] == "Steel bottle"
+
     def test_get_product_by_id(self, test_product):
         """Test getting a specific product by ID."""
         response = client.get(f"/api/products/{test_product.id}")
@@ -137,6 +275,30 @@ class TestProducts:
         data = response.json()
         assert data["name"] == "Test Product"
         assert data["views"] == 1  # View count should increment
+        
+        # Cached detail responses still count views
+        response = client.get(f"/api/products/{test_product.id}")
+        assert response.json()["views"] == 2
+
+    def test_product_views_are_written_behind(self, test_product):
+        """Test that views are buffered in memory and flushed in one batch."""
+        for _ in range(3):
+            client.get(f"/api/products/{test_product.id}")
+        
+        db = TestingSessionLocal()
+        assert db.get(Product, test_product.id).views == 0
+        
+        async def flush():
+            async with AsyncTestingSessionLocal() as session:
+                return await view_counter.flush(session)
+        
+        assert asyncio.run(flush()) == 3
+        db.expire_all()
+        assert db.get(Product, test_product.id).views == 3
+        db.close()
+        
+        response = client.get(f"/api/products/{test_product.id}")
+        assert response.json()["views"] == 4
 
     def test_get_product_not_found(self):
         """Test getting a non-existent product."""
@@ -166,6 +328,23 @@ class TestProducts:
         assert data["name"] == "New Product"
         assert data["price"] == 49.99
         assert len(data["image_urls"]) == 2
+        assert data["primary_image_url"] == "https://example.com/image1.jpg"
+        assert data["image_count"] == 2
+
+    def test_product_query_budgets(self, test_user, test_product, max_queries):
+        """Test the statement budgets of product detail, creation and a price-only update."""
+        client.get("/api/auth/me", headers=test_user["headers"])
+        product_id = test_product.id
+        with max_queries(2):
+            assert client.get(f"/api/products/{product_id}").status_code == 200
+        # Product and images inserts, then the response's product and images reads
+        with max_queries(4):
+            response = client.post("/api/products", json={
+                "name": "Budget", "description": "Three images", "price": 5, "category": "Books",
+                "condition": "Good", "image_urls": ["https://example.com/1.jpg", "https://example.com/2.jpg", "https://example.com/3.jpg"]
+            }, headers=test_user["headers"])
+        with max_queries(4):
+            client.put(f"/api/products/{response.json()['id']}", json={"price": 7}, headers=test_user["headers"])
 
     def test_create_product_invalid_category(self, test_user):
         """Test creating a product with invalid category."""
@@ -232,6 +411,92 @@ class TestProducts:
         assert data["name"] == "Updated Product"
         assert data["price"] == 39.99
 
+    def test_update_product_images_updates_summary(self, test_user, test_product):
+        """Test that replacing the images keeps the product's image summary in step."""
+        response = client.put(
+            f"/api/products/{test_product.id}",
+            json={"image_urls": ["https://example.com/new.jpg", "https://example.com/new2.jpg"]},
+            headers=test_user["headers"]
+        )
+        assert response.json()["primary_image_url"] == "https://example.com/new.jpg"
+        assert response.json()["image_count"] == 2
+        
+        response = client.put(
+            f"/api/products/{test_product.id}",
+            json={"image_urls": []},
+            headers=test_user["headers"]
+        )
+        assert response.json()["primary_image_url"] is None
+        assert response.json()["image_count"] == 0
+
+    def test_update_product_images_are_diffed(self, test_user, test_product, max_queries):
+        """Test that image updates keep unchanged rows and leave product_images alone when the list is the same."""
+        urls = ["https://example.com/image.jpg", "https://example.com/second.jpg"]
+        client.put(f"/api/products/{test_product.id}", json={"image_urls": urls}, headers=test_user["headers"])
+        db = TestingSessionLocal()
+        ids = {image.image_url: image.id for image in db.query(ProductImage).all()}
+        db.close()
+        
+        with max_queries(5) as capture:
+            client.put(f"/api/products/{test_product.id}", json={"price": 19.99, "image_urls": urls},
+                       headers=test_user["headers"])
+        writes = [statement for statement in capture.statements if not statement.lstrip().upper().startswith("SELECT")]
+        assert not any("product_images" in statement for statement in writes)
+        
+        # Promote the second image and drop the first
+        response = client.put(
+            f"/api/products/{test_product.id}",
+            json={"image_urls": ["https://example.com/second.jpg", "https://example.com/third.jpg"]},
+            headers=test_user["headers"]
+        )
+        assert response.json()["image_urls"] == ["https://example.com/second.jpg", "https://example.com/third.jpg"]
+        db = TestingSessionLocal()
+        images = {image.image_url: image for image in db.query(ProductImage).all()}
+        db.close()
+        assert set(images) == {"https://example.com/second.jpg", "https://example.com/third.jpg"}
+        assert images["https://example.com/second.jpg"].id == ids["https://example.com/second.jpg"]
+        assert images["https://example.com/second.jpg"].is_primary
+        assert not images["https://example.com/third.jpg"].is_primary
+
+    def test_reordered_images_round_trip(self, test_user, test_product):
+        """Test that a PUT which only reorders images, or inserts one in the middle, keeps that order."""
+        urls = ["https://example.com/a.jpg", "https://example.com/b.jpg", "https://example.com/c.jpg"]
+        for image_urls in (
+            urls,
+            [urls[0], urls[2], urls[1]],
+            [urls[0], "https://example.com/new.jpg", urls[2], urls[1]],
+            [urls[1], urls[0]],
+        ):
+            response = client.put(
+                f"/api/products/{test_product.id}",
+                json={"image_urls": image_urls},
+                headers=test_user["headers"]
+            )
+            assert response.json()["image_urls"] == image_urls
+            assert client.get(f"/api/products/{test_product.id}").json()["image_urls"] == image_urls
+
+    def test_image_summary_check_repairs_drift(self, test_user, test_product):
+        """Test that the consistency check fixes products whose summary disagrees with their images."""
+        db = TestingSessionLocal()
+        db.add(ProductImage(product_id=test_product.id, image_url="https://example.com/extra.jpg"))
+        untouched = Product(seller_id=test_user["user"].id, name="Bare", description="No images",
+                            price=5, category="Books", condition="Good", status="active")
+        db.add(untouched)
+        db.commit()
+        db.close()
+        
+        async def check():
+            async with AsyncTestingSessionLocal() as session:
+                return await image_summary_checker.check(session)
+        
+        assert asyncio.run(check()) == 1
+        db = TestingSessionLocal()
+        product = db.get(Product, test_product.id)
+        assert product.image_count == 2
+        assert product.primary_image_url == "https://example.com/image.jpg"
+        db.close()
+        assert asyncio.run(check()) == 0
+
     def test_update_product_unauthorized(self, test_product):
         """Test updating a product without authentication."""
         update_data = {"name": "Updated Product"}
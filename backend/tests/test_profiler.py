@@ -0,0 +1,67 @@
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.models import User
+from app.profiler import QueryProfilerMiddleware, statement_shape
+
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+def _profiled_app(**options):
+    """An app whose endpoints run a known number of statements."""
+    profiled = FastAPI()
+
+    @profiled.get("/loop/{times}")
+    async def loop(times: int):
+        async with AsyncTestingSessionLocal() as db:
+            for user_id in range(times):
+                await db.execute(select(User).where(User.id == user_id))
+            await db.execute(select(User).where(User.id.in_([1, 2, 3])))
+        return {"ok": True}
+
+    profiled.add_middleware(QueryProfilerMiddleware, **options)
+    return profiled
+
+def test_statement_shapes_ignore_parameter_values():
+    assert statement_shape("SELECT * FROM users\n WHERE id IN (?, ?, ?)") == "SELECT * FROM users WHERE id IN (?)"
+    assert statement_shape("SELECT * FROM users WHERE id IN ($1, $2)") == statement_shape("SELECT * FROM users WHERE id IN ($1)")
+    assert statement_shape("SELECT * FROM users WHERE id = %(id_1)s") == "SELECT * FROM users WHERE id = %(id_1)s"
+
+def test_server_timing_reports_query_count():
+    client = TestClient(_profiled_app(server_timing=True))
+    response = client.get("/loop/2")
+    timing = response.headers["server-timing"]
+    assert timing.startswith("db;dur=")
+    assert 'desc="3 queries"' in timing
+    assert "app;dur=" in timing
+
+def test_server_timing_is_off_outside_debug():
+    client = TestClient(_profiled_app(server_timing=False))
+    assert "server-timing" not in client.get("/loop/2").headers
+
+def test_repeated_statements_are_flagged_as_n_plus_one(caplog):
+    client = TestClient(_profiled_app(threshold=4))
+    with caplog.at_level(logging.WARNING, logger="app.profiler"):
+        client.get("/loop/3")
+        assert not caplog.records
+        client.get("/loop/4")
+    assert len(caplog.records) == 1
+    assert "Suspected N+1 on GET /loop/4: 4 runs of SELECT" in caplog.records[0].getMessage()
+
+def test_max_queries_fails_over_budget(max_queries):
+    client = TestClient(_profiled_app())
+    with max_queries(3) as capture:
+        client.get("/loop/2")
+    assert capture.count == 3
+    try:
+        with max_queries(2):
+            client.get("/loop/2")
+    except AssertionError as error:
+        assert "3 queries, budget is 2" in str(error)
+    else:
+        raise AssertionError("max_queries did not enforce its budget")
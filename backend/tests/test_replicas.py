@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.auth import create_access_token, get_password_hash
+from app.cache import response_cache
+from app.database import get_read_db
+from app.main import app
+from app.models import Product, User
+from app.replicas import PRIMARY_COOKIE, ReadRouter, ReplicaSet, RoutingSession
+
+# test.db (reset by conftest) is the primary; a second file stands in for the replica
+primary_engine = create_engine("sqlite:///./test.db", connect_args={"check_same_thread": False})
+replica_engine = create_engine("sqlite:///./test_replica.db", connect_args={"check_same_thread": False})
+PrimarySession = sessionmaker(bind=primary_engine)
+ReplicaSession = sessionmaker(bind=replica_engine)
+
+def _add_product(Session, name):
+    db = Session()
+    seller = User(email="seller@example.com", password_hash=get_password_hash("Password1"), name="Seller")
+    db.add(seller)
+    db.flush()
+    db.add(Product(
+        seller_id=seller.id,
+        name=name,
+        description="Routed read",
+        price=10,
+        category="Books",
+        condition="Good",
+        status="active",
+    ))
+    db.commit()
+    seller_id = seller.id
+    db.close()
+    return seller_id
+
+@pytest.fixture
+def replica_router(migrated_database):
+    migrated_database("./test_replica.db")
+    replicas = ReplicaSet([create_async_engine("sqlite+aiosqlite:///./test_replica.db", poolclass=NullPool)])
+    router = ReadRouter(create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool), replicas)
+    
+    async def override_get_read_db():
+        async with router.session() as db:
+            yield db
+    
+    app.dependency_overrides[get_read_db] = override_get_read_db
+    yield router
+    del app.dependency_overrides[get_read_db]
+    replica_engine.dispose()
+
+def _names(client):
+    # Bypass the response cache so every read reaches a database
+    response_cache.clear()
+    return [p["name"] for p in client.get("/api/products").json()["products"]]
+
+def test_reads_go_to_replica_until_client_writes(replica_router):
+    client = TestClient(app)
+    _add_product(ReplicaSession, "Replica Product")
+    seller_id = _add_product(PrimarySession, "Primary Product")
+    assert _names(client) == ["Replica Product"]
+    
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(seller_id)})}"}
+    response = client.post("/api/products", json={
+        "name": "New Product",
+        "description": "Just written",
+        "price": 12,
+        "category": "Books",
+        "condition": "Good",
+    }, headers=headers)
+    assert response.status_code == 200
+    assert PRIMARY_COOKIE in response.cookies
+    
+    # The writer reads its own write from the primary...
+    assert _names(client) == ["New Product", "Primary Product"]
+    # ...while other clients keep reading the replica
+    assert _names(TestClient(app)) == ["Replica Product"]
+
+def test_token_clients_without_cookies_read_their_writes(replica_router):
+    _add_product(ReplicaSession, "Replica Product")
+    seller_id = _add_product(PrimarySession, "Primary Product")
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(seller_id)})}"}
+    
+    # Like the SPA: a bearer token on every request, and the cookie never comes back
+    response = TestClient(app).post("/api/products", json={
+        "name": "New Product",
+        "description": "Just written",
+        "price": 12,
+        "category": "Books",
+        "condition": "Good",
+    }, headers=headers)
+    assert response.status_code == 200
+    
+    response_cache.clear()
+    reader = TestClient(app)
+    names = [p["name"] for p in reader.get("/api/products", headers=headers).json()["products"]]
+    assert names == ["New Product", "Primary Product"]
+    # Another user's token, or none, still reads the replica
+    response_cache.clear()
+    assert [p["name"] for p in reader.get("/api/products").json()["products"]] == ["Replica Product"]
+
+def test_replica_reads_never_reach_the_response_cache(replica_router):
+    writer = TestClient(app)
+    other = TestClient(app)
+    _add_product(ReplicaSession, "Replica Product")
+    seller_id = _add_product(PrimarySession, "Primary Product")
+    
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(seller_id)})}"}
+    assert writer.post("/api/products", json={
+        "name": "New Product",
+        "description": "Just written",
+        "price": 12,
+        "category": "Books",
+        "condition": "Good",
+    }, headers=headers).status_code == 200
+    
+    # Another client reads the lagging replica after the write bumped the feed's tags...
+    assert [p["name"] for p in other.get("/api/products").json()["products"]] == ["Replica Product"]
+    # ...which must not be what the writer (or anyone) gets from the cache next
+    assert [p["name"] for p in writer.get("/api/products").json()["products"]] == ["New Product", "Primary Product"]
+    
+    # Primary reads are still cached
+    replica_router.replicas.mark(0, healthy=False)
+    other.get("/api/products")
+    replica_router.replicas.mark(0, healthy=True)
+    assert [p["name"] for p in other.get("/api/products").json()["products"]] == ["New Product", "Primary Product"]
+
+def test_unhealthy_replica_falls_back_to_primary(replica_router):
+    client = TestClient(app)
+    _add_product(ReplicaSession, "Replica Product")
+    _add_product(PrimarySession, "Primary Product")
+    
+    replica_router.replicas.mark(0, healthy=False)
+    assert _names(client) == ["Primary Product"]
+    
+    asyncio.run(replica_router.replicas.check())
+    assert replica_router.replicas.status() == [True]
+    assert _names(client) == ["Replica Product"]
+
+def test_routing_session_sends_writes_to_primary():
+    session = RoutingSession(primary=primary_engine, replica=replica_engine)
+    assert session.get_bind(clause=select(Product)) is replica_engine
+    assert session.get_bind(clause=select(Product).with_for_update()) is primary_engine
+    assert session.get_bind(clause=update(Product).values(views=1)) is primary_engine
+    # Once the session has written, its reads stay on the primary too
+    assert session.get_bind(clause=select(Product)) is primary_engine
+    session.close()